@@ -2,8 +2,11 @@ from pathlib import Path
 import json
 from utils.processing import save_to_png, stream_response
 from utils.agent import build_agent
+from utils.llm import LLMModel
+from utils.embedding import EmbeddingModel
+from utils.metrics import build_metrics
 from dotenv import load_dotenv
-from langchain_core.chat_history import InMemoryChatMessageHistory
+from utils.history import build_chat_history
 import time
 import asyncio
 
@@ -24,12 +27,15 @@ async def main():
     with open("./config/prompts.json") as f:
         prompts = json.load(f)
 
-    # Create a In memory chat history
-    chat_history = InMemoryChatMessageHistory()
+    # Create a In memory chat history (the last turns and a rolling summary of the older ones, see the "chat_history" section of the configuration)
+    chat_history = build_chat_history(app_config, prompts)
     
+    # Measure every node and tool call (see the "metrics" section of the configuration)
+    metrics = build_metrics(app_config.get("metrics", {}))
+
     # Compile the graph to an agent
     start = time.time()
-    agent = await build_agent(app_config, prompts)
+    agent = await build_agent(app_config, prompts, metrics)
     end = time.time()
     print(f"Agent compiled in {(end - start):.2f}s")
 
@@ -37,6 +43,13 @@ async def main():
     verbosity = app_config.get("verbosity", 0)
     save_to_png_flag = app_config.get("save_to_png", False)
     image_name = app_config.get("image_name", "graph.png")
+    stream_tokens = app_config.get("stream_tokens", False)
+
+    if verbosity >= 2:
+        # The models are loaded once and shared by all the nodes and tools
+        for model in LLMModel.stats() + EmbeddingModel.stats():
+            name = model.get("llm_model") or model.get("embedding_model")
+            print(f"{model['kind']} {name} loaded in {model['load_time_s']:.2f}s, shared by {model['requests']} components")
 
     # create a png representation of the agent/graph
     if save_to_png_flag:
@@ -44,12 +57,19 @@ async def main():
 
     user_query = input("Enter: ")
     while user_query.lower() not in ["exit", "quit"]:
-        history = "\n".join(msg.content for msg in chat_history.messages)
-        chat_history.add_user_message(user_query)
-        answer = await stream_response(agent, user_query, history, verbosity)
-        chat_history.add_ai_message(answer)
-        print(f"\n{'-'*36} Answer {'-'*36}\n{answer}")
+        history = chat_history.history()
+        answer = await stream_response(agent, user_query, history, verbosity, stream_tokens)
+        chat_history.add_turn(user_query, answer)
+        # When streamed, the answer is printed while it is generated
+        if not stream_tokens:
+            print(f"\n{'-'*36} Answer {'-'*36}\n{answer}")
+        # The turns leaving the window are summarized after the answer is shown
+        await chat_history.acompact()
         user_query = input("Enter: ")
 
+    if metrics is not None:
+        metrics.print_summary()
+        metrics.close()
+
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
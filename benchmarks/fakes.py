@@ -0,0 +1,134 @@
+"""
+Deterministic fake models for the offline benchmarks, registered as the "fake" LLM and Embedding providers
+"""
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.callbacks import CallbackManagerForLLMRun, AsyncCallbackManagerForLLMRun
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatResult, ChatGeneration, ChatGenerationChunk
+from utils.llm import LLMModel
+from utils.embedding import EmbeddingModel
+from typing import Dict, Any, List, Union, AsyncIterator
+import asyncio
+import json
+import zlib
+import time
+
+# The ids of the fake tool calls, counted in the prompts to know how many retrieval rounds were done
+TOOL_CALL_PREFIX = "fake-call-"
+
+
+def _prompt_prefixes(prompts: Dict[str, Union[str, Dict[str, str]]]) -> List[tuple]:
+    """
+    Parameters:
+        prompts (Dict[str, Union[str, Dict[str, str]]]): the prompts of the agent (config/prompts.json)
+
+    Returns:
+        List[tuple]: the (literal prefix, prompt name) pairs, the longest prefixes first
+    """
+    prefixes = []
+    for name, value in prompts.items():
+        # The query transformation has a prompt for each strategy
+        templates = value.values() if isinstance(value, dict) else [value]
+        for template in templates:
+            prefix = template.split("{")[0].strip()
+            if prefix:
+                prefixes.append((prefix, name))
+    return sorted(prefixes, key=lambda item: len(item[0]), reverse=True)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    A chat model answering each prompt of the agent with a deterministic response,
+    after a simulated latency. The prompt is recognized by the literal text preceding its first variable
+    """
+    prompts: Dict[str, Any] = {}
+    # prompt name -> response, "default" is used for the prompts without a response
+    responses: Dict[str, str] = {}
+    # simulated latency of each call, in seconds (latency_per_prompt overrides it for some prompts)
+    latency_s: float = 0.0
+    latency_per_prompt: Dict[str, float] = {}
+    # the number of tool calls before answering
+    retrieval_rounds: int = 1
+    # the tools bound by the tool routing node
+    tool_names: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def bind_tools(self, tools: List[Any], **kwargs: Any) -> "FakeChatModel":
+        return self.model_copy(update={"tool_names": [getattr(tool, "name", str(tool)) for tool in tools]})
+
+    def _prompt_name(self, text: str) -> Union[str, None]:
+        for prefix, name in _prompt_prefixes(self.prompts):
+            if text.startswith(prefix):
+                return name
+        return None
+
+    def _reply(self, name: Union[str, None], text: str) -> AIMessage:
+        rounds = text.count(TOOL_CALL_PREFIX)
+        if name == "tool_calling" and self.tool_names:
+            retrievers = [tool for tool in self.tool_names if tool.endswith("retriever")] or self.tool_names
+            query = text.rsplit("Query:", 1)[-1].strip()
+            return AIMessage("", tool_calls=[{
+                "name": retrievers[rounds % len(retrievers)],
+                "args": {"query": query},
+                "id": f"{TOOL_CALL_PREFIX}{rounds}-{zlib.crc32(text.encode('utf-8'))}"
+            }])
+        if name == "retrieve_respond":
+            return AIMessage("retrieve" if rounds < self.retrieval_rounds else "respond")
+        if name == "reranking" and "reranking" not in self.responses:
+            # A different score for each chunk, so the selection strategies keep only some of them
+            return AIMessage(f"{(zlib.crc32(text.encode('utf-8')) % 1000) / 1000:.3f}")
+        return AIMessage(self.responses.get(name, self.responses.get("default", "fake response")))
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        text = "\n".join(str(message.content) for message in messages)
+        message = self._reply(self._prompt_name(text), text)
+        # Word counts as token counts, so the metrics report the size of the prompts
+        input_tokens, output_tokens = len(text.split()), len(str(message.content).split())
+        message.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _latency(self, messages: List[BaseMessage]) -> float:
+        name = self._prompt_name("\n".join(str(message.content) for message in messages))
+        return self.latency_per_prompt.get(name, self.latency_s)
+
+    def _generate(self, messages: List[BaseMessage], stop: Union[List[str], None] = None, run_manager: Union[CallbackManagerForLLMRun, None] = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self._latency(messages))
+        return self._result(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Union[List[str], None] = None, run_manager: Union[AsyncCallbackManagerForLLMRun, None] = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self._latency(messages))
+        return self._result(messages)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Union[List[str], None] = None, run_manager: Union[AsyncCallbackManagerForLLMRun, None] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        # Used when the agent streams the tokens: the response is streamed word by word, the latency is spread over the words
+        message = self._result(messages).generations[0].message
+        if message.tool_calls:
+            await asyncio.sleep(self._latency(messages))
+            tool_call_chunks = [{"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i} for i, call in enumerate(message.tool_calls)]
+            yield ChatGenerationChunk(message=AIMessageChunk("", tool_call_chunks=tool_call_chunks, usage_metadata=message.usage_metadata))
+            return
+        words = str(message.content).split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(self._latency(messages) / len(words))
+            last = i == len(words) - 1
+            chunk = ChatGenerationChunk(message=AIMessageChunk(word if last else f"{word} ", usage_metadata=message.usage_metadata if last else None))
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+def register_fake_providers(prompts: Dict[str, Union[str, Dict[str, str]]], llm_options: Dict[str, Any], embedding_size: int = 384) -> None:
+    """
+    Register the "fake" LLM and Embedding providers
+
+    Parameters:
+        prompts (Dict[str, Union[str, Dict[str, str]]]): the prompts of the agent, used to recognize the calls of each node
+        llm_options (Dict[str, Any]): the FakeChatModel fields (responses, latency_s, latency_per_prompt, retrieval_rounds)
+        embedding_size (int): the size of the fake embeddings
+    """
+    LLMModel.register_provider("fake", lambda config: FakeChatModel(prompts=prompts, **llm_options))
+    EmbeddingModel.register_provider("fake", lambda config: DeterministicFakeEmbedding(size=embedding_size))
@@ -0,0 +1,228 @@
+"""
+Offline end-to-end benchmark of the agent: builds the real graph (build_agent) with deterministic fake models
+(see benchmarks/fakes.py), indexes the documents in a temporary store and runs a fixed query set through
+every configuration combination of the benchmark matrix (see benchmarks/graph_benchmark.json).
+No LLM server, MCP server or network access is needed.
+
+Usage (from the repository root):
+    python -m benchmarks.graph_benchmark [--config benchmarks/graph_benchmark.json] [--runs 3] [--nodes] [--output results.json]
+"""
+from benchmarks.fakes import register_fake_providers
+from indexing.ingestion import ingest
+from utils.agent import build_agent
+from utils.embedding import EmbeddingModel
+from utils.metrics import MetricsCollector
+from utils.state import AgentState
+from langchain_core.messages import HumanMessage
+from itertools import product
+from pathlib import Path
+from typing import Dict, Any, List
+import numpy as np
+import argparse
+import tempfile
+import tracemalloc
+import asyncio
+import shutil
+import copy
+import json
+import time
+import os
+
+
+def merge_config(base: Dict[str, Any], overrides: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Parameters:
+        base (Dict[str, Any]): a configuration
+        overrides (Dict[str, Any]): the values to replace, the nested dictionaries are merged
+
+    Returns:
+        Dict[str, Any]: a copy of the configuration with the overrides applied
+    """
+    merged = copy.deepcopy(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and value and isinstance(merged.get(key), dict):
+            merged[key] = merge_config(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def combinations(matrix: Dict[str, List[Dict[str, Any]]], advanced_only: List[str]) -> List[Dict[str, Any]]:
+    """
+    Parameters:
+        matrix (Dict[str, List[Dict[str, Any]]]): for each dimension, its options (name and configuration overrides)
+        advanced_only (List[str]): the dimensions used only by the advanced RAG, they are dropped from the simple RAG combinations
+
+    Returns:
+        List[Dict[str, Any]]: the distinct combinations, each with its name and configuration overrides
+    """
+    result = {}
+    dimensions = list(matrix)
+    for options in product(*(matrix[dimension] for dimension in dimensions)):
+        selected = dict(zip(dimensions, options))
+        if not selected.get("rag", {}).get("config", {}).get("advanced_rag", True):
+            selected = {dimension: option for dimension, option in selected.items() if dimension not in advanced_only}
+        name = ",".join(f"{dimension}={option['name']}" for dimension, option in selected.items())
+        overrides = {}
+        for option in selected.values():
+            overrides = merge_config(overrides, option["config"])
+        result[name] = {"name": name, "config": overrides}
+    return list(result.values())
+
+
+def build_store(benchmark: Dict[str, Any], populate_config: Dict[str, Any], store_dir: str) -> None:
+    """
+    Index the benchmark documents with the benchmark embedding model
+
+    Parameters:
+        benchmark (Dict[str, Any]): the benchmark configuration
+        populate_config (Dict[str, Any]): the populate configuration, its chunking and index options are used
+        store_dir (str): the directory of the temporary store
+    """
+    config = merge_config(populate_config, {
+        "data_dir_path": benchmark["data_dir_path"],
+        "save_dir_path": store_dir,
+        "embedding": benchmark["embedding"],
+        "ingestion": {"parallel": False, "incremental": False}
+    })
+    file_paths = [entry.path for entry in os.scandir(config["data_dir_path"]) if entry.is_file()]
+    report = ingest(file_paths, config, EmbeddingModel(config["embedding"]).get())
+    report.print_summary()
+
+
+def app_config_for(base: Dict[str, Any], benchmark: Dict[str, Any], combination: Dict[str, Any], store_dir: str) -> Dict[str, Any]:
+    """
+    Parameters:
+        base (Dict[str, Any]): the application configuration (config/app_config.json)
+        benchmark (Dict[str, Any]): the benchmark configuration
+        combination (Dict[str, Any]): the combination to benchmark
+        store_dir (str): the directory of the temporary store
+
+    Returns:
+        Dict[str, Any]: the application configuration using the fake models, the temporary store and the combination options
+    """
+    fake_llm = {"llm_provider": "fake", "llm_model": "fake", "llm_host": "", "temperature": 0}
+    config = merge_config(base, benchmark.get("app_config", {}))
+    config = merge_config(config, {
+        "db_dir_path": store_dir,
+        "vector_db": "faiss",
+        "llm": fake_llm,
+        "embedding": benchmark["embedding"],
+        "reranking_strategies_options": {"semantic": fake_llm, "distance": benchmark["embedding"]}
+    })
+    return merge_config(config, combination["config"])
+
+
+async def run_combination(app_config: Dict[str, Any], prompts: Dict[str, Any], queries: List[str], runs: int, warmup: int) -> Dict[str, Any]:
+    """
+    Parameters:
+        app_config (Dict[str, Any]): the application configuration of the combination
+        prompts (Dict[str, Any]): the prompts of the agent
+        queries (List[str]): the query set
+        runs (int): the number of measured passes over the query set
+        warmup (int): the number of passes over the query set before measuring
+
+    Returns:
+        Dict[str, Any]: the end-to-end latencies, the LLM calls, the allocations and the per-node summary
+    """
+    metrics = MetricsCollector()
+    agent = await build_agent(app_config, prompts, metrics)
+
+    async def ask(query: str) -> None:
+        await agent.ainvoke(AgentState.create(messages=[HumanMessage(query)], question=query, history=""))
+
+    for _ in range(warmup):
+        for query in queries:
+            await ask(query)
+    # The warmup calls are not part of the results
+    metrics.clear()
+
+    latencies = []
+    for _ in range(runs):
+        for query in queries:
+            start = time.perf_counter()
+            await ask(query)
+            latencies.append(time.perf_counter() - start)
+
+    nodes = metrics.summary()
+
+    # Separate pass, tracing the allocations slows down the queries
+    peaks, retained = [], []
+    tracemalloc.start()
+    try:
+        for query in queries:
+            tracemalloc.clear_traces()
+            tracemalloc.reset_peak()
+            await ask(query)
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak)
+            retained.append(current)
+    finally:
+        tracemalloc.stop()
+
+    n_queries = len(latencies)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "queries": n_queries,
+        "p50_s": float(p50),
+        "p95_s": float(p95),
+        "p99_s": float(p99),
+        "mean_s": float(np.mean(latencies)),
+        "llm_calls_per_query": sum(node["llm_calls"] for node in nodes.values()) / n_queries,
+        "tokens_per_query": sum(node["prompt_tokens"] + node["completion_tokens"] for node in nodes.values()) / n_queries,
+        "peak_alloc_kb": float(np.median(peaks)) / 1024,
+        "retained_alloc_kb": float(np.median(retained)) / 1024,
+        "nodes": nodes
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the agent graph")
+    parser.add_argument("--config", type=str, default="./benchmarks/graph_benchmark.json", help="the benchmark configuration")
+    parser.add_argument("--runs", type=int, default=None, help="number of measured passes over the query set (overrides the configuration)")
+    parser.add_argument("--nodes", action="store_true", help="print the per-node latencies of each combination")
+    parser.add_argument("--output", type=str, default=None, help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    for path in [args.config, "./config/app_config.json", "./config/prompts.json", "./config/populate_config.json"]:
+        if not Path(path).exists():
+            raise FileNotFoundError(f"{path} not Found")
+
+    with open(args.config) as f:
+        benchmark = json.load(f)
+    with open("./config/app_config.json") as f:
+        base_app_config = json.load(f)
+    with open("./config/prompts.json") as f:
+        prompts = json.load(f)
+    with open("./config/populate_config.json") as f:
+        populate_config = json.load(f)
+
+    register_fake_providers(prompts, benchmark.get("fake_llm", {}), benchmark["embedding"].get("embedding_size", 384))
+    runs = args.runs or benchmark.get("runs", 3)
+
+    store_dir = tempfile.mkdtemp(prefix="graph_benchmark_")
+    results = []
+    try:
+        build_store(benchmark, populate_config, store_dir)
+        for combination in combinations(benchmark["matrix"], benchmark.get("advanced_only", [])):
+            app_config = app_config_for(base_app_config, benchmark, combination, store_dir)
+            result = await run_combination(app_config, prompts, benchmark["queries"], runs, benchmark.get("warmup", 1))
+            results.append({"combination": combination["name"], **result})
+            print(f"{combination['name']}: p50 {result['p50_s']:.3f}s, {result['llm_calls_per_query']:.1f} LLM calls/query", flush=True)
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+    print(f"\n{'combination':<90}{'p50':>9}{'p95':>9}{'llm':>7}{'tokens':>9}{'peak KB':>10}")
+    for result in results:
+        print(f"{result['combination']:<90}{result['p50_s']:>8.3f}s{result['p95_s']:>8.3f}s{result['llm_calls_per_query']:>7.1f}{result['tokens_per_query']:>9.0f}{result['peak_alloc_kb']:>10.0f}")
+        if args.nodes:
+            for name, node in sorted(result["nodes"].items(), key=lambda item: item[1]["p50_s"], reverse=True):
+                print(f"    {name:<86}{node['p50_s']:>8.3f}s{node['p95_s']:>8.3f}s{node['llm_calls'] / result['queries']:>7.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"timestamp": time.time(), "runs": runs, "results": results}, f, indent=4)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+"""
+Cold-start benchmark of the entry points: imports app.py and populate.py in fresh interpreters
+with `python -X importtime` and reports the total import time and the slowest packages.
+
+Usage (from the repository root):
+    python benchmarks/importtime.py [--runs 5] [--top 10] [--output importtime.jsonl]
+"""
+from pathlib import Path
+from typing import Dict, Any, List, Tuple
+import argparse
+import statistics
+import subprocess
+import sys
+import json
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+ENTRY_POINTS = ["app", "populate"]
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """
+    Parameters:
+        stderr (str): the standard error of a `python -X importtime` run
+
+    Returns:
+        List[Tuple[str, int, int, int]]: for each imported module, its name, its self and cumulative time in us and its nesting level
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            # The header line
+            continue
+        level = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(self_us), int(cumulative_us), level))
+    return modules
+
+
+def measure(module: str) -> Dict[str, Any]:
+    """
+    Import a module in a fresh interpreter
+
+    Parameters:
+        module (str): the module to import, from the repository root
+
+    Returns:
+        Dict[str, Any]: the wall time of the interpreter, the import time of the module and the imported modules
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    wall_time = time.perf_counter() - start
+    if result.returncode != 0:
+        raise Exception(f"import {module} failed:\n{result.stderr.splitlines()[-1]}")
+    modules = parse_importtime(result.stderr)
+    import_us = next(cumulative for name, _, cumulative, level in modules if name == module and level == 0)
+    return {"wall_time_s": wall_time, "import_time_s": import_us / 1e6, "modules": modules}
+
+
+def top_packages(modules: List[Tuple[str, int, int, int]], top: int) -> List[Tuple[str, float]]:
+    """
+    Parameters:
+        modules (List[Tuple[str, int, int, int]]): the imported modules, as returned by parse_importtime
+        top (int): the number of packages to return
+
+    Returns:
+        List[Tuple[str, float]]: the top-level packages with the highest total self time, in seconds
+    """
+    packages: Dict[str, int] = {}
+    for name, self_us, _, _ in modules:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+    ranking = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [(package, self_us / 1e6) for package, self_us in ranking]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start import time of the entry points")
+    parser.add_argument("--runs", type=int, default=5, help="number of fresh interpreters for each entry point")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest packages to show")
+    parser.add_argument("--output", type=str, default=None, help="JSONL file the results are appended to, to track them over time")
+    args = parser.parse_args()
+
+    results = []
+    for module in ENTRY_POINTS:
+        # The first run warms up the bytecode and OS file caches, it is not measured
+        measure(module)
+        runs = [measure(module) for _ in range(args.runs)]
+        result = {
+            "entry_point": f"{module}.py",
+            "runs": args.runs,
+            "import_time_s": statistics.median(run["import_time_s"] for run in runs),
+            "wall_time_s": statistics.median(run["wall_time_s"] for run in runs),
+            "modules": len(runs[-1]["modules"]),
+            "top_packages": top_packages(runs[-1]["modules"], args.top)
+        }
+        results.append(result)
+
+        print(f"{'-'*30} {result['entry_point']} {'-'*30}")
+        print(f"import time (median of {args.runs}): {result['import_time_s']:.3f}s")
+        print(f"interpreter wall time (median of {args.runs}): {result['wall_time_s']:.3f}s")
+        print(f"imported modules: {result['modules']}")
+        for package, self_time in result["top_packages"]:
+            print(f"  {package:<40} {self_time:.3f}s")
+
+    if args.output:
+        with open(args.output, "a") as f:
+            for result in results:
+                f.write(json.dumps({"timestamp": time.time(), "python": sys.version.split()[0], **result}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
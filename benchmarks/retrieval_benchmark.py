@@ -0,0 +1,213 @@
+"""
+Retrieval quality vs latency benchmark: indexes the documents under each variant of benchmarks/retrieval_benchmark.json
+(chunking strategy, FAISS index type, reranking and selection) and runs the labeled question set of benchmarks/data.
+A retrieved chunk is relevant when it comes from the labeled source file and contains one of the labeled evidence passages,
+so the labels do not depend on the chunking.
+
+Reports, for each variant: recall@k, MRR, index build time, index size on disk and query latency.
+
+Usage (from the repository root):
+    python -m benchmarks.retrieval_benchmark [--config benchmarks/retrieval_benchmark.json] [--variants name1,name2] [--fake-embeddings] [--output results.json]
+"""
+from benchmarks.fakes import register_fake_providers
+from benchmarks.graph_benchmark import merge_config
+from indexing.ingestion import ingest
+from indexing.vectorstore import VectorStore
+from nodes.reranking import Reranking
+from nodes.selection import ChunckSelection
+from tools.retrieval import _to_artifact
+from utils.embedding import EmbeddingModel
+from utils.state import AgentState, Chunk
+from pathlib import Path
+from typing import Dict, Any, List, Union
+import numpy as np
+import argparse
+import tempfile
+import asyncio
+import shutil
+import json
+import time
+import os
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+def _dir_size_mb(path: Path) -> float:
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file()) / (1024 * 1024)
+
+
+def evaluate_ranking(chunks: List[Chunk], question: Dict[str, Any], ks: List[int]) -> Dict[str, float]:
+    """
+    Parameters:
+        chunks (List[Chunk]): the ranked chunks returned for the question
+        question (Dict[str, Any]): the labeled question (source file and evidence passages)
+        ks (List[int]): the cut-offs of the recall
+
+    Returns:
+        Dict[str, float]: recall@k for each k (the fraction of the evidence passages found in the first k chunks) and the reciprocal rank
+    """
+    evidence = [_normalize(passage) for passage in question["evidence"]]
+    # for each chunk, the evidence passages it contains (none if it comes from another file)
+    found = []
+    for chunk in chunks:
+        if Path(chunk["source"] or "").name != question["source"]:
+            found.append(set())
+            continue
+        content = _normalize(chunk["content"])
+        found.append({i for i, passage in enumerate(evidence) if passage in content})
+
+    metrics = {}
+    for k in ks:
+        covered = set().union(*found[:k]) if found[:k] else set()
+        metrics[f"recall@{k}"] = len(covered) / len(evidence)
+    first = next((rank for rank, passages in enumerate(found, start=1) if passages), None)
+    metrics["rr"] = 1 / first if first else 0.0
+    return metrics
+
+
+def build_index(populate_config: Dict[str, Any], store_dir: Path) -> Dict[str, float]:
+    """
+    Index the documents in a single (shared layout) store
+
+    Parameters:
+        populate_config (Dict[str, Any]): the populate configuration of the variant
+        store_dir (Path): the directory of the store
+
+    Returns:
+        Dict[str, float]: the build time and the size of the store on disk
+    """
+    config = merge_config(populate_config, {
+        "save_dir_path": str(store_dir),
+        "store_layout": "shared",
+        "ingestion": {"parallel": False, "incremental": False, "streaming": {"enabled": False}},
+        "faiss_index": {"evaluate": {"enabled": False}}
+    })
+    file_paths = [entry.path for entry in os.scandir(config["data_dir_path"]) if entry.is_file()]
+    embedding_model = EmbeddingModel(config["embedding"]).get()
+    start = time.perf_counter()
+    report = ingest(file_paths, config, embedding_model)
+    build_time = time.perf_counter() - start
+    if report.failures:
+        raise Exception(f"indexing failed: {report.failures}")
+    return {"build_time_s": build_time, "index_size_mb": _dir_size_mb(store_dir)}
+
+
+async def run_questions(vector_store: VectorStore, questions: List[Dict[str, Any]], search_k: int, ks: List[int], pipeline: Union[tuple, None]) -> Dict[str, Any]:
+    """
+    Parameters:
+        vector_store (VectorStore): the loaded store of the variant
+        questions (List[Dict[str, Any]]): the labeled questions
+        search_k (int): the number of chunks retrieved for each question
+        ks (List[int]): the cut-offs of the recall
+        pipeline (Union[tuple, None]): the reranking and selection nodes applied to the retrieved chunks, None to rank by store score
+
+    Returns:
+        Dict[str, Any]: the mean recall@k and MRR, and the query latency percentiles
+    """
+    per_question, latencies = [], []
+    for question in questions:
+        start = time.perf_counter()
+        results = vector_store.search_with_vectors(question["question"], search_k)
+        _, artifact = _to_artifact(results)
+        chunks = [Chunk(**item, rank=rank) for rank, item in enumerate(artifact)]
+        if pipeline is not None:
+            reranking, selection = pipeline
+            state = AgentState.create(question=question["question"])
+            state["chunks"] = chunks
+            state = await reranking.arerank(state)
+            chunks = selection.select(state)["chunks"]
+        latencies.append(time.perf_counter() - start)
+        per_question.append(evaluate_ranking(chunks, question, ks))
+
+    p50, p95 = np.percentile(latencies, [50, 95])
+    metrics = {name: float(np.mean([result[name] for result in per_question])) for name in per_question[0] if name != "rr"}
+    metrics["mrr"] = float(np.mean([result["rr"] for result in per_question]))
+    return {**metrics, "query_p50_ms": float(p50) * 1000, "query_p95_ms": float(p95) * 1000}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Retrieval quality vs latency benchmark over the bundled documents")
+    parser.add_argument("--config", type=str, default="./benchmarks/retrieval_benchmark.json", help="the benchmark configuration")
+    parser.add_argument("--variants", type=str, default=None, help="comma separated names of the variants to run (all if missing)")
+    parser.add_argument("--fake-embeddings", action="store_true", help="use deterministic fake embeddings (offline smoke test, the quality metrics are meaningless)")
+    parser.add_argument("--output", type=str, default=None, help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    for path in [args.config, "./config/populate_config.json", "./config/prompts.json"]:
+        if not Path(path).exists():
+            raise FileNotFoundError(f"{path} not Found")
+
+    with open(args.config) as f:
+        benchmark = json.load(f)
+    with open("./config/populate_config.json") as f:
+        base_populate_config = json.load(f)
+    with open("./config/prompts.json") as f:
+        prompts = json.load(f)
+    with open(benchmark["questions_path"]) as f:
+        questions = json.load(f)
+
+    embedding = benchmark.get("embedding") or base_populate_config["embedding"]
+    if args.fake_embeddings:
+        register_fake_providers(prompts, {})
+        embedding = {"embedding_provider": "fake", "embedding_model": "fake", "embedding_host": ""}
+
+    variants = benchmark["variants"]
+    if args.variants:
+        names = args.variants.split(",")
+        variants = [variant for variant in variants if variant["name"] in names]
+
+    ks = benchmark.get("ks", [1, 3, 5, 10])
+    search_k = benchmark.get("search_k", max(ks))
+    work_dir = Path(tempfile.mkdtemp(prefix="retrieval_benchmark_"))
+    # the variants with the same populate options share the same store (e.g. the reranking/selection variants)
+    stores: Dict[str, tuple] = {}
+    results = []
+    try:
+        for variant in variants:
+            populate_config = merge_config(base_populate_config, {"data_dir_path": benchmark["data_dir_path"], "embedding": embedding})
+            populate_config = merge_config(populate_config, variant.get("populate", {}))
+            store_key = json.dumps(populate_config, sort_keys=True)
+            if store_key not in stores:
+                store_dir = work_dir.joinpath(str(len(stores)))
+                build = build_index(populate_config, store_dir)
+                vector_store = VectorStore(populate_config["vector_store_type"], EmbeddingModel(embedding).get(), store_dir.absolute(), populate_config.get("faiss_index", {}))
+                if populate_config["vector_store_type"] == "faiss":
+                    vector_store.load()
+                    vector_store.set_search_params(benchmark.get("search_params", {}))
+                stores[store_key] = (vector_store, build)
+            vector_store, build = stores[store_key]
+
+            pipeline = None
+            if variant.get("pipeline"):
+                options = variant["pipeline"]
+                reranking_options = dict(options.get("reranking_strategies_options", {}))
+                if "distance" in reranking_options:
+                    reranking_options["distance"] = {**embedding, **reranking_options["distance"]}
+                pipeline = (
+                    Reranking(options["reranking_strategies"], options["reranking_weights"], reranking_options, prompts),
+                    ChunckSelection(options["selection_strategies"], options["selection_options"])
+                )
+
+            result = await run_questions(vector_store, questions, search_k, ks, pipeline)
+            results.append({"variant": variant["name"], **build, **result})
+            print(f"{variant['name']}: MRR {result['mrr']:.3f}, build {build['build_time_s']:.1f}s", flush=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    recall_columns = [f"recall@{k}" for k in ks]
+    print(f"\n{'variant':<42}" + "".join(f"{column:>11}" for column in recall_columns) + f"{'MRR':>7}{'build':>9}{'size MB':>9}{'p50 ms':>9}{'p95 ms':>9}")
+    for result in results:
+        print(
+            f"{result['variant']:<42}" + "".join(f"{result[column]:>11.3f}" for column in recall_columns)
+            + f"{result['mrr']:>7.3f}{result['build_time_s']:>8.1f}s{result['index_size_mb']:>9.2f}{result['query_p50_ms']:>9.1f}{result['query_p95_ms']:>9.1f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"timestamp": time.time(), "questions": len(questions), "embedding": embedding, "results": results}, f, indent=4)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,8 +1,7 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Iterable, Iterator
 from langchain_core.documents import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter, CharacterTextSplitter
 from langchain_core.embeddings import Embeddings
-from langchain_experimental.text_splitter import SemanticChunker
 
 
 class Chunking:
@@ -19,6 +18,8 @@ class Chunking:
             self.text_splitter = CharacterTextSplitter(separator="\n\n", **chunking_options)
         elif self.chunking_strategy.lower() == "semantic":
             if embedding_model:
+                # Imported here, langchain_experimental is only needed by the semantic chunking
+                from langchain_experimental.text_splitter import SemanticChunker
                 self.text_splitter = SemanticChunker(embeddings=embedding_model)
             else:
                 raise Exception("embedding model is required when using semantic chunking")
@@ -30,3 +31,9 @@ class Chunking:
             raise ValueError("None or empty value found")
         
         return self.text_splitter.split_documents(documents=documents)
+
+    def iter_apply(self, documents: Iterable[Document]) -> Iterator[Document]:
+        # Split the documents one at a time, every splitter works on each document independently
+        # so the chunks are the same returned by apply, without keeping all the documents in memory
+        for document in documents:
+            yield from self.text_splitter.split_documents(documents=[document])
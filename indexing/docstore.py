@@ -0,0 +1,138 @@
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Any, List, Iterator, Tuple, Union
+import threading
+import sqlite3
+import json
+import uuid
+
+# The on disk layout of the FAISS docstore, saved next to index.faiss
+DOCSTORE_FILE_NAME = "docstore.sqlite"
+
+
+def write_sqlite_docstore(path: Union[str, Path], index_to_docstore_id: Dict[int, str], docstore: Docstore) -> None:
+    """
+    Write the documents of a FAISS store in a SQLite database, keyed by their position in the index
+
+    Parameters:
+        path (Union[str, Path]): the path of the SQLite database, it is replaced if it already exists
+        index_to_docstore_id (Dict[int, str]): the mapping between the index positions and the document ids
+        docstore (Docstore): the docstore containing the documents
+    """
+    path = Path(path)
+    # A temporary file for each writer, many processes can write the docstore of the same store (see VectorStore.load)
+    tmp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.execute("CREATE TABLE documents (position INTEGER PRIMARY KEY, id TEXT UNIQUE, content TEXT, metadata TEXT)")
+        rows = []
+        for position, doc_id in index_to_docstore_id.items():
+            doc = docstore.search(doc_id)
+            rows.append((int(position), doc_id, doc.page_content, json.dumps(doc.metadata)))
+        connection.executemany("INSERT INTO documents VALUES (?, ?, ?, ?)", rows)
+        connection.commit()
+    except BaseException:
+        connection.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+    connection.close()
+    # Replace the previous database only when the new one is complete
+    tmp_path.replace(path)
+
+
+class _ReadOnlyConnection:
+    """
+    A read-only SQLite connection shared by the threads of the process
+    """
+    def __init__(self, path: Union[str, Path]):
+        """
+        Attributes:
+            path (Union[str, Path]): the path of the SQLite database
+        """
+        self._connection = sqlite3.connect(f"{Path(path).absolute().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def fetchone(self, query: str, parameters: tuple = ()):
+        with self._lock:
+            return self._connection.execute(query, parameters).fetchone()
+
+    def fetchall(self, query: str, parameters: tuple = ()):
+        with self._lock:
+            return self._connection.execute(query, parameters).fetchall()
+
+
+class SQLiteDocstore(Docstore):
+    """
+    A read-only docstore backed by the SQLite database written by write_sqlite_docstore,
+    the documents are read from disk only when they are retrieved
+    """
+    def __init__(self, connection: _ReadOnlyConnection):
+        """
+        Attributes:
+            connection (_ReadOnlyConnection): the connection to the docstore database
+        """
+        self._connection = connection
+
+    def search(self, search: str) -> Union[str, Document]:
+        row = self._connection.fetchone("SELECT content, metadata FROM documents WHERE id = ?", (search,))
+        if row is None:
+            # Same behaviour of the InMemoryDocstore
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def positions(self, filter: Dict[str, Any]) -> List[int]:
+        """
+        Parameters:
+            filter (Dict[str, Any]): the metadata values the documents must have
+
+        Returns:
+            List[int]: the index positions of the matching documents
+        """
+        conditions = " AND ".join("json_extract(metadata, ?) = ?" for _ in filter)
+        parameters = tuple(item for name, value in filter.items() for item in (f'$."{name}"', value))
+        return [row[0] for row in self._connection.fetchall(f"SELECT position FROM documents WHERE {conditions}", parameters)]
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        raise NotImplementedError("SQLiteDocstore is read-only")
+
+    def delete(self, ids: list) -> None:
+        raise NotImplementedError("SQLiteDocstore is read-only")
+
+
+class SQLiteIndexMapping(Mapping):
+    """
+    A read-only index position -> document id mapping backed by the docstore database,
+    it replaces the index_to_docstore_id dictionary of the FAISS store
+    """
+    def __init__(self, connection: _ReadOnlyConnection):
+        """
+        Attributes:
+            connection (_ReadOnlyConnection): the connection to the docstore database
+        """
+        self._connection = connection
+
+    def __getitem__(self, position: int) -> str:
+        row = self._connection.fetchone("SELECT id FROM documents WHERE position = ?", (int(position),))
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def __iter__(self) -> Iterator[int]:
+        return (row[0] for row in self._connection.fetchall("SELECT position FROM documents ORDER BY position"))
+
+    def __len__(self) -> int:
+        return self._connection.fetchone("SELECT COUNT(*) FROM documents")[0]
+
+
+def open_sqlite_docstore(path: Union[str, Path]) -> Tuple[SQLiteDocstore, SQLiteIndexMapping]:
+    """
+    Parameters:
+        path (Union[str, Path]): the path of the SQLite database written by write_sqlite_docstore
+
+    Returns:
+        Tuple[SQLiteDocstore, SQLiteIndexMapping]: the docstore and the index position -> document id mapping
+    """
+    connection = _ReadOnlyConnection(path)
+    return SQLiteDocstore(connection), SQLiteIndexMapping(connection)
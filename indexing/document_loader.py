@@ -17,4 +17,8 @@ class DocumentLoader:
             raise NotImplementedError(f"File type {file_type} not supported")
         
     def load(self):
-        return self.loader.load()
\ No newline at end of file
+        return self.loader.load()
+
+    def lazy_load(self):
+        # Yield the documents (pages for a pdf, rows for a csv) one at a time
+        return self.loader.lazy_load()
@@ -0,0 +1,545 @@
+from indexing.document_loader import DocumentLoader
+from indexing.chunking import Chunking
+from indexing.vectorstore import VectorStore
+from indexing.manifest import Manifest, file_hash, index_signature
+from indexing.docstore import DOCSTORE_FILE_NAME
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Any, List, Tuple, Iterable, Iterator
+from itertools import islice
+import threading
+import json
+import shutil
+import time
+
+# per_file -> a vector store for each file, shared -> a single vector store with a topic metadata field
+STORE_LAYOUTS = ["per_file", "shared"]
+
+
+def parse_file(file_path: str, chunking_strategy: str, chunking_options: Dict[str, Any]) -> Tuple[List[Document], int, bool]:
+    """
+    Load a file and, when the chunking strategy does not need an embedding model, split it in chunks.
+    It is a module level function so it can be executed by a process pool worker
+
+    Parameters:
+        file_path (str): the path of the file to parse
+        chunking_strategy (str): the chunking strategy (e.g. window, sentence, paragraph, semantic)
+        chunking_options (Dict[str, Any]): the options of the chunking strategy
+
+    Returns:
+        Tuple[List[Document], int, bool]: the documents (chunks or pages), the number of pages and whether the documents are already chunked
+    """
+    pages = DocumentLoader(file_type=file_path.split(".")[-1], file_path=file_path).load()
+    # The semantic chunker needs the embedding model, so it runs in the main process
+    if chunking_strategy.lower() == "semantic":
+        return pages, len(pages), False
+    return Chunking(chunking_strategy, chunking_options).apply(pages), len(pages), True
+
+
+class IngestionReport:
+    """
+    Collects the progress, the throughput and the failures of an ingestion run
+    """
+    def __init__(self, total_files: int):
+        """
+        Attributes:
+            total_files (int): the number of files to ingest
+        """
+        self._total_files = total_files
+        self._lock = threading.Lock()
+        self._start = time.time()
+        self.done = 0
+        self.skipped = 0
+        self.pages = 0
+        self.chunks = 0
+        self.failures: Dict[str, str] = {}
+
+    def success(self, file_name: str, pages: int, chunks: int) -> None:
+        with self._lock:
+            self.done += 1
+            self.pages += pages
+            self.chunks += chunks
+            print(f"[{self.done}/{self._total_files}] {file_name}: {pages} pages, {chunks} chunks (done at {time.time() - self._start:.2f}s)", flush=True)
+
+    def skip(self, file_name: str) -> None:
+        with self._lock:
+            self.done += 1
+            self.skipped += 1
+            print(f"[{self.done}/{self._total_files}] {file_name}: unchanged, skipped", flush=True)
+
+    def failure(self, file_name: str, error: BaseException) -> None:
+        with self._lock:
+            self.done += 1
+            self.failures[file_name] = f"{type(error).__name__}: {error}"
+            print(f"[{self.done}/{self._total_files}] {file_name}: FAILED ({self.failures[file_name]})", flush=True)
+
+    def print_summary(self) -> None:
+        elapsed = max(time.time() - self._start, 1e-9)
+        print(f"\n{'-'*34} Ingestion {'-'*35}")
+        print(f"{self.done - self.skipped - len(self.failures)}/{self._total_files} files indexed, {self.skipped} unchanged, in {elapsed:.2f}s")
+        print(f"Throughput: {self.pages / elapsed:.2f} pages/s, {self.chunks / elapsed:.2f} chunks/s")
+        if self.failures:
+            print("Failures:")
+            for file_name, error in self.failures.items():
+                print(f"  {file_name}: {error}")
+        print(f"{'-'*80}")
+
+
+def topic_name(file_name: str) -> str:
+    """
+    Parameters:
+        file_name (str): the name of the source file
+
+    Returns:
+        str: the topic of the file chunks (the file name without extension)
+    """
+    return file_name.split(".")[0]
+
+
+def chunk_id(file_name: str, content_hash: str, position: int) -> str:
+    """
+    Parameters:
+        file_name (str): the name of the source file
+        content_hash (str): the hash of the file content
+        position (int): the position of the chunk in the file
+
+    Returns:
+        str: the id of the chunk, unique in a shared store even when two files have the same content
+    """
+    return f"{topic_name(file_name)}-{content_hash[:16]}-{position}"
+
+
+def store_dir(file_name: str, config: Dict[str, Any]) -> Path:
+    """
+    Parameters:
+        file_name (str): the name of the source file
+        config (Dict[str, Any]): the populate configuration
+
+    Returns:
+        Path: the directory of the vector store of the file, a directory for each file with the per_file layout,
+        the save directory itself with the shared layout
+
+    Raises:
+        NotImplementedError: if the store layout is not supported
+    """
+    store_layout = config.get("store_layout", "per_file")
+    if store_layout not in STORE_LAYOUTS:
+        raise NotImplementedError(f"Store layout {store_layout} not supported")
+    if store_layout == "shared":
+        return Path(config["save_dir_path"])
+    return Path(config["save_dir_path"]).joinpath(topic_name(file_name))
+
+
+class StoreWriter:
+    """
+    Writes the chunks of the ingested files in a vector store and keeps its manifest updated.
+    With the per_file layout a writer is opened for each file and the store is saved as soon as the file is indexed,
+    with the shared layout a single writer is used for all the files and the store is saved at the end of the run
+    """
+    def __init__(self, save_dir: Path, config: Dict[str, Any], embedding_model: Embeddings, autosave: bool):
+        """
+        Attributes:
+            save_dir (Path): the directory of the vector store
+            config (Dict[str, Any]): the populate configuration
+            embedding_model (Embeddings): the embedding model
+            autosave (bool): whether the store is saved as soon as a file is indexed
+        """
+        self.save_dir = save_dir
+        self.signature = index_signature(config)
+        self.autosave = autosave
+        # Held while a file is indexed, so the chunks of different files never interleave in a shared store
+        self.lock = threading.Lock()
+        self.manifest = Manifest(save_dir)
+        self.vector_store = VectorStore(config["vector_store_type"], embedding_model, save_dir, config.get("faiss_index"))
+        self._modified = False
+
+        rebuild = not config.get("ingestion", {}).get("incremental", False)
+        # The checkpoints of an interrupted streaming ingestion are kept even when the store is rebuilt
+        partial = any(not entry.get("complete", True) for entry in self.manifest.files.values())
+        if self.vector_store.exists() and self.manifest.matches(self.signature) and (partial or not rebuild):
+            self.vector_store.load()
+        elif self.vector_store.exists():
+            # Built with a different configuration (or rebuilt on purpose), the store restarts from scratch
+            self.vector_store.clear()
+            self.manifest.files = {}
+
+    def resume_point(self, file_name: str, content_hash: str) -> int:
+        return self.manifest.resume_point(file_name, content_hash, self.signature)
+
+    def begin_file(self, file_name: str, resume: int = 0) -> None:
+        # The chunks of the previous version of the file are removed,
+        # when resuming the chunks persisted by the last checkpoint are kept
+        previous = self.manifest.files.get(file_name)
+        if previous and not resume:
+            self.vector_store.delete_by_source(previous["source"])
+            self.manifest.remove(file_name)
+            self._modified = True
+
+    def add(self, file_name: str, chunks: List[Document], ids: List[str]) -> None:
+        # The topic metadata allows filtering the chunks of a file in a shared store
+        for chunk in chunks:
+            chunk.metadata["topic"] = topic_name(file_name)
+        self.vector_store.add_documents(chunks, ids)
+        self._modified = True
+
+    def record(self, file_name: str, content_hash: str, source: str, ids: List[str], complete: bool = True) -> None:
+        self.manifest.record(file_name, content_hash, source, ids, self.signature, complete, topic_name(file_name))
+        self._modified = True
+        if complete and self.autosave:
+            self.save()
+
+    def remove_missing(self, file_names: List[str]) -> List[str]:
+        # Remove the chunks of the recorded files that are not in file_names, returns the removed topics
+        removed = []
+        for file_name, entry in list(self.manifest.files.items()):
+            if file_name not in file_names:
+                self.vector_store.delete_by_source(entry["source"])
+                self.manifest.remove(file_name)
+                self._modified = True
+                removed.append(topic_name(file_name))
+        return removed
+
+    def save(self) -> None:
+        # Persist the vector store, making it accessible by the agent application
+        if not self._modified:
+            return
+        self.vector_store.save()
+        self.manifest.save()
+        self._modified = False
+
+
+def needs_indexing(file_path: str, config: Dict[str, Any]) -> Tuple[bool, str]:
+    """
+    Check the manifest of the file vector store, in incremental mode an unchanged file is not indexed again
+
+    Parameters:
+        file_path (str): the path of the source file
+        config (Dict[str, Any]): the populate configuration
+
+    Returns:
+        Tuple[bool, str]: whether the file must be indexed, and the hash of its content
+    """
+    content_hash = file_hash(file_path)
+    if not config.get("ingestion", {}).get("incremental", False):
+        return True, content_hash
+    file_name = Path(file_path).name
+    manifest = Manifest(store_dir(file_name, config))
+    return not manifest.is_unchanged(file_name, content_hash, index_signature(config)), content_hash
+
+
+def write_index_report(vector_store: VectorStore, save_dir: Path, config: Dict[str, Any]) -> None:
+    """
+    Measure the recall and the latency of an approximate FAISS index against the exact flat index,
+    the report is printed and saved as index_report.json in the vector store directory
+
+    Parameters:
+        vector_store (VectorStore): the vector store, just built
+        save_dir (Path): the directory of the vector store
+        config (Dict[str, Any]): the populate configuration, the "faiss_index.evaluate" section contains k, n_queries and search_params
+    """
+    evaluate_config = config.get("faiss_index", {}).get("evaluate", {})
+    if not evaluate_config.get("enabled", False):
+        return
+    report = vector_store.evaluate_index(evaluate_config.get("k", 10), evaluate_config.get("n_queries", 100), evaluate_config.get("search_params"))
+    if report is None:
+        return
+    with open(save_dir.joinpath("index_report.json"), "w") as f:
+        json.dump(report, f, indent=4)
+    recall = report[f"recall@{report['k']}"]
+    print(f"{save_dir.name}: {report['index_type']} index, recall@{report['k']} {recall:.3f}, "
+          f"{report['latency_ms']:.3f} ms/query (flat {report['flat_latency_ms']:.3f} ms/query)", flush=True)
+
+
+def index_documents(file_path: str, documents: List[Document], chunked: bool, content_hash: str, config: Dict[str, Any], embedding_model: Embeddings, shared: StoreWriter = None) -> int:
+    """
+    Chunk (if needed), embed and persist the documents of a file, in its own vector store or in the shared one.
+    The old chunks of the file are replaced by the new ones, the store is rebuilt when its configuration changed
+
+    Parameters:
+        file_path (str): the path of the source file
+        documents (List[Document]): the documents returned by parse_file
+        chunked (bool): whether the documents are already chunked
+        content_hash (str): the hash of the file content
+        config (Dict[str, Any]): the populate configuration
+        embedding_model (Embeddings): the embedding model
+        shared (StoreWriter): the writer of the shared store, None with the per_file layout
+
+    Returns:
+        int: the number of indexed chunks
+    """
+    file_name = Path(file_path).name
+    chunks = documents if chunked else Chunking(config["chunking_strategy"], config["chunking_options"], embedding_model).apply(documents)
+    # Deterministic ids, the same file and content always produce the same ids
+    ids = [chunk_id(file_name, content_hash, i) for i in range(len(chunks))]
+
+    # Create vector store for each document (just to demonstrate the llm capability to choose the right vector store)
+    writer = shared or StoreWriter(store_dir(file_name, config), config, embedding_model, autosave=True)
+    with writer.lock:
+        writer.begin_file(file_name)
+        writer.add(file_name, chunks, ids)
+        writer.record(file_name, content_hash, file_path, ids)
+    if shared is None:
+        write_index_report(writer.vector_store, writer.save_dir, config)
+    return len(chunks)
+
+
+def _batches(documents: Iterable[Document], batch_size: int) -> Iterator[List[Document]]:
+    iterator = iter(documents)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def index_file_streaming(file_path: str, content_hash: str, config: Dict[str, Any], embedding_model: Embeddings, shared: StoreWriter = None) -> Tuple[int, int]:
+    """
+    Load, chunk, embed and persist a file as a stream: the pages are loaded lazily, the chunks are embedded
+    and appended to the vector store in batches, so only one batch is kept in memory.
+    The store and a partial manifest are saved every checkpoint_every batches, an interrupted ingestion
+    of the same file (same content and configuration) resumes after the last checkpoint
+
+    Parameters:
+        file_path (str): the path of the source file
+        content_hash (str): the hash of the file content
+        config (Dict[str, Any]): the populate configuration, the "ingestion.streaming" section contains batch_size and checkpoint_every
+        embedding_model (Embeddings): the embedding model
+        shared (StoreWriter): the writer of the shared store, None with the per_file layout
+
+    Returns:
+        Tuple[int, int]: the number of pages and the number of chunks of the file
+
+    Raises:
+        ValueError: if the file produces no chunks
+    """
+    streaming_config = config.get("ingestion", {}).get("streaming", {})
+    batch_size = streaming_config.get("batch_size", 64)
+    checkpoint_every = streaming_config.get("checkpoint_every", 20)
+
+    file_name = Path(file_path).name
+    writer = shared or StoreWriter(store_dir(file_name, config), config, embedding_model, autosave=True)
+
+    pages = 0
+
+    def count_pages(documents: Iterable[Document]) -> Iterator[Document]:
+        nonlocal pages
+        for document in documents:
+            pages += 1
+            yield document
+
+    documents = DocumentLoader(file_type=file_path.split(".")[-1], file_path=file_path).lazy_load()
+    chunks = Chunking(config["chunking_strategy"], config["chunking_options"], embedding_model).iter_apply(count_pages(documents))
+
+    with writer.lock:
+        resume = writer.resume_point(file_name, content_hash)
+        writer.begin_file(file_name, resume)
+        ids = []
+        for n, batch in enumerate(_batches(chunks, batch_size), start=1):
+            batch_ids = [chunk_id(file_name, content_hash, len(ids) + i) for i in range(len(batch))]
+            # Skip the chunks already persisted by a previous run
+            skip = max(0, resume - len(ids))
+            if skip < len(batch):
+                writer.add(file_name, batch[skip:], batch_ids[skip:])
+            ids.extend(batch_ids)
+            # No checkpoint while the chunks are buffered for the index training
+            if n % checkpoint_every == 0 and len(ids) > resume and writer.vector_store.is_trained:
+                writer.record(file_name, content_hash, file_path, ids, complete=False)
+                writer.save()
+
+        if not ids:
+            raise ValueError("None or empty value found")
+        writer.record(file_name, content_hash, file_path, ids)
+    if shared is None:
+        write_index_report(writer.vector_store, writer.save_dir, config)
+    return pages, len(ids)
+
+
+def remove_stale_stores(file_paths: List[str], config: Dict[str, Any], shared: StoreWriter = None) -> List[str]:
+    """
+    Delete the vector stores (or the chunks of the shared store) whose source files are no longer in the data directory.
+    Only the directories containing a manifest (i.e. created by populate.py) are deleted
+
+    Parameters:
+        file_paths (List[str]): the paths of the files currently in the data directory
+        config (Dict[str, Any]): the populate configuration
+        shared (StoreWriter): the writer of the shared store, None with the per_file layout
+
+    Returns:
+        List[str]: the removed topics
+    """
+    file_names = [Path(file_path).name for file_path in file_paths]
+    if shared is not None:
+        return shared.remove_missing(file_names)
+    save_dir = Path(config["save_dir_path"])
+    if not save_dir.exists():
+        return []
+    removed = []
+    for dir in save_dir.iterdir():
+        manifest = Manifest(dir)
+        if dir.is_dir() and manifest.exists() and not set(file_names).intersection(manifest.files):
+            shutil.rmtree(dir)
+            removed.append(dir.name)
+    return removed
+
+
+def remove_shared_store(save_dir: Path) -> None:
+    """
+    Delete the shared store saved in the save directory (its index, docstore, report and manifest),
+    used when switching to the per_file layout, the per_file stores are in the subdirectories
+
+    Parameters:
+        save_dir (Path): the save directory
+    """
+    for file_name in ["index.faiss", "index.pkl", DOCSTORE_FILE_NAME, "index_report.json", "chroma.sqlite3"]:
+        save_dir.joinpath(file_name).unlink(missing_ok=True)
+    shutil.rmtree(save_dir.joinpath(".tmp"), ignore_errors=True)
+    # The manifest is deleted last, an interrupted removal is completed by the next run
+    Manifest(save_dir).delete()
+
+
+def ingest_serial(file_paths: List[str], config: Dict[str, Any], embedding_model: Embeddings, shared: StoreWriter = None) -> IngestionReport:
+    """
+    Ingest the files one after the other
+
+    Parameters:
+        file_paths (List[str]): the paths of the files to ingest
+        config (Dict[str, Any]): the populate configuration
+        embedding_model (Embeddings): the embedding model
+        shared (StoreWriter): the writer of the shared store, None with the per_file layout
+
+    Returns:
+        IngestionReport: the report of the ingestion run
+    """
+    streaming = config.get("ingestion", {}).get("streaming", {}).get("enabled", False)
+    report = IngestionReport(len(file_paths))
+    for file_path in file_paths:
+        file_name = Path(file_path).name
+        try:
+            changed, content_hash = needs_indexing(file_path, config)
+            if not changed:
+                report.skip(file_name)
+                continue
+            if streaming:
+                pages, chunks = index_file_streaming(file_path, content_hash, config, embedding_model, shared)
+            else:
+                documents, pages, chunked = parse_file(file_path, config["chunking_strategy"], config["chunking_options"])
+                chunks = index_documents(file_path, documents, chunked, content_hash, config, embedding_model, shared)
+            report.success(file_name, pages, chunks)
+        except Exception as e:
+            report.failure(file_name, e)
+    return report
+
+
+def ingest_parallel(file_paths: List[str], config: Dict[str, Any], embedding_model: Embeddings, shared: StoreWriter = None) -> IngestionReport:
+    """
+    Ingest many files in parallel: the files are parsed and chunked by a process pool,
+    while the chunks are embedded and persisted by a thread pool as soon as each file is parsed.
+    In streaming mode each file is loaded, chunked and embedded lazily by a single worker of the thread pool.
+    With the shared layout the files are written in the shared store one at a time
+
+    Parameters:
+        file_paths (List[str]): the paths of the files to ingest
+        config (Dict[str, Any]): the populate configuration, the "ingestion" section contains the workers counts
+        embedding_model (Embeddings): the embedding model
+        shared (StoreWriter): the writer of the shared store, None with the per_file layout
+
+    Returns:
+        IngestionReport: the report of the ingestion run
+    """
+    ingestion_config = config.get("ingestion", {})
+    parse_workers = ingestion_config.get("parse_workers", None)
+    # 1 -> a single consumer embeds the files one after the other (batched by the embedding model)
+    embed_workers = ingestion_config.get("embed_workers", 1)
+    streaming = ingestion_config.get("streaming", {}).get("enabled", False)
+
+    report = IngestionReport(len(file_paths))
+
+    def index(file_path: str, documents: List[Document], pages: int, chunked: bool, content_hash: str) -> None:
+        try:
+            chunks = index_documents(file_path, documents, chunked, content_hash, config, embedding_model, shared)
+            report.success(Path(file_path).name, pages, chunks)
+        except Exception as e:
+            report.failure(Path(file_path).name, e)
+
+    def index_streaming(file_path: str, content_hash: str) -> None:
+        try:
+            pages, chunks = index_file_streaming(file_path, content_hash, config, embedding_model, shared)
+            report.success(Path(file_path).name, pages, chunks)
+        except Exception as e:
+            report.failure(Path(file_path).name, e)
+
+    with ProcessPoolExecutor(max_workers=parse_workers) as parse_pool, ThreadPoolExecutor(max_workers=embed_workers) as embed_pool:
+        futures = {}
+        index_futures = []
+        for file_path in file_paths:
+            try:
+                changed, content_hash = needs_indexing(file_path, config)
+            except Exception as e:
+                report.failure(Path(file_path).name, e)
+                continue
+            if not changed:
+                report.skip(Path(file_path).name)
+                continue
+            if streaming:
+                index_futures.append(embed_pool.submit(index_streaming, file_path, content_hash))
+                continue
+            future = parse_pool.submit(parse_file, file_path, config["chunking_strategy"], config["chunking_options"])
+            futures[future] = (file_path, content_hash)
+
+        for future in as_completed(futures):
+            file_path, content_hash = futures[future]
+            try:
+                documents, pages, chunked = future.result()
+            except Exception as e:
+                report.failure(Path(file_path).name, e)
+                continue
+            index_futures.append(embed_pool.submit(index, file_path, documents, pages, chunked, content_hash))
+        for future in index_futures:
+            future.result()
+
+    return report
+
+
+def ingest(file_paths: List[str], config: Dict[str, Any], embedding_model: Embeddings) -> IngestionReport:
+    """
+    Ingest the files, serially or in parallel, in a vector store for each file (per_file layout)
+    or in a single vector store whose chunks are filtered by topic (shared layout)
+
+    Parameters:
+        file_paths (List[str]): the paths of the files to ingest
+        config (Dict[str, Any]): the populate configuration
+        embedding_model (Embeddings): the embedding model
+
+    Returns:
+        IngestionReport: the report of the ingestion run
+
+    Raises:
+        NotImplementedError: if the store layout is not supported
+    """
+    ingestion_config = config.get("ingestion", {})
+    store_layout = config.get("store_layout", "per_file")
+    if store_layout not in STORE_LAYOUTS:
+        raise NotImplementedError(f"Store layout {store_layout} not supported")
+
+    save_dir = Path(config["save_dir_path"])
+    shared = None
+    if store_layout == "shared":
+        shared = StoreWriter(save_dir, config, embedding_model, autosave=False)
+    elif Manifest(save_dir).exists():
+        # The save directory contained a shared store, without its files (and manifest) the per_file layout is detected
+        remove_shared_store(save_dir)
+
+    if ingestion_config.get("incremental", False):
+        # The vector stores (or the chunks) of the deleted files are removed
+        for topic in remove_stale_stores(file_paths, config, shared):
+            print(f"removed topic {topic}, its source file no longer exists")
+
+    if ingestion_config.get("parallel", False):
+        # Parse and chunk the files in a process pool, embed them as soon as they are ready
+        report = ingest_parallel(file_paths, config, embedding_model, shared)
+    else:
+        report = ingest_serial(file_paths, config, embedding_model, shared)
+
+    if shared is not None:
+        shared.save()
+        write_index_report(shared.vector_store, save_dir, config)
+    return report
@@ -0,0 +1,129 @@
+from pathlib import Path
+from typing import Dict, Any, List, Union
+import hashlib
+import json
+
+
+def file_hash(file_path: str) -> str:
+    """
+    Parameters:
+        file_path (str): the path of the file
+
+    Returns:
+        str: the sha256 hex digest of the file content
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def index_signature(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The part of the populate configuration that determines the content of a vector store,
+    when it changes every file must be indexed again
+
+    Parameters:
+        config (Dict[str, Any]): the populate configuration
+
+    Returns:
+        Dict[str, Any]: the chunking, embedding, vector store and FAISS index configuration
+    """
+    return {
+        "chunking_strategy": config["chunking_strategy"],
+        "chunking_options": config["chunking_options"],
+        "embedding": config["embedding"],
+        "vector_store_type": config["vector_store_type"],
+        # The evaluation settings do not change the index content
+        "faiss_index": {key: value for key, value in config.get("faiss_index", {"type": "flat"}).items() if key != "evaluate"}
+    }
+
+
+class Manifest:
+    """
+    The manifest stored alongside a vector store, it records for each indexed file
+    its content hash, its source (the value of the "source" metadata of its chunks), its chunk ids and whether
+    its ingestion completed, together with the configuration used to build the store
+    """
+    FILE_NAME = "manifest.json"
+
+    def __init__(self, store_dir: Union[str, Path]):
+        """
+        Attributes:
+            store_dir (Union[str, Path]): the directory of the vector store
+        """
+        self._path = Path(store_dir).joinpath(self.FILE_NAME)
+        self.signature = None
+        self.files: Dict[str, Dict[str, Any]] = {}
+        if self._path.exists():
+            with open(self._path, "r") as f:
+                data = json.load(f)
+            self.signature = data.get("signature")
+            self.files = data.get("files", {})
+
+    def exists(self) -> bool:
+        return self._path.exists()
+
+    def matches(self, signature: Dict[str, Any]) -> bool:
+        """
+        Parameters:
+            signature (Dict[str, Any]): the current index signature (see index_signature)
+
+        Returns:
+            bool: whether the store was built with the same configuration
+        """
+        return self.signature == signature
+
+    def is_unchanged(self, file_name: str, content_hash: str, signature: Dict[str, Any]) -> bool:
+        """
+        Parameters:
+            file_name (str): the name of the file
+            content_hash (str): the current hash of the file content
+            signature (Dict[str, Any]): the current index signature
+
+        Returns:
+            bool: whether the file is already indexed, with the same content and configuration
+        """
+        entry = self.files.get(file_name)
+        return self.matches(signature) and entry is not None and entry.get("hash") == content_hash and entry.get("complete", True)
+
+    def resume_point(self, file_name: str, content_hash: str, signature: Dict[str, Any]) -> int:
+        """
+        Parameters:
+            file_name (str): the name of the file
+            content_hash (str): the current hash of the file content
+            signature (Dict[str, Any]): the current index signature
+
+        Returns:
+            int: the number of chunks persisted by the last checkpoint of an interrupted ingestion (0 -> start from scratch)
+        """
+        entry = self.files.get(file_name)
+        if not self.matches(signature) or entry is None or entry.get("hash") != content_hash or entry.get("complete", True):
+            return 0
+        return len(entry.get("chunk_ids", []))
+
+    def record(self, file_name: str, content_hash: str, source: str, chunk_ids: list, signature: Dict[str, Any], complete: bool = True, topic: str = None) -> None:
+        self.signature = signature
+        self.files[file_name] = {"hash": content_hash, "source": source, "chunk_ids": chunk_ids, "complete": complete, "topic": topic}
+
+    def remove(self, file_name: str) -> None:
+        self.files.pop(file_name, None)
+
+    def topics(self) -> List[str]:
+        """
+        Returns:
+            List[str]: the topics of the completely indexed files
+        """
+        return sorted({entry["topic"] for entry in self.files.values() if entry.get("topic") and entry.get("complete", True)})
+
+    def delete(self) -> None:
+        self._path.unlink(missing_ok=True)
+
+    def save(self) -> None:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first, so a crash never leaves a truncated manifest
+        tmp_path = self._path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"signature": self.signature, "files": self.files}, f, indent=4)
+        tmp_path.replace(self._path)
@@ -1,57 +1,400 @@
 from langchain_core.embeddings import Embeddings
-from typing import List
+from typing import List, Tuple, Union, Dict, Any
 from langchain_core.documents import Document
 from langchain_community.vectorstores import FAISS
-from langchain_chroma import Chroma
 from langchain_community.docstore.in_memory import InMemoryDocstore
+from indexing.docstore import DOCSTORE_FILE_NAME, SQLiteDocstore, write_sqlite_docstore, open_sqlite_docstore
 from pathlib import Path
+import numpy as np
 import faiss
+import pickle
+import shutil
+import sqlite3
+import time
+import uuid
+
+# FAISS index types, the last three are trained on a sample of the chunk vectors
+INDEX_TYPES = ["flat", "hnsw", "ivf_flat", "ivf_pq", "sq"]
+TRAINED_INDEX_TYPES = ["ivf_flat", "ivf_pq", "sq"]
+LOAD_MODES = ["memory", "mmap"]
+# k-means needs about 39 training vectors for each centroid, fewer vectors get the flat index (see _build_index)
+MIN_TRAIN_VECTORS = 39
 
 class VectorStore:
     
-    def __init__(self, store_type: str, embedding_model: Embeddings, save_dir_path: str = None):
+    def __init__(self, store_type: str, embedding_model: Embeddings, save_dir_path: str = None, index_config: Dict[str, Any] = None):
         self.store_type = store_type
         self.save_dir_path = save_dir_path
         self.embedding_model = embedding_model
+        # FAISS index type and its build options (see _build_index), the default is the exact (brute force) index
+        self.index_config = index_config or {"type": "flat"}
 
         # Use the chosen vector store type
         if self.store_type == "faiss":
-            self.vectorstore = FAISS(
-                embedding_function=self.embedding_model,    
-                index=faiss.IndexFlatL2(len(self.embedding_model.embed_query(" "))),
-                docstore=InMemoryDocstore(),
-                index_to_docstore_id={}
-            )
+            if self.index_config.get("type", "flat") not in INDEX_TYPES:
+                raise NotImplementedError(f"FAISS index type {self.index_config['type']} is not supported")
+            self.dimension = len(self.embedding_model.embed_query(" "))
+            self._reset()
         elif self.store_type == "chroma":
+            # Imported here, chromadb is slow to import and only needed by the chroma stores
+            from langchain_chroma import Chroma
             self.vectorstore = Chroma(
                 embedding_function=self.embedding_model,
                 persist_directory=self.save_dir_path
             )
         else:
             raise NotImplementedError(f"Vector store {self.store_type} is not supported")
+
+    def _reset(self):
+        # The indexes that need training start from an empty placeholder, the chunks are buffered
+        # (with their vectors) until enough vectors are available to train the real index
+        self._trained = self.index_config.get("type", "flat") not in TRAINED_INDEX_TYPES
+        self._pending: List[Tuple[Document, str, np.ndarray]] = []
+        # Exact index with the same vectors, used to measure the recall of an approximate index
+        evaluate = self.index_config.get("evaluate", {}).get("enabled", False)
+        self._reference = faiss.IndexFlatL2(self.dimension) if evaluate and self.index_config.get("type", "flat") != "flat" else None
+        # Metadata filter -> FAISS selector of the matching positions (see _filter_parameters)
+        self._selectors = {}
+        self.vectorstore = FAISS(
+            embedding_function=self.embedding_model,    
+            index=self._build_index() if self._trained else faiss.IndexFlatL2(self.dimension),
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={}
+        )
+
+    def _build_index(self, n_train: int = 0) -> faiss.Index:
+        # Create an empty FAISS index of the configured type (L2 distance, as the flat index),
+        # n_train is the number of training vectors, used to scale down the IVF and PQ parameters on small corpora
+        index_type = self.index_config.get("type", "flat")
+        if index_type == "flat":
+            return faiss.IndexFlatL2(self.dimension)
+        if index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(self.dimension, self.index_config.get("hnsw_m", 32))
+            index.hnsw.efConstruction = self.index_config.get("ef_construction", 40)
+            return index
+        if index_type == "sq":
+            return faiss.index_factory(self.dimension, self.index_config.get("sq_type", "SQ8"))
+
+        # k-means needs about 39 training vectors for each IVF centroid, a corpus too small to train
+        # a single centroid (e.g. a one-chunk file) gets the exact index, which is as fast on so few vectors
+        if n_train < MIN_TRAIN_VECTORS:
+            return faiss.IndexFlatL2(self.dimension)
+        nlist = max(1, min(self.index_config.get("nlist", 1024), n_train // MIN_TRAIN_VECTORS))
+        if index_type == "ivf_flat":
+            index = faiss.index_factory(self.dimension, f"IVF{nlist},Flat")
+        else:
+            pq_m = self.index_config.get("pq_m", 16)
+            if self.dimension % pq_m:
+                raise ValueError(f"pq_m ({pq_m}) must divide the embedding dimension ({self.dimension})")
+            # Each sub-quantizer has 2^nbits centroids, trained with k-means as well (at least one training vector each)
+            pq_nbits = max(1, min(self.index_config.get("pq_nbits", 8), int(np.log2(max(n_train // MIN_TRAIN_VECTORS, 2))), int(np.log2(n_train))))
+            index = faiss.index_factory(self.dimension, f"IVF{nlist},PQ{pq_m}x{pq_nbits}")
+        # The direct map allows reconstructing the stored vectors
+        faiss.extract_index_ivf(index).make_direct_map()
+        return index
+
+    def _train_size(self) -> int:
+        # Number of buffered vectors after which the index is trained: k-means needs about 39 vectors for each
+        # IVF centroid (and each PQ sub-quantizer centroid), so the buffer is kept only until the configured nlist
+        # can be trained, train_size is an upper bound (a larger nlist is scaled down, see _build_index)
+        train_size = self.index_config.get("train_size", 10000)
+        index_type = self.index_config.get("type", "flat")
+        if index_type not in ["ivf_flat", "ivf_pq"]:
+            return train_size
+        centroids = self.index_config.get("nlist", 1024)
+        if index_type == "ivf_pq":
+            centroids = max(centroids, 2 ** self.index_config.get("pq_nbits", 8))
+        return min(train_size, centroids * MIN_TRAIN_VECTORS)
+
+    def _train(self):
+        # Train the real index on the buffered vectors, then add the buffered chunks to it
+        if not self._pending:
+            return
+        documents, ids, vectors = zip(*self._pending)
+        index = self._build_index(len(vectors))
+        vectors = np.vstack(vectors)
+        index.train(vectors)
+        self.vectorstore.index = index
+        self._trained = True
+        self._pending = []
+        self._selectors = {}
+        self.vectorstore.add_embeddings(
+            text_embeddings=zip([doc.page_content for doc in documents], vectors),
+            metadatas=[doc.metadata for doc in documents],
+            ids=list(ids)
+        )
+
+    @property
+    def is_trained(self) -> bool:
+        # False while the chunks are buffered waiting for the index training
+        return self.store_type != "faiss" or self._trained
+
+    def set_search_params(self, search_params: Dict[str, Any] = None):
+        # Search time knobs of the approximate indexes: nprobe (IVF) and efSearch (HNSW),
+        # the parameters that do not apply to the index type are ignored
+        if self.store_type != "faiss" or not search_params:
+            return
+        index = faiss.downcast_index(self.vectorstore.index)
+        if "nprobe" in search_params and isinstance(index, faiss.IndexIVF):
+            index.nprobe = search_params["nprobe"]
+        if "efSearch" in search_params and isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efSearch = search_params["efSearch"]
     
-    def as_retriever(self, k: int):
+    def as_retriever(self, k: int, search_params: Dict[str, Any] = None):
+        self.set_search_params(search_params)
         return self.vectorstore.as_retriever(search_kwargs={"k": k})
 
-    def add_documents(self, documents: List[Document]):
+    def _filter_parameters(self, filter: Dict[str, Any]) -> Union[faiss.SearchParameters, None]:
+        # The FAISS search parameters restricting the search to the chunks whose metadata match the filter,
+        # None when no chunk matches. The selectors are cached until the store is modified
+        key = tuple(sorted(filter.items()))
+        if key not in self._selectors:
+            if isinstance(self.vectorstore.docstore, SQLiteDocstore):
+                positions = self.vectorstore.docstore.positions(filter)
+            else:
+                positions = [position for position, doc_id in self.vectorstore.index_to_docstore_id.items()
+                             if all(self.vectorstore.docstore.search(doc_id).metadata.get(name) == value for name, value in filter.items())]
+            self._selectors[key] = (faiss.IDSelectorBatch(np.array(positions, dtype=np.int64)), len(positions)) if positions else None
+        if self._selectors[key] is None:
+            return None
+        selector, selected = self._selectors[key]
+        # The search time knobs must be passed again, the parameters override the index ones
+        index = faiss.downcast_index(self.vectorstore.index)
+        if isinstance(index, faiss.IndexIVF):
+            # Only the vectors of the nprobe probed lists are compared, so a small selection (e.g. a small topic
+            # of the shared store) would have few or no vectors there: the lists probed grow as the selection shrinks,
+            # to scan about as many selected vectors as an unfiltered search, up to all the lists (an exact search)
+            nprobe = min(index.nlist, int(np.ceil(index.nprobe * index.ntotal / selected)))
+            return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+        if isinstance(index, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+        return faiss.SearchParameters(sel=selector)
+
+    def search_with_vectors(self, query: str, k: int, query_embedding: List[float] = None, filter: Dict[str, Any] = None) -> List[Tuple[Document, float, Union[List[float], None]]]:
+        # Returns, for each retrieved document, the store score (lower is better) and the vector stored in the index,
+        # so downstream nodes do not have to embed the retrieved chunks again.
+        # A precomputed query embedding can be passed when the same query is searched in many stores,
+        # the filter restricts the search to the chunks with the given metadata values (e.g. {"topic": "monopoly_instructions"})
+        if query_embedding is None:
+            query_embedding = self.embedding_model.embed_query(query)
+
+        if self.store_type == "faiss":
+            query_emb = np.array([query_embedding], dtype=np.float32)
+            if self.vectorstore._normalize_L2:
+                faiss.normalize_L2(query_emb)
+            if filter:
+                params = self._filter_parameters(filter)
+                if params is None:
+                    return []
+                scores, positions = self.vectorstore.index.search(query_emb, k, params=params)
+            else:
+                scores, positions = self.vectorstore.index.search(query_emb, k)
+            results = []
+            for score, position in zip(scores[0], positions[0]):
+                # -1 is returned when the index contains less than k vectors
+                if position == -1:
+                    continue
+                doc_id = self.vectorstore.index_to_docstore_id[position]
+                doc = self.vectorstore.docstore.search(doc_id)
+                if not isinstance(doc, Document):
+                    raise ValueError(f"Could not find document for id {doc_id}")
+                doc.id = doc_id
+                try:
+                    vector = self.vectorstore.index.reconstruct(int(position)).tolist()
+                except RuntimeError:
+                    # Some index types can not reconstruct the stored vectors
+                    vector = None
+                results.append((doc, float(score), vector))
+            return results
+
+        if filter and len(filter) > 1:
+            filter = {"$and": [{name: value} for name, value in filter.items()]}
+        docs_with_score = self.vectorstore.similarity_search_by_vector_with_relevance_scores(query_embedding, k=k, filter=filter)
+        ids = [doc.id for doc, _ in docs_with_score if doc.id]
+        stored = self.vectorstore.get(ids=ids, include=["embeddings"]) if ids else {"ids": [], "embeddings": []}
+        vectors = {doc_id: np.asarray(vector).tolist() for doc_id, vector in zip(stored["ids"], stored["embeddings"])}
+        return [(doc, float(score), vectors.get(doc.id)) for doc, score in docs_with_score]
+
+    def add_documents(self, documents: List[Document], ids: List[str] = None):
         if not documents:
             raise ValueError("None or empty value found")
-        return self.vectorstore.add_documents(documents=documents)
+        if self.store_type != "faiss":
+            return self.vectorstore.add_documents(documents=documents, ids=ids)
+
+        ids = ids or [str(uuid.uuid4()) for _ in documents]
+        self._selectors = {}
+        vectors = self.embedding_model.embed_documents([doc.page_content for doc in documents])
+        if self._reference is not None:
+            self._reference.add(np.array(vectors, dtype=np.float32))
+        if not self._trained:
+            # The buffered vectors are kept as float32 arrays, a fraction of the memory of the lists of floats
+            self._pending.extend(zip(documents, ids, np.asarray(vectors, dtype=np.float32)))
+            if len(self._pending) >= self._train_size():
+                self._train()
+            return ids
+        return self.vectorstore.add_embeddings(
+            text_embeddings=zip([doc.page_content for doc in documents], vectors),
+            metadatas=[doc.metadata for doc in documents],
+            ids=ids
+        )
+
+    def _delete(self, ids: List[str]):
+        if self.store_type != "faiss":
+            self.vectorstore.delete(ids)
+            return
+        # The positions change, so the exact reference index is no longer aligned
+        self._reference = None
+        self._selectors = {}
+        removed = set(ids)
+        self._pending = [entry for entry in self._pending if entry[1] not in removed]
+        ids = [doc_id for doc_id in self.vectorstore.index_to_docstore_id.values() if doc_id in removed]
+        if not ids:
+            return
+        index = faiss.downcast_index(self.vectorstore.index)
+        if not isinstance(index, (faiss.IndexHNSW, faiss.IndexIVF)):
+            self.vectorstore.delete(ids)
+            return
+        # HNSW does not support removals and IVF does not renumber the remaining vectors,
+        # so the index is rebuilt (keeping its training) with the remaining vectors.
+        # The original vectors are not kept (it would double the memory of the store), the remaining ones are
+        # reconstructed from the index: exact for HNSW and IVF-Flat, the quantized vectors for IVF-PQ, which are
+        # encoded again with the same codebooks (a vector can move to a closer list, its code loses no more precision)
+        keep = [(position, doc_id) for position, doc_id in sorted(self.vectorstore.index_to_docstore_id.items()) if doc_id not in removed]
+        index = faiss.clone_index(self.vectorstore.index)
+        index.reset()
+        if keep:
+            index.add(np.vstack([self.vectorstore.index.reconstruct(int(position)) for position, _ in keep]))
+        self.vectorstore.docstore.delete(ids)
+        self.vectorstore.index = index
+        self.vectorstore.index_to_docstore_id = {i: doc_id for i, (_, doc_id) in enumerate(keep)}
+
+    def delete_by_source(self, source: str) -> int:
+        # Delete all the chunks whose "source" metadata matches, returns the number of deleted chunks
+        if self.store_type == "faiss":
+            ids = [doc_id for doc_id in self.vectorstore.index_to_docstore_id.values()
+                   if self.vectorstore.docstore.search(doc_id).metadata.get("source") == source]
+            ids += [doc_id for doc, doc_id, _ in self._pending if doc.metadata.get("source") == source]
+        else:
+            ids = self.vectorstore.get(where={"source": source}, include=[])["ids"]
+        if ids:
+            self._delete(ids)
+        return len(ids)
+
+    def update_documents(self, source: str, documents: List[Document], ids: List[str] = None):
+        # Upsert: the old chunks of the source are replaced by the new ones
+        self.delete_by_source(source)
+        return self.add_documents(documents, ids)
+
+    def clear(self):
+        # Remove every chunk from the store
+        if self.store_type == "faiss":
+            self._reset()
+            return
+        ids = self.vectorstore.get(include=[])["ids"]
+        if ids:
+            self.vectorstore.delete(ids)
+
+    def evaluate_index(self, k: int = 10, n_queries: int = 100, search_params: Dict[str, Any] = None) -> Union[Dict[str, Any], None]:
+        # Compare the approximate index against the exact flat index built with the same vectors:
+        # recall@k and average latency of single query searches, using a sample of the stored vectors as queries.
+        # Returns None when the reference is not available (flat index, evaluation disabled, loaded or modified store)
+        if self.store_type != "faiss" or self._reference is None or self._pending:
+            return None
+        index = self.vectorstore.index
+        if self._reference.ntotal != index.ntotal or index.ntotal == 0:
+            return None
+        self.set_search_params(search_params)
+
+        positions = np.random.default_rng(0).choice(index.ntotal, min(n_queries, index.ntotal), replace=False)
+        queries = np.vstack([self._reference.reconstruct(int(position)) for position in positions])
+
+        def run(target: faiss.Index) -> Tuple[np.ndarray, float]:
+            results = []
+            start = time.perf_counter()
+            for query in queries:
+                results.append(target.search(query.reshape(1, -1), k)[1][0])
+            return np.array(results), (time.perf_counter() - start) * 1000 / len(queries)
+
+        exact, exact_latency = run(self._reference)
+        approximate, approximate_latency = run(index)
+        recalls = [len(set(e[e != -1]) & set(a[a != -1])) / max(1, int((e != -1).sum())) for e, a in zip(exact, approximate)]
+        return {
+            "index_type": self.index_config.get("type", "flat"),
+            "vectors": int(index.ntotal),
+            "k": k,
+            "queries": len(queries),
+            "search_params": search_params or {},
+            f"recall@{k}": float(np.mean(recalls)),
+            "latency_ms": approximate_latency,
+            "flat_latency_ms": exact_latency
+        }
+
+    def exists(self) -> bool:
+        # Whether the store has been persisted in save_dir_path
+        if not self.save_dir_path:
+            return False
+        return VectorStore.is_saved(self.store_type, self.save_dir_path)
+
+    @staticmethod
+    def is_saved(store_type: str, dir_path: str) -> bool:
+        # Whether dir_path contains a saved store of the given type (without loading the embedding model)
+        return Path(dir_path).joinpath("index.faiss" if store_type == "faiss" else "chroma.sqlite3").exists()
     
-    def load(self):
+    def load(self, mode: str = "memory"):
         # Note: When using ChromaDB you are not required to use the load method
         # Just pass the loading directory to the __init__
+        # mode: "memory" reads the whole FAISS index and docstore in memory,
+        # "mmap" memory maps the index and reads the documents from the on disk docstore only when they are retrieved,
+        # so the processes loading the same store share the page cache (the store is read-only)
+        if mode not in LOAD_MODES:
+            raise NotImplementedError(f"Load mode {mode} is not supported")
 
         dir = Path(self.save_dir_path)
         if not dir.exists():
             raise FileNotFoundError(f"Directory {dir} not found")
         
         if self.store_type == "faiss":
-            self.vectorstore = FAISS.load_local(
-                folder_path=self.save_dir_path,
-                embeddings=self.embedding_model,
-                allow_dangerous_deserialization=True
-            )
+            if mode == "mmap" and not dir.joinpath(DOCSTORE_FILE_NAME).exists():
+                self._write_docstore(dir)
+            # A store whose docstore could not be written (e.g. a read-only directory) is loaded in memory
+            if mode == "mmap" and dir.joinpath(DOCSTORE_FILE_NAME).exists():
+                docstore, index_to_docstore_id = open_sqlite_docstore(dir.joinpath(DOCSTORE_FILE_NAME))
+                self.vectorstore = FAISS(
+                    embedding_function=self.embedding_model,
+                    index=self._read_index_mmap(dir.joinpath("index.faiss")),
+                    docstore=docstore,
+                    index_to_docstore_id=index_to_docstore_id
+                )
+            else:
+                self.vectorstore = FAISS.load_local(
+                    folder_path=self.save_dir_path,
+                    embeddings=self.embedding_model,
+                    allow_dangerous_deserialization=True
+                )
+            self._trained = True
+            self._pending = []
+            self._reference = None
+            self._selectors = {}
+
+    @staticmethod
+    def _write_docstore(dir: Path):
+        # The documents are copied from the pickled docstore to the SQLite one on the first mmap load,
+        # not at every save: the memory mode (and the checkpoints of the ingestion) do not need it
+        try:
+            with open(dir.joinpath("index.pkl"), "rb") as f:
+                docstore, index_to_docstore_id = pickle.load(f)
+            write_sqlite_docstore(dir.joinpath(DOCSTORE_FILE_NAME), index_to_docstore_id, docstore)
+        except (OSError, sqlite3.Error):
+            pass
+
+    @staticmethod
+    def _read_index_mmap(path: Path) -> faiss.Index:
+        # Memory map the flat codes (flat, SQ and HNSW storage), the IVF indexes
+        # do not support it and only memory map their inverted lists
+        try:
+            return faiss.read_index(str(path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            return faiss.read_index(str(path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
 
     def save(self):
         # Note: When using ChromaDB you are not required to use the save method
@@ -61,12 +404,52 @@ class VectorStore:
         
         if self.save_dir_path:
             dir = Path(self.save_dir_path)
-            if not dir.exists():
-                dir.mkdir(parents=True)
             
             if self.store_type == "faiss":
-                self.vectorstore.save_local(folder_path=dir)
+                # An index still waiting for its training is trained on the chunks buffered so far
+                if not self._trained:
+                    self._train()
+                # The directory is created only for a store that can be saved, a failed save does not leave
+                # an empty store directory behind (it would be taken for a topic, see get_tools)
+                created = not dir.exists()
+                try:
+                    self._write(dir)
+                except BaseException:
+                    if created:
+                        shutil.rmtree(dir, ignore_errors=True)
+                    raise
         else:
             raise Exception("save path not provided in the instantiation phase")
 
-    
\ No newline at end of file
+    def _write(self, dir: Path):
+        # Write to a temporary directory first, so a crash while writing (e.g. during a checkpoint)
+        # leaves the previous files untouched. The files are then moved one at a time: each move is atomic,
+        # but a crash between two moves can leave files of different versions (the manifest is saved after the store)
+        tmp_dir = dir.joinpath(".tmp")
+        # the leftovers of a crash while writing
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.vectorstore.save_local(folder_path=tmp_dir)
+        # The SQLite docstore of the previous version is out of date, it is written again by the next mmap load
+        dir.joinpath(DOCSTORE_FILE_NAME).unlink(missing_ok=True)
+        for file in tmp_dir.iterdir():
+            file.replace(dir.joinpath(file.name))
+        tmp_dir.rmdir()
+
+
+class VectorStoreView:
+    """
+    A read-only view over the chunks of a vector store whose metadata match a filter,
+    e.g. the chunks of a topic in the shared store
+    """
+    def __init__(self, vector_store: VectorStore, filter: Dict[str, Any]):
+        """
+        Attributes:
+            vector_store (VectorStore): the (loaded) vector store, or a store with the same search interface (e.g. LazyVectorStore)
+            filter (Dict[str, Any]): the metadata values of the chunks in the view
+        """
+        self.vector_store = vector_store
+        self.filter = filter
+        self.embedding_model = vector_store.embedding_model
+
+    def search_with_vectors(self, query: str, k: int, query_embedding: List[float] = None) -> List[Tuple[Document, float, Union[List[float], None]]]:
+        return self.vector_store.search_with_vectors(query, k, query_embedding, self.filter)
@@ -1,6 +1,7 @@
 from utils.state import AgentState
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain.prompts import PromptTemplate
+from langchain_core.prompt_values import PromptValue
 
 class GenerateAnswer:
     """
@@ -15,6 +16,18 @@ class GenerateAnswer:
         self._prompt = prompt
         self._llm = llm
 
+    def _build_prompt(self, state: AgentState) -> PromptValue:
+        """
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            PromptValue: the prompt used to generate the answer
+        """
+        question = state["original_question"]
+        context = state["context"]
+        return PromptTemplate.from_template(self._prompt).invoke({"question": question, "context": context})
+
     def generate_answer(self, state: AgentState) -> AgentState:
         """
         Use the original question and the context to generate a answer
@@ -25,14 +38,24 @@ class GenerateAnswer:
         Returns:
             AgentState: the updated graph state
         """
-        question = state["original_question"]
-        context = state["context"]
-        prompt = PromptTemplate.from_template(self._prompt).invoke({"question": question, "context": context})
+        response = self._llm.invoke(self._build_prompt(state))
 
-        response = self._llm.invoke(prompt)
+        state["messages"].append(response)
+
+        return state
+
+    async def agenerate_answer(self, state: AgentState) -> AgentState:
+        """
+        Asynchronous version of **generate_answer**
+
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            AgentState: the updated graph state
+        """
+        response = await self._llm.ainvoke(self._build_prompt(state))
 
         state["messages"].append(response)
 
         return state
-        
-        
\ No newline at end of file
@@ -1,9 +1,38 @@
-from utils.state import AgentState
-from langchain_core.messages import AIMessage
+from utils.state import AgentState, Chunk
+from langchain_core.messages import AIMessage, AnyMessage
+from typing import List
+
+def _to_chunks(message: AnyMessage) -> List[Chunk]:
+    """
+    Convert a tool message to a list of chunks
+
+    Parameters:
+        message (AnyMessage): a message generated by a tool
+
+    Returns:
+        List[Chunk]: the chunks contained in the message
+    """
+    artifact = getattr(message, "artifact", None)
+
+    if artifact:
+        # Retriever tools return one structured record for each retrieved chunk
+        return [Chunk(
+            id=item.get("id"),
+            content=item["content"],
+            source=item.get("source"),
+            page=item.get("page"),
+            score=item.get("score"),
+            fused_score=item.get("fused_score"),
+            vector=item.get("vector"),
+            rank=rank
+        ) for rank, item in enumerate(artifact)]
+
+    # The other tools (e.g. web search, MCP tools) return a single piece of text
+    return [Chunk(id=None, content=message.text(), source=message.name, page=None, score=None, fused_score=None, vector=None, rank=0)]
 
 def extract_chunks(state: AgentState) -> AgentState:
     """
-    Extract chunks from the previous message
+    Extract chunks from the tool messages generated by the previous node
 
     Parameters:
         state (AgentState): the graph state
@@ -11,9 +40,22 @@ def extract_chunks(state: AgentState) -> AgentState:
     Returns:
         AgentState: the updated graph state
     """
-    chunks = state["messages"][-1].content.split("\n\n")
+    # The tool execution node generates a message for each tool called in parallel
+    tool_messages = []
+    for msg in reversed(state["messages"]):
+        if msg.type != "tool":
+            break
+        tool_messages.insert(0, msg)
+
+    chunks = [chunk for msg in tool_messages for chunk in _to_chunks(msg)]
     state["chunks"] = chunks
 
+    # The stored vectors now live in the chunks (until the reranking), the tool messages stay in the state
+    # for the whole conversation, so their artifacts keep only the chunk metadata
+    for msg in tool_messages:
+        if getattr(msg, "artifact", None):
+            msg.artifact = [{key: value for key, value in item.items() if key != "vector"} for item in msg.artifact]
+
     state["messages"].append(AIMessage(f"{len(chunks)} chunks extracted"))
 
-    return state
\ No newline at end of file
+    return state
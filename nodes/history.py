@@ -1,42 +1,107 @@
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain.prompts import PromptTemplate
+from langchain_core.prompt_values import PromptValue
 from utils.state import AgentState
+from utils.history import needs_history
 from typing import List, Union
-from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.messages import AIMessage, HumanMessage, BaseMessage
 
 
 class HistorySummarizer:
     """
     The Chat History Summarizer Node
     """
-    def __init__(self, llm: BaseChatModel, prompt: str):
+    def __init__(self, llm: BaseChatModel, prompt: str, skip_self_contained: bool = False):
         """
         Attributes:
             llm (BaseChatModel): the LLM for chat history summarization
             prompt (str): the prompt used by the LLM
+            skip_self_contained (bool): do not rewrite the questions without anaphora (see utils.history.needs_history),
+                the heuristic misses elliptical follow-ups (e.g. "What was the revenue in 2022?"), so it is opt-in
         """
         self._llm = llm
         self._prompt = prompt
+        self._skip_self_contained = skip_self_contained
 
-    def summarize(self, state: AgentState) -> AgentState:
+    def _skip(self, state: AgentState) -> bool:
         """
-        Use the chat history to write a user's query contextualize with the chat history
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            bool: True if the question can be used as is (no chat history, or a self-contained question), so the LLM call is skipped
+        """
+        if not state["history"].strip():
+            return True
+        return self._skip_self_contained and not needs_history(state["original_question"])
 
+    def _unchanged(self, state: AgentState) -> AgentState:
+        """
         Parameters:
             state (AgentState): the graph state
 
         Returns:
-            AgentState: the updated graph state
+            AgentState: the graph state, with the question unchanged
+        """
+        question = state["original_question"]
+        state["messages"].append(AIMessage(f"{question} -> {question} (unchanged, the chat history is not needed)"))
+        return state
+
+    def _build_prompt(self, state: AgentState) -> PromptValue:
+        """
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            PromptValue: the prompt used to contextualize the user's query
         """
         question = state["original_question"]
         history = state["history"]
 
-        prompt = PromptTemplate.from_template(self._prompt).invoke({"question": question, "history": history})
+        return PromptTemplate.from_template(self._prompt).invoke({"question": question, "history": history})
 
-        question_with_history_context = self._llm.invoke(prompt).content.strip()
+    def _update_state(self, state: AgentState, response: BaseMessage) -> AgentState:
+        """
+        Parameters:
+            state (AgentState): the graph state
+            response (BaseMessage): the LLM response
+
+        Returns:
+            AgentState: the updated graph state
+        """
+        question = state["original_question"]
+        question_with_history_context = response.content.strip()
 
         state["messages"].append(AIMessage(f"{question} -> {question_with_history_context}"))
         state["original_question"] = question_with_history_context
         state["question"] = question_with_history_context
 
-        return state 
\ No newline at end of file
+        return state
+
+    def summarize(self, state: AgentState) -> AgentState:
+        """
+        Use the chat history to write a user's query contextualize with the chat history
+
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            AgentState: the updated graph state
+        """
+        if self._skip(state):
+            return self._unchanged(state)
+        return self._update_state(state, self._llm.invoke(self._build_prompt(state)))
+
+    async def asummarize(self, state: AgentState) -> AgentState:
+        """
+        Asynchronous version of **summarize**
+
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            AgentState: the updated graph state
+        """
+        if self._skip(state):
+            return self._unchanged(state)
+        return self._update_state(state, await self._llm.ainvoke(self._build_prompt(state)))
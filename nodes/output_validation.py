@@ -1,6 +1,8 @@
 from langchain_core.language_models.chat_models import BaseChatModel
 from utils.state import AgentState
 from langchain.prompts import PromptTemplate
+from langchain_core.prompt_values import PromptValue
+from langchain_core.messages import BaseMessage
 
 class AnswerValidation:
     """
@@ -15,25 +17,53 @@ class AnswerValidation:
         self._llm = llm
         self._prompt = prompt
 
-    def validate(self, state: AgentState) -> AgentState:
+    def _build_prompt(self, state: AgentState) -> PromptValue:
         """
-        check for hallucinations in the previous message
-
         Parameters:
             state (AgentState): the graph state
 
         Returns:
-            AgentState: the updated graph state
+            PromptValue: the prompt used to check the previous message
         """
         question = state['original_question']
         context = state['context']
         answer = state['messages'][-1].content
-        prompt = PromptTemplate.from_template(self._prompt).invoke({"question":question, "context": context, "answer": answer})
-        response = self._llm.invoke(prompt)
+        return PromptTemplate.from_template(self._prompt).invoke({"question":question, "context": context, "answer": answer})
+
+    def _update_state(self, state: AgentState, response: BaseMessage) -> AgentState:
+        """
+        Parameters:
+            state (AgentState): the graph state
+            response (BaseMessage): the LLM response
 
+        Returns:
+            AgentState: the updated graph state
+        """
         if "pass" not in response.content.lower():
             state['messages'].append(response)
 
         return state
-    
 
+    def validate(self, state: AgentState) -> AgentState:
+        """
+        check for hallucinations in the previous message
+
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            AgentState: the updated graph state
+        """
+        return self._update_state(state, self._llm.invoke(self._build_prompt(state)))
+
+    async def avalidate(self, state: AgentState) -> AgentState:
+        """
+        Asynchronous version of **validate**
+
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            AgentState: the updated graph state
+        """
+        return self._update_state(state, await self._llm.ainvoke(self._build_prompt(state)))
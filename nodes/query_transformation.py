@@ -2,7 +2,8 @@
 from utils.state import AgentState
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain.prompts import PromptTemplate
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.prompt_values import PromptValue
 from typing import Dict, Any
 
 class QueryTransform:
@@ -38,25 +39,78 @@ class QueryTransform:
             raise NotImplementedError(f"Query transformation {strategy} is not supported")
 
     
-    def transform(self, state: AgentState) -> AgentState:
+    def _build_prompt(self, state: AgentState) -> PromptValue:
         """
-        Rewrite the user's query using query transformation technique
-
         Parameters:
             state (AgentState): the graph state
 
         Returns:
-            AgentState: the updated graph state
+            PromptValue: the prompt used to rewrite the user's query
         """
         if not self._prompt:
             raise Exception("Query transformation prompt not Found")
         
         question = state["original_question"]
 
-        prompt = PromptTemplate.from_template(self._prompt).invoke({"max_char": self._max_char, "question": question})
+        return PromptTemplate.from_template(self._prompt).invoke({"max_char": self._max_char, "question": question})
+
+    def get_response(self, state: AgentState) -> BaseMessage:
+        """
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            BaseMessage: the LLM response, without updating the graph state (see **update_state**, used to combine nodes e.g. ValidateAndTransform)
+        """
+        return self._llm.invoke(self._build_prompt(state))
+
+    async def aget_response(self, state: AgentState) -> BaseMessage:
+        """
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            BaseMessage: the LLM response, without updating the graph state (asynchronous version of **get_response**)
+        """
+        return await self._llm.ainvoke(self._build_prompt(state))
 
-        rewritten_question = self._llm.invoke(prompt).content.strip()
+    def update_state(self, state: AgentState, response: BaseMessage) -> AgentState:
+        """
+        Update the graph state with a response of **get_response**/**aget_response**
+
+        Parameters:
+            state (AgentState): the graph state
+            response (BaseMessage): the LLM response
+
+        Returns:
+            AgentState: the updated graph state
+        """
+        question = state["original_question"]
+        rewritten_question = response.content.strip()
         state["messages"].append(AIMessage(f"\"{question}\" -> {rewritten_question}"))
         state["question"] = rewritten_question
         return state
-        
+    
+    def transform(self, state: AgentState) -> AgentState:
+        """
+        Rewrite the user's query using query transformation technique
+
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            AgentState: the updated graph state
+        """
+        return self.update_state(state, self.get_response(state))
+
+    async def atransform(self, state: AgentState) -> AgentState:
+        """
+        Asynchronous version of **transform**
+
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            AgentState: the updated graph state
+        """
+        return self.update_state(state, await self.aget_response(state))
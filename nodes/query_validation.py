@@ -1,7 +1,8 @@
 from langchain_core.language_models.chat_models import BaseChatModel
 from typing import List, Literal
 from langchain.prompts import PromptTemplate
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.prompt_values import PromptValue
 from utils.state import AgentState
 
 class QueryValidation:
@@ -19,22 +20,76 @@ class QueryValidation:
         self._prompt = prompt
         self._topics = topics
 
-    def validate(self, state: AgentState) -> AgentState:
+    def _build_prompt(self, state: AgentState) -> PromptValue:
         """
-        Checks if the user's query is related to provided topics
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            PromptValue: the prompt used to validate the user's query
+        """
+        question = state["original_question"]
+        prompt_template = PromptTemplate.from_template(self._prompt)
+        return prompt_template.invoke({"question": question, "topics": self._topics})
+
+    def get_response(self, state: AgentState) -> BaseMessage:
+        """
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            BaseMessage: the LLM response, without updating the graph state (see **update_state**, used to combine nodes e.g. ValidateAndTransform)
+        """
+        return self._llm.invoke(self._build_prompt(state))
+
+    async def aget_response(self, state: AgentState) -> BaseMessage:
+        """
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            BaseMessage: the LLM response, without updating the graph state (asynchronous version of **get_response**)
+        """
+        return await self._llm.ainvoke(self._build_prompt(state))
+
+    def update_state(self, state: AgentState, response: BaseMessage) -> AgentState:
+        """
+        Update the graph state with a response of **get_response**/**aget_response**
 
         Parameters:
             state (AgentState): the graph state
+            response (BaseMessage): the LLM response
 
         Returns:
             AgentState: the updated graph state
         """
         question = state["original_question"]
-        prompt_template = PromptTemplate.from_template(self._prompt)
-        prompt = prompt_template.invoke({"question": question, "topics": self._topics})
-        response = self._llm.invoke(prompt)
         state["messages"].append(AIMessage(f"Is \"{question}\" related with at least one of this topics {self._topics}? {response.content}"))
         return state
+
+    def validate(self, state: AgentState) -> AgentState:
+        """
+        Checks if the user's query is related to provided topics
+
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            AgentState: the updated graph state
+        """
+        return self.update_state(state, self.get_response(state))
+
+    async def avalidate(self, state: AgentState) -> AgentState:
+        """
+        Asynchronous version of **validate**
+
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            AgentState: the updated graph state
+        """
+        return self.update_state(state, await self.aget_response(state))
         
 
 def is_related(state: AgentState) -> Literal["yes", "no"]:
@@ -1,93 +1,281 @@
-from utils.state import AgentState
-from typing import List
+from utils.state import AgentState, Chunk, chunk_key, content_hash
+from typing import List, Dict, Union, Tuple
 from langchain.prompts import PromptTemplate
+from concurrent.futures import ThreadPoolExecutor, wait
 import numpy as np
+import contextvars
+import asyncio
+import math
 from langchain_core.messages import AIMessage
-from utils.llm import LLMModel
+from utils.llm import LLMModel, is_provider_error
 from utils.embedding import EmbeddingModel
-from typing import Dict
+from langchain_core.caches import BaseCache
 
 class Reranking:
     """
     The Reranking Node
     """
-    def __init__(self, strategies: List[str], weights: List[float], options: Dict[str, Dict[str, str]], prompts: Dict[str, str]):
+    def __init__(self, strategies: List[str], weights: List[float], options: Dict[str, Dict[str, str]], prompts: Dict[str, str], llm_cache: Union[BaseCache, None] = None):
         """
         Attributes:
             stategies (List[str]): a list of string representing the reranking strategies to apply (e.g. ["semantic", "distance"])
             weights (List[float]): a list of float representing the weight for each strategy. **It must sum up to 1**
             options: (Dict[str, Dict[str, str]]): a dictionary that for each stratety, contains the respective parameters
             prompts: (Dict[str, str]): a dictionary containing the prompts
+            llm_cache (Union[BaseCache, None]): an optional response cache for the semantic strategy grades
+
+        Raises:
+            NotImplementedError: if the distance metric is not supported
         """
         self._options = options
         self._prompts = prompts
         self._strategies = strategies
         self._weights = weights
 
-    def _calculate_semantic_score(self, question: str, chunks: List[str]) -> List[float]:
+        # The grading LLM is instantiated once and reused for every call
+        self._llm = None
+        if "semantic" in self._strategies:
+            if not self._prompts.get("reranking"):
+                raise Exception("Reranking prompt not Found")
+            llm_config = self._options.get("semantic")
+            if not llm_config:
+                raise Exception("Semantic llm options not Found")
+            self._llm = LLMModel(llm_config).get(cache=llm_cache)
+            # maximum number of grading requests in flight at the same time
+            self._max_concurrency = llm_config.get("max_concurrency", 4)
+            # seconds to wait for a single grade before falling back to the default score
+            self._timeout = llm_config.get("timeout", 30)
+            self._default_score = llm_config.get("default_score", 0)
+            # The grading threads of the synchronous version, shared by all the calls: a grade that times out
+            # cannot be cancelled and keeps its worker busy, so at most max_concurrency calls run at the same time
+            self._executor = ThreadPoolExecutor(max_workers=self._max_concurrency, thread_name_prefix="reranking")
+
+        # The embedding model is loaded once and reused for the whole node lifetime
+        self._embedding_model = None
+        if "distance" in self._strategies:
+            embedding_config = self._options.get("distance")
+            if not embedding_config:
+                raise Exception("Distance embedding options not Found")
+            self._embedding_model = EmbeddingModel(embedding_config).get()
+            # l2 -> 1 / (1 + euclidean distance), cosine -> (1 + cosine similarity) / 2, ip -> (1 + inner product) / 2 (for normalized vectors)
+            self._metric = embedding_config.get("metric", "l2")
+            if self._metric not in ["l2", "cosine", "ip"]:
+                raise NotImplementedError(f"distance metric {self._metric} not supported")
+            # Reuse the vectors stored in the index, only valid when the index was built with the same embedding model
+            self._use_stored_vectors = embedding_config.get("use_stored_vectors", True)
+
+    def _parse_grade(self, grade: str) -> float:
+        """
+        Convert the LLM grade to a float, using the default score when the grade is not a finite number
+
+        Parameters:
+            grade (str): the content of the LLM response
+
+        Returns:
+            float: the parsed score
         """
-        For each chunk, it calculates the semantic score for a provided question
+        try:
+            score = float(grade)
+        except (ValueError, TypeError):
+            # TypeError: the content of some providers is a list of content blocks, not a string
+            return self._default_score
+        # float() also parses "nan" and "inf", which would make the weighted average nan or inf
+        return score if math.isfinite(score) else self._default_score
+
+    def _calculate_semantic_score(self, question: str, chunks: List[Chunk]) -> List[float]:
+        """
+        For each chunk, it calculates the semantic score for a provided question.
+        The chunks are graded by the thread pool of the node (max_concurrency threads), a blocking call cannot be cancelled,
+        so the batch waits at most timeout seconds for each round of max_concurrency grades (the time the asynchronous
+        version needs in the worst case), the chunks not graded by then get the default score
 
         Parameters:
             question (str): the question used to calculate the score
-            chunks (List[str]): a list of chunks to evaluate
+            chunks (List[Chunk]): a list of chunks to evaluate
         
         Returns:
             List[float]: the calculated scores
+
+        Raises:
+            Exception: the error of a grade that failed for a reason other than a timeout or a provider error
         """
+        prompt_template = PromptTemplate.from_template(self._prompts["reranking"])
+        prompts = [prompt_template.invoke({"question": question, "chunk": chunk["content"]}) for chunk in chunks]
+        if not prompts:
+            return []
+
+        # Each call runs in a copy of the caller context (e.g. the metrics of the running node)
+        futures = [self._executor.submit(contextvars.copy_context().run, self._llm.invoke, prompt) for prompt in prompts]
+        wait(futures, timeout=self._timeout * math.ceil(len(futures) / self._max_concurrency))
+
         scores = []
-        prompt_template = self._prompts.get("reranking")
-        if not prompt_template:
-            raise Exception("Reranking prompt not Found")
+        for future in futures:
+            # The grades not started are cancelled (no effect on a completed grade), the ones still running are abandoned
+            future.cancel()
+            if future.cancelled() or not future.done():
+                # A slow grade must not stall the whole graph
+                scores.append(self._default_score)
+            elif future.exception() is not None:
+                # A failed grade neither, unless it is a programming error
+                if not is_provider_error(future.exception()):
+                    raise future.exception()
+                scores.append(self._default_score)
+            else:
+                scores.append(self._parse_grade(future.result().content))
+        return scores
+
+    async def _acalculate_semantic_score(self, question: str, chunks: List[Chunk]) -> List[float]:
+        """
+        For each chunk, it calculates the semantic score for a provided question.
+        The chunks are graded concurrently, with at most max_concurrency requests in flight,
+        a chunk that is not graded within the timeout gets the default score
+
+        Parameters:
+            question (str): the question used to calculate the score
+            chunks (List[Chunk]): a list of chunks to evaluate
         
-        llm_config = self._options.get("semantic")
+        Returns:
+            List[float]: the calculated scores
 
-        if not llm_config:
-            raise Exception("Semantic llm options not Found")
+        Raises:
+            Exception: the error of a grade that failed for a reason other than a timeout or a provider error
+        """
+        prompt_template = PromptTemplate.from_template(self._prompts["reranking"])
+        semaphore = asyncio.Semaphore(self._max_concurrency)
 
-        llm = LLMModel(llm_config).get()
+        async def grade(chunk: Chunk) -> float:
+            prompt = prompt_template.invoke({"question": question, "chunk": chunk["content"]})
+            async with semaphore:
+                try:
+                    response = await asyncio.wait_for(self._llm.ainvoke(prompt), timeout=self._timeout)
+                except Exception as e:
+                    # A slow or failed grade must not stall the whole graph, unless it is a programming error
+                    if not is_provider_error(e):
+                        raise
+                    return self._default_score
+            return self._parse_grade(response.content)
 
-        for chunk in chunks:
-            prompt = PromptTemplate.from_template(prompt_template).invoke({"question": question, "chunk": chunk})
-            grade = llm.invoke(prompt).content
-            try:
-                scores.append(float(grade))
-            except:
-                scores.append(0)
-        
-        return scores
+        return list(await asyncio.gather(*(grade(chunk) for chunk in chunks)))
+
+    def _similarity(self, question_emb: np.ndarray, chunks_emb: np.ndarray) -> np.ndarray:
+        """
+        Compare the question embedding against all the chunk embeddings at once, using the configured metric
+
+        Parameters:
+            question_emb (np.ndarray): the question embedding, with shape (dim,)
+            chunks_emb (np.ndarray): the chunk embeddings, with shape (n_chunks, dim)
+
+        Returns:
+            np.ndarray: the similarity score for each chunk, with shape (n_chunks,)
+        """
+        if self._metric == "l2":
+            distances = np.linalg.norm(chunks_emb - question_emb, axis=1)
+            # close to 1 -> Good matching, close to 0 -> Bad matching
+            return 1 / (1 + distances)
+
+        dot_products = chunks_emb @ question_emb
+        if self._metric == "ip":
+            # Equivalent to the cosine similarity when the embedding model returns normalized vectors, mapped
+            # to [0, 1] as the cosine, the raw inner product of other vectors is unbounded so it is clipped
+            return np.clip((1 + dot_products) / 2, 0, 1)
+
+        norms = np.linalg.norm(chunks_emb, axis=1) * np.linalg.norm(question_emb)
+        cosine = dot_products / np.maximum(norms, np.finfo(np.float32).eps)
+        # Map the cosine similarity from [-1, 1] to [0, 1]
+        return (1 + cosine) / 2
     
-    def _calculate_distance_score(self, question: str, chunks: List[str]):
+    def _calculate_distance_score(self, question: str, chunks: List[Chunk]) -> List[float]:
         """
-        For each chunk, it calculates the distance score from a provided question
+        For each chunk, it calculates the distance score from a provided question.
+        When the chunks carry the vectors stored in the index, they are not embedded again
 
         Parameters:
             question (str): the question used to calculate the score
-            chunks (List[str]): a list of chunks to evaluate
+            chunks (List[Chunk]): a list of chunks to evaluate
         
         Returns:
             List[float]: the calculated scores
         """
-        embedding_config = self._options.get("distance")
+        if not chunks:
+            return []
 
-        if not embedding_config:
-            raise Exception("Distance embedding options not Found")
+        question_emb = np.array(self._embedding_model.embed_query(question))
 
-        embedding_model = EmbeddingModel(embedding_config).get()
+        stored_vectors = None
+        if self._use_stored_vectors and all(chunk["vector"] is not None for chunk in chunks):
+            stored_vectors = np.array([chunk["vector"] for chunk in chunks])
+            # Vectors coming from a different embedding space can not be compared with the question
+            if stored_vectors.shape != (len(chunks), question_emb.shape[0]):
+                stored_vectors = None
 
-        question_emb = np.array(embedding_model.embed_query(question))
-        scores = []
-        for chunk in chunks:
-            chunk_emb = np.array(embedding_model.embed_query(chunk))
-            distance = np.linalg.norm(question_emb - chunk_emb)
-            # close to 1 -> Good matching, close to 0 -> Bad matching
-            scores.append((1 / (1 + distance)))
-            
-        return scores
+        if stored_vectors is not None:
+            chunks_emb = stored_vectors
+        else:
+            # A single batched call instead of one embedding call per chunk
+            chunks_emb = np.array(self._embedding_model.embed_documents([chunk["content"] for chunk in chunks]))
+
+        return self._similarity(question_emb, chunks_emb).tolist()
+
+    def _new_chunks(self, state: AgentState) -> Tuple[List[str], List[str], List[Chunk]]:
+        """
+        Remove the duplicate chunks from the state and find the chunks that were not reranked for the question in a previous retrieval loop
+
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            Tuple[List[str], List[str], List[Chunk]]: the memo key of each chunk, and the keys and the chunks to score
+        """
+        memo = state["score_memo"] or {}
+        question = content_hash(state["original_question"])
+        # The same chunk can be returned by more than one tool in the same loop, it is kept once
+        # (the first occurrence), otherwise its copies would take more than one slot of the selection
+        chunks = {}
+        for chunk in state["chunks"]:
+            chunks.setdefault(f"{question}:{chunk_key(chunk)}", chunk)
+        state["chunks"] = list(chunks.values())
+        keys = list(chunks)
+        new_keys = [key for key in keys if key not in memo]
+        return keys, new_keys, [chunks[key] for key in new_keys]
+
+    def _update_state(self, state: AgentState, keys: List[str], new_keys: List[str], scores_per_strategy: List[List[float]]) -> AgentState:
+        """
+        Store the weighted average of the scores calculated by each strategy, merged with the memoized scores
+
+        Parameters:
+            state (AgentState): the graph state
+            keys (List[str]): the memo key of each chunk
+            new_keys (List[str]): the memo key of each scored chunk
+            scores_per_strategy (List[List[float]]): for each strategy, the score of each scored chunk
+
+        Returns:
+            AgentState: the updated graph state
+
+        Raises:
+            ValueError: if the reranking weights do not sum up to 1
+        """
+        # Numpy arrays for fast computation and built-in methods
+        matrix = np.array(scores_per_strategy)
+        weights = np.array(self._weights)
+
+        if weights.sum() != 1:
+            raise ValueError("reranking weights must sum to 1")
+
+        memo = dict(state["score_memo"] or {})
+        if new_keys:
+            # Weighted Average on all strategies
+            memo.update(zip(new_keys, np.average(matrix, axis=0, weights=weights).tolist()))
+        final_score = [memo[key] for key in keys]
+        
+        state["messages"].append(AIMessage(f"weighted average score between all reranking techniques: {final_score} ({len(new_keys)} chunks scored, {len(keys) - len(new_keys)} already scored)"))
+        state["reranking_score"] = final_score
+        state["score_memo"] = memo
+
+        return state
 
     def rerank(self, state: AgentState) -> AgentState:
         """
-        Calculate the weighted average chunk's score 
+        Calculate the weighted average chunk's score, the chunks already reranked for the question in a previous loop are not scored again
 
         Parameters:
             state (AgentState): the graph state
@@ -101,9 +289,9 @@ class Reranking:
         """
         question = state["original_question"]
         scores_per_strategy = []
-        chunks = state["chunks"]
-        # Calculate score for each strategy
-        for strategy in self._strategies:
+        keys, new_keys, chunks = self._new_chunks(state)
+        # Calculate score for each strategy (nothing to score when all the chunks were already reranked)
+        for strategy in self._strategies if chunks else []:
             if strategy == "semantic":
                 scores_per_strategy.append(self._calculate_semantic_score(question, chunks))
             elif strategy == "distance":
@@ -111,17 +299,35 @@ class Reranking:
             else:
                 raise NotImplementedError(f"reranking strategy {strategy} not supported")
 
-        # Numpy arrays for fast computation and built-in methods
-        matrix = np.array(scores_per_strategy)
-        weights = np.array(self._weights)
+        return self._update_state(state, keys, new_keys, scores_per_strategy)
 
-        if weights.sum() != 1:
-            raise ValueError("reranking weights must sum to 1")
+    async def arerank(self, state: AgentState) -> AgentState:
+        """
+        Asynchronous version of **rerank**, the strategies are calculated concurrently
+
+        Parameters:
+            state (AgentState): the graph state
 
-        # Weighted Average on all strategies
-        final_score = np.average(matrix, axis=0, weights=weights).tolist()
+        Returns:
+            AgentState: the updated graph state
         
-        state["messages"].append(AIMessage(f"weighted average score between all reranking techniques: {final_score}"))
-        state["reranking_score"] = final_score
+        Raises:
+            NotImplementedError: if the reranking strategy is not supported
+            ValueError: if the reranking weights do not sum up to 1
+        """
+        question = state["original_question"]
+        tasks = []
+        keys, new_keys, chunks = self._new_chunks(state)
+        # Calculate score for each strategy (nothing to score when all the chunks were already reranked)
+        for strategy in self._strategies if chunks else []:
+            if strategy == "semantic":
+                tasks.append(self._acalculate_semantic_score(question, chunks))
+            elif strategy == "distance":
+                # The embedding model is blocking, so it runs in a worker thread
+                tasks.append(asyncio.to_thread(self._calculate_distance_score, question, chunks))
+            else:
+                raise NotImplementedError(f"reranking strategy {strategy} not supported")
+
+        scores_per_strategy = list(await asyncio.gather(*tasks))
 
-        return state
\ No newline at end of file
+        return self._update_state(state, keys, new_keys, scores_per_strategy)
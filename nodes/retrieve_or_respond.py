@@ -3,6 +3,7 @@ from typing import List
 from langchain.prompts import PromptTemplate
 from utils.state import AgentState
 from langchain_core.messages import AnyMessage
+from langchain_core.prompt_values import PromptValue
 
 def _get_past_tool_calls(messages: List[AnyMessage]) -> str:
     """
@@ -35,6 +36,19 @@ class Retrieve_Respond:
         self._llm = llm
         self._prompt = prompt
     
+    def _build_prompt(self, state: AgentState) -> PromptValue:
+        """
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            PromptValue: the prompt used to choose between retrieving and responding
+        """
+        question = state["original_question"]
+        context = state["context"]
+        past_tool_calls = _get_past_tool_calls(state["messages"])
+        return PromptTemplate.from_template(self._prompt).invoke({"question": question, "context": context, "past_tool_calls": past_tool_calls})
+    
     def choose(self, state: AgentState) -> AgentState:
         """
         This method define the retrieve or respond choise process
@@ -45,10 +59,20 @@ class Retrieve_Respond:
         Returns:
             AgentState: the update graph state
         """
-        question = state["original_question"]
-        context = state["context"]
-        past_tool_calls = _get_past_tool_calls(state["messages"])
-        prompt = PromptTemplate.from_template(self._prompt).invoke({"question": question, "context": context, "past_tool_calls": past_tool_calls})
-        response = self._llm.invoke(prompt)
+        response = self._llm.invoke(self._build_prompt(state))
+        state["messages"].append(response)
+        return state
+
+    async def achoose(self, state: AgentState) -> AgentState:
+        """
+        Asynchronous version of **choose**
+
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            AgentState: the update graph state
+        """
+        response = await self._llm.ainvoke(self._build_prompt(state))
         state["messages"].append(response)
-        return state
\ No newline at end of file
+        return state
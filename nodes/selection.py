@@ -1,5 +1,5 @@
 from typing import List, Dict, Any, Tuple
-from utils.state import AgentState
+from utils.state import AgentState, Chunk, content_hash
 from langchain_core.messages import AIMessage
 
 class ChunckSelection:
@@ -15,12 +15,12 @@ class ChunckSelection:
         self._strategies = strategies
         self._options = options
 
-    def _selection_by_threshold(self, chunks: List[str], scores: List[float], options: Dict[str, Any]) -> Tuple[List[str], List[float]]:
+    def _selection_by_threshold(self, chunks: List[Chunk], scores: List[float], options: Dict[str, Any]) -> Tuple[List[Chunk], List[float]]:
         """
         Given a list of chunks and the respective scores, this function selects only the chuncks with a score higher greater or equal to a threshold
 
         Parameters:
-            chunks (List[str]): a list of chunks
+            chunks (List[Chunk]): a list of chunks
             scores (List[float]): the score for each chunk
             options (Dict[str, Any]): contains the options for this strategy
         
@@ -40,12 +40,12 @@ class ChunckSelection:
                 selected_scores.append(scores[i])
         return selected_chunks, selected_scores
 
-    def _selection_by_topk(self, chunks: List[str], scores: List[float], options: Dict[str, Any]) -> Tuple[List[str], List[float]]:
+    def _selection_by_topk(self, chunks: List[Chunk], scores: List[float], options: Dict[str, Any]) -> Tuple[List[Chunk], List[float]]:
         """
         Given a list of chunks and the respective scores, this function selects the top k chuncks with the highest scores
 
         Parameters:
-            chunks (List[str]): a list of chunks
+            chunks (List[Chunk]): a list of chunks
             scores (List[float]): the score for each chunk
             options (Dict[str, Any]): contains the options for this strategy
         
@@ -81,6 +81,13 @@ class ChunckSelection:
         chunks = state['chunks']
         scores = state['reranking_score']
 
+        # The chunks selected in a previous retrieval loop are already in the context, only the new ones compete for the selection
+        # (the chunks rejected in a previous loop compete again, with their memoized score, see Reranking)
+        in_context = set(state.get("context_hashes") or [])
+        if in_context:
+            kept = [i for i, chunk in enumerate(chunks) if content_hash(chunk["content"]) not in in_context]
+            chunks, scores = [chunks[i] for i in kept], [scores[i] for i in kept]
+
         for strategy in self._strategies:
             if strategy == "threshold":
                 strategy_option = self._options.get("threshold")
@@ -92,8 +99,10 @@ class ChunckSelection:
                 raise NotImplementedError(f"selection strategy {strategy} not supported")
         
         state["messages"].append(AIMessage(f"{len(chunks)} chunks selected"))
-        state["chunks"] = chunks
-        state["reranking_score"] = None
+        # The stored vectors are only needed for reranking, drop them to keep the state compact
+        state["chunks"] = [Chunk(**{**chunk, "vector": None}) for chunk in chunks]
+        # The scores of the selected chunks are kept, the context is packed in score order (see UpdateContext)
+        state["reranking_score"] = scores
 
         return state
 
@@ -4,6 +4,7 @@ from langchain_core.tools import BaseTool
 from langchain.prompts import PromptTemplate
 from utils.state import AgentState
 from langchain_core.messages import AnyMessage, AIMessage
+from langchain_core.prompt_values import PromptValue
 
 class ToolRouting:
     """
@@ -20,6 +21,17 @@ class ToolRouting:
         self._llm = llm.bind_tools(tools)
         self._prompt = prompt
 
+    def _build_prompt(self, state: AgentState) -> PromptValue:
+        """
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            PromptValue: the prompt used to choose the tools to call
+        """
+        past_tool_calls = _get_past_tool_calls(state["messages"])
+        return PromptTemplate.from_template(self._prompt).invoke({"tools": past_tool_calls, "query": state["question"]})
+
     def route(self, state: AgentState) -> AgentState:
         """
         This method check the last message and based on it decide which tool to call
@@ -31,11 +43,28 @@ class ToolRouting:
             AgentState: the updated graph state
         """
         last_msg = state["messages"][-1]
-        past_tool_calls = _get_past_tool_calls(state["messages"])
 
         if "retrieve" in last_msg.content.lower():
-            prompt = PromptTemplate.from_template(self._prompt).invoke({"tools": past_tool_calls, "query": state["question"]})
-            response = self._llm.invoke(prompt)
+            response = self._llm.invoke(self._build_prompt(state))
+            state["messages"].append(response)
+        else: 
+            state["messages"].append(AIMessage("No tools to call, routing to the generate answer node"))
+        return state
+
+    async def aroute(self, state: AgentState) -> AgentState:
+        """
+        Asynchronous version of **route**
+
+        Parameters:
+            state (AgentState): the graph state
+        
+        Returns:
+            AgentState: the updated graph state
+        """
+        last_msg = state["messages"][-1]
+
+        if "retrieve" in last_msg.content.lower():
+            response = await self._llm.ainvoke(self._build_prompt(state))
             state["messages"].append(response)
         else: 
             state["messages"].append(AIMessage("No tools to call, routing to the generate answer node"))
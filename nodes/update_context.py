@@ -1,28 +1,136 @@
-from utils.state import AgentState
+from utils.state import AgentState, Chunk, content_hash
+from utils.tokens import count_tokens
 from langchain_core.messages import AIMessage
+from typing import List, Set, Union
+import re
 
-def update_context(state: AgentState) -> AgentState:
-    """
-    Merge chunks into a single context string
+# The chunks are separated by an empty line in the context
+_SEPARATOR = "\n\n"
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.findall(r"\w+", text.lower()))
 
+
+def _shingles(text: str, size: int = 3) -> Set[str]:
+    """
     Parameters:
-        state (AgentState): the graph state
+        text (str): a normalized text
+        size (int): the number of words of each shingle
 
     Returns:
-        AgentState: the updated graph state
+        Set[str]: the sequences of size consecutive words of the text
     """
-    new_context = ""
+    words = text.split()
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class UpdateContext:
+    """
+    The Context Update Node: packs the selected chunks into the context, without duplicates and within a token budget
+    """
+    def __init__(self, max_tokens: Union[int, None] = None, near_duplicate_threshold: float = 0.8, tokenizer: Union[str, None] = None):
+        """
+        Attributes:
+            max_tokens (Union[int, None]): the maximum number of tokens of the context sent to the LLMs (None -> no limit)
+            near_duplicate_threshold (float): a chunk is dropped when this fraction of its text (3-word shingles) is already in the context (1 -> only exact duplicates)
+            tokenizer (Union[str, None]): the tiktoken encoding counting the tokens (None -> estimated from the characters, see utils/tokens.py)
+        """
+        self._max_tokens = max_tokens
+        self._near_duplicate_threshold = near_duplicate_threshold
+        self._tokenizer = tokenizer
+
+    def _is_near_duplicate(self, shingles: Set[str], context_shingles: Set[str]) -> bool:
+        if not shingles or self._near_duplicate_threshold >= 1:
+            return False
+        return len(shingles & context_shingles) / len(shingles) >= self._near_duplicate_threshold
+
+    @staticmethod
+    def _order(chunks: List[Chunk], scores: Union[List[float], None]) -> List[Chunk]:
+        """
+        Sort the chunks from the most to the least relevant, so that the budget is spent on the best ones first
+
+        Parameters:
+            chunks (List[Chunk]): the new chunks
+            scores (Union[List[float], None]): the reranking score of each chunk (None without reranking)
+
+        Returns:
+            List[Chunk]: the chunks by decreasing reranking score, or by their rank in the results of their tool
+                when there are no scores (the best match of every tool first)
+        """
+        if scores is not None and len(scores) == len(chunks):
+            indices = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)
+        else:
+            # The tools results are concatenated, their ranks are interleaved (the sort is stable, ties keep the tools order)
+            indices = sorted(range(len(chunks)), key=lambda i: chunks[i].get("rank", 0))
+        return [chunks[i] for i in indices]
+
+    def _pack(self, state: AgentState, chunks: List[Chunk]) -> tuple:
+        """
+        Add the chunks to the context, in the given order, skipping the duplicates
+        and the chunks that do not fit in the remaining budget
+
+        Parameters:
+            state (AgentState): the graph state
+            chunks (List[Chunk]): the new chunks
+
+        Returns:
+            tuple: the number of added, duplicate and over budget chunks, and the tokens of the dropped chunks
+        """
+        hashes = list(state["context_hashes"] or [])
+        context = state["context"]
+        context_shingles = _shingles(_normalize(context)) if context else set()
+        used = count_tokens(context, self._tokenizer)
+        added, duplicates, over_budget, saved = 0, 0, 0, 0
+
+        for chunk in chunks:
+            normalized = _normalize(chunk["content"])
+            digest = content_hash(chunk["content"])
+            tokens = count_tokens(chunk["content"], self._tokenizer)
+            shingles = _shingles(normalized)
+            if digest in hashes or self._is_near_duplicate(shingles, context_shingles):
+                duplicates += 1
+                saved += tokens
+                continue
+            cost = tokens + (count_tokens(_SEPARATOR, self._tokenizer) if context else 0)
+            if self._max_tokens is not None and used + cost > self._max_tokens:
+                over_budget += 1
+                saved += tokens
+                continue
+            context = f"{context}{_SEPARATOR}{chunk['content']}" if context else chunk["content"]
+            context_shingles |= shingles
+            hashes.append(digest)
+            used += cost
+            added += 1
+
+        state["context"] = context
+        state["context_hashes"] = hashes
+        return added, duplicates, over_budget, saved
+
+    def update_context(self, state: AgentState) -> AgentState:
+        """
+        Merge chunks into a single context string
 
-    message = None
+        Parameters:
+            state (AgentState): the graph state
 
-    if state["chunks"]:
-        new_context = "\n\n".join(state['chunks'])
-        message = AIMessage("Context Updated")
-        state["chunks"] = None
-        state['context'] = state['context'] + new_context
-    else:
-        message = AIMessage("No new Context")
+        Returns:
+            AgentState: the updated graph state
+        """
+        if state["chunks"]:
+            added, duplicates, over_budget, saved = self._pack(state, self._order(state["chunks"], state["reranking_score"]))
+            state["chunks"] = None
+            state["reranking_score"] = None
+            # The dropped tokens would have been sent to every following LLM call (retrieve_or_respond, answer and validation)
+            state["context_tokens_saved"] = (state["context_tokens_saved"] or 0) + saved
+            report = f"{added} chunks added, {duplicates} duplicates, {over_budget} over the token budget, {saved} tokens saved"
+            message = AIMessage(f"Context Updated: {report}" if added else f"No new Context: {report}")
+        else:
+            state["reranking_score"] = None
+            message = AIMessage("No new Context")
 
-    state['messages'].append(message)
+        state['messages'].append(message)
 
-    return state
\ No newline at end of file
+        return state
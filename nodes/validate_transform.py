@@ -0,0 +1,63 @@
+from nodes.query_validation import QueryValidation
+from nodes.query_transformation import QueryTransform
+from utils.state import AgentState
+import asyncio
+
+class ValidateAndTransform:
+    """
+    The Query Validation and Transformation Node.
+    It combines the Query Validation Node and the Query Transformation Node,
+    the two LLM calls are independent so they are executed concurrently
+    """
+    def __init__(self, validation: QueryValidation, transform: QueryTransform):
+        """
+        Attributes:
+            validation (QueryValidation): the node that checks if the user's query is related to the topics
+            transform (QueryTransform): the node that rewrites the user's query
+        """
+        self._validation = validation
+        self._transform = transform
+
+    def validate_and_transform(self, state: AgentState) -> AgentState:
+        """
+        Checks if the user's query is related to the topics and, only in that case, rewrites it
+
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            AgentState: the updated graph state, the last message is always the validation response (see **is_related**)
+        """
+        validation_response = self._validation.get_response(state)
+
+        if "yes" in validation_response.content.lower():
+            state = self._transform.update_state(state, self._transform.get_response(state))
+
+        # The validation message must be the last one, it is used by the is_related conditional edge
+        return self._validation.update_state(state, validation_response)
+
+    async def avalidate_and_transform(self, state: AgentState) -> AgentState:
+        """
+        Asynchronous version of **validate_and_transform**, the query transformation starts together with the validation,
+        and it is cancelled (or discarded) when the query is not related to the topics
+
+        Parameters:
+            state (AgentState): the graph state
+
+        Returns:
+            AgentState: the updated graph state, the last message is always the validation response (see **is_related**)
+        """
+        transform_task = asyncio.create_task(self._transform.aget_response(state))
+        try:
+            validation_response = await self._validation.aget_response(state)
+        except BaseException:
+            transform_task.cancel()
+            raise
+
+        if "yes" in validation_response.content.lower():
+            state = self._transform.update_state(state, await transform_task)
+        else:
+            transform_task.cancel()
+
+        # The validation message must be the last one, it is used by the is_related conditional edge
+        return self._validation.update_state(state, validation_response)
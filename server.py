@@ -0,0 +1,189 @@
+from pathlib import Path
+import json
+from utils.processing import stream_steps
+from utils.agent import build_agent
+from utils.metrics import build_metrics
+from utils.sessions import SessionStore, RequestLimiter
+from utils.history import build_chat_history
+from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.background import BackgroundTask
+from sse_starlette import EventSourceResponse
+from typing import Dict, Any, AsyncIterator
+import time
+import uvicorn
+
+# HTTP serving mode: the agent is compiled once and shared by all the sessions (see the "server" section of app_config.json)
+#
+#   POST   /chat                  {"message": str, "session_id": str (optional), "stream": bool (default true)}
+#                                 stream -> Server-Sent Events: "session", one "step" per executed node, "token" for each token of the answer
+#                                 (if "stream_tokens" is enabled), then "answer" (or "error")
+#                                 otherwise -> {"session_id", "steps", "answer"}
+#   DELETE /sessions/{session_id} drop the chat history of a session
+#   GET    /health                number of running/queued queries and of sessions
+#   GET    /metrics               per-node/tool metrics summary (see the "metrics" section of app_config.json)
+
+
+def _load_config() -> tuple:
+    # Load environment variables from .env file
+    load_dotenv("./.env")
+
+    # Check configuration files existence
+    if not Path("./config/app_config.json").exists():
+        raise FileNotFoundError("app_config.json not Found")
+
+    if not Path("./config/prompts.json").exists():
+        raise FileNotFoundError("prompts.json not Found")
+
+    with open("./config/app_config.json") as f:
+        app_config = json.load(f)
+
+    with open("./config/prompts.json") as f:
+        prompts = json.load(f)
+
+    return app_config, prompts
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette) -> AsyncIterator[None]:
+    app_config, prompts = _load_config()
+    server_config = app_config.get("server", {})
+
+    app.state.metrics = build_metrics(app_config.get("metrics", {}))
+
+    # Compile the graph to an agent, once for all the sessions
+    start = time.time()
+    app.state.agent = await build_agent(app_config, prompts, app.state.metrics)
+    end = time.time()
+    print(f"Agent compiled in {(end - start):.2f}s")
+
+    app.state.sessions = SessionStore(lambda: build_chat_history(app_config, prompts), server_config.get("max_sessions", 1000), server_config.get("session_ttl_s", 3600))
+    app.state.limiter = RequestLimiter(server_config.get("max_concurrency", 8), server_config.get("max_queue", 32), server_config.get("queue_timeout_s", 30))
+    app.state.retry_after = str(server_config.get("retry_after_s", 5))
+    app.state.stream_tokens = app_config.get("stream_tokens", False)
+    yield
+
+    if app.state.metrics is not None:
+        app.state.metrics.print_summary()
+        app.state.metrics.close()
+
+
+def _step_event(node: str, value: Dict[str, Any], elapsed: float) -> Dict[str, Any]:
+    last_msg = value["messages"][-1]
+    return {"node": node, "elapsed_s": round(elapsed, 3), "message_type": last_msg.type, "message": last_msg.content}
+
+
+async def chat(request: Request) -> Any:
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        return JSONResponse({"error": "invalid JSON body"}, status_code=400)
+    user_query = body.get("message") if isinstance(body, dict) else None
+    if not isinstance(user_query, str) or not user_query.strip():
+        return JSONResponse({"error": "message is required"}, status_code=400)
+
+    state = request.app.state
+    session = state.sessions.get(body.get("session_id"))
+    # The queries of a session are answered one at a time, the history of each query depends on the previous answer
+    if session.busy:
+        return JSONResponse({"error": "a query of this session is already running", "session_id": session.session_id}, status_code=409)
+
+    # The session is pinned while the query waits for a slot, the busy sessions are never evicted (see SessionStore)
+    session.busy = True
+    release = await state.limiter.acquire()
+    session.busy = False
+    if release is None:
+        return JSONResponse({"error": "server busy, retry later"}, status_code=503, headers={"Retry-After": state.retry_after})
+    # Fetched again, the session may have been deleted while the query was waiting (a new session with the same id is created)
+    # and another query of the new session may have started
+    session = state.sessions.get(session.session_id)
+    if session.busy:
+        release()
+        return JSONResponse({"error": "a query of this session is already running", "session_id": session.session_id}, status_code=409)
+    session.busy = True
+
+    history = session.chat_history.history()
+
+    finished = False
+    def finish() -> None:
+        nonlocal finished
+        if not finished:
+            finished = True
+            session.busy = False
+            session.last_used = time.monotonic()
+            release()
+
+    async def answer(stream_tokens: bool) -> AsyncIterator[tuple]:
+        # Yields the steps (and tokens), then the answer, the chat history is updated only if the agent answers
+        try:
+            last_msg = None
+            async for kind, node, value, elapsed in stream_steps(state.agent, user_query, history, stream_tokens):
+                if kind == "token":
+                    yield "token", {"token": value, "elapsed_s": round(elapsed, 3)}
+                    continue
+                last_msg = value["messages"][-1]
+                yield "step", _step_event(node, value, elapsed)
+            session.chat_history.add_turn(user_query, last_msg.content)
+            yield "answer", {"answer": last_msg.content}
+            # The turns leaving the window are summarized after the answer is sent, the session stays busy until then
+            await session.chat_history.acompact()
+        finally:
+            finish()
+
+    if not body.get("stream", True):
+        steps, answer_text = [], None
+        try:
+            async for event, data in answer(False):
+                if event == "step":
+                    steps.append(data)
+                else:
+                    answer_text = data["answer"]
+        except Exception as e:
+            return JSONResponse({"session_id": session.session_id, "steps": steps, "error": str(e)}, status_code=500)
+        return JSONResponse({"session_id": session.session_id, "steps": steps, "answer": answer_text})
+
+    async def events() -> AsyncIterator[Dict[str, str]]:
+        yield {"event": "session", "data": json.dumps({"session_id": session.session_id})}
+        try:
+            async for event, data in answer(state.stream_tokens):
+                yield {"event": event, "data": json.dumps(data)}
+        except Exception as e:
+            yield {"event": "error", "data": json.dumps({"error": str(e)})}
+
+    # The slot is released when the answer is complete or the client disconnects (finish can be called more than once)
+    return EventSourceResponse(events(), background=BackgroundTask(finish))
+
+
+async def delete_session(request: Request) -> JSONResponse:
+    deleted = request.app.state.sessions.delete(request.path_params["session_id"])
+    return JSONResponse({"deleted": deleted}, status_code=200 if deleted else 404)
+
+
+async def health(request: Request) -> JSONResponse:
+    state = request.app.state
+    return JSONResponse({"status": "ok", **state.limiter.stats(), "sessions": len(state.sessions)})
+
+
+async def metrics(request: Request) -> JSONResponse:
+    collector = request.app.state.metrics
+    return JSONResponse(collector.summary() if collector is not None else {})
+
+
+app = Starlette(
+    routes=[
+        Route("/chat", chat, methods=["POST"]),
+        Route("/sessions/{session_id}", delete_session, methods=["DELETE"]),
+        Route("/health", health, methods=["GET"]),
+        Route("/metrics", metrics, methods=["GET"])
+    ],
+    lifespan=lifespan
+)
+
+if __name__ == "__main__":
+    app_config, _ = _load_config()
+    server_config = app_config.get("server", {})
+    uvicorn.run(app, host=server_config.get("host", "127.0.0.1"), port=server_config.get("port", 8000))
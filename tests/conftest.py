@@ -0,0 +1,21 @@
+from pathlib import Path
+import sys
+
+# The modules are imported from the repository root (e.g. "from utils.state import AgentState"), as app.py and populate.py do
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest
+import utils.llm
+import utils.embedding
+from utils.registry import ModelRegistry
+
+
+@pytest.fixture
+def model_registries(monkeypatch):
+    """
+    Isolates the LLM and Embedding providers and model instances registered by a test (e.g. the fakes of benchmarks/fakes.py),
+    the process-wide registries are restored at the end of the test
+    """
+    for module in [utils.llm, utils.embedding]:
+        monkeypatch.setattr(module, "_PROVIDERS", dict(module._PROVIDERS))
+        monkeypatch.setattr(module, "_REGISTRY", ModelRegistry(module._REGISTRY._kind, module._REGISTRY._key_fields))
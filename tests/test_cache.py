@@ -0,0 +1,73 @@
+from utils.cache import LLMCache, MemoryCacheBackend, SQLiteCacheBackend
+from langchain_core.outputs import Generation
+import pytest
+
+
+class Clock:
+    """
+    A settable replacement of time.time
+    """
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("utils.cache.time.time", clock)
+    return clock
+
+
+def test_key_depends_on_prompt_and_llm_parameters():
+    key = LLMCache._key("prompt", "model=a,temperature=0")
+    assert key == LLMCache._key("prompt", "model=a,temperature=0")
+    assert key != LLMCache._key("other prompt", "model=a,temperature=0")
+    assert key != LLMCache._key("prompt", "model=a,temperature=1")
+
+
+def test_memory_backend_ttl(clock):
+    backend = MemoryCacheBackend(max_entries=10, ttl=60)
+    backend.set("key", "value")
+    clock.now += 59
+    assert backend.get("key") == "value"
+    clock.now += 2
+    assert backend.get("key") is None
+
+
+def test_memory_backend_without_ttl(clock):
+    backend = MemoryCacheBackend(max_entries=10)
+    backend.set("key", "value")
+    clock.now += 10 ** 9
+    assert backend.get("key") == "value"
+
+
+def test_memory_backend_evicts_the_least_recently_used():
+    backend = MemoryCacheBackend(max_entries=2)
+    backend.set("a", 1)
+    backend.set("b", 2)
+    backend.get("a")
+    backend.set("c", 3)
+    assert backend.get("a") == 1
+    assert backend.get("b") is None
+    assert backend.get("c") == 3
+
+
+def test_sqlite_backend_ttl(tmp_path, clock):
+    backend = SQLiteCacheBackend(str(tmp_path.joinpath("cache.sqlite")), max_entries=10, ttl=60)
+    backend.set("key", [Generation(text="cached")])
+    clock.now += 30
+    assert backend.get("key")[0].text == "cached"
+    clock.now += 31
+    assert backend.get("key") is None
+
+
+def test_llm_cache_hits_and_misses():
+    cache = LLMCache(MemoryCacheBackend())
+    assert cache.lookup("prompt", "llm") is None
+    cache.update("prompt", "llm", [Generation(text="answer")])
+    assert cache.lookup("prompt", "llm")[0].text == "answer"
+    assert cache.lookup("prompt", "other llm") is None
+    assert cache.stats() == {"hits": 1, "semantic_hits": 0, "misses": 2}
@@ -0,0 +1,108 @@
+from indexing.ingestion import ingest, remove_stale_stores
+from indexing.manifest import Manifest
+from indexing.vectorstore import VectorStore
+from langchain_core.embeddings import DeterministicFakeEmbedding
+import pytest
+
+EMBEDDING_SIZE = 16
+
+
+@pytest.fixture
+def embedding():
+    return DeterministicFakeEmbedding(size=EMBEDDING_SIZE)
+
+
+@pytest.fixture
+def files(tmp_path):
+    data_dir = tmp_path.joinpath("data")
+    data_dir.mkdir()
+    paths = []
+    for name in ["a", "b"]:
+        path = data_dir.joinpath(f"{name}.csv")
+        path.write_text("name,value\n" + "".join(f"{name}{i},{i}\n" for i in range(5)))
+        paths.append(str(path))
+    return paths
+
+
+def config(tmp_path, store_layout: str = "per_file", incremental: bool = True):
+    return {
+        "save_dir_path": str(tmp_path.joinpath("store")),
+        "chunking_strategy": "window",
+        "chunking_options": {"chunk_size": 100, "chunk_overlap": 0},
+        "embedding": {"embedding_provider": "fake", "embedding_model": "fake"},
+        "vector_store_type": "faiss",
+        "store_layout": store_layout,
+        "faiss_index": {"type": "flat"},
+        "ingestion": {"parallel": False, "incremental": incremental}
+    }
+
+
+def test_per_file_store_of_a_deleted_file_is_removed(tmp_path, files, embedding):
+    populate_config = config(tmp_path)
+    report = ingest(files, populate_config, embedding)
+    assert report.done == 2 and not report.failures
+    save_dir = tmp_path.joinpath("store")
+    assert sorted(dir.name for dir in save_dir.iterdir()) == ["a", "b"]
+
+    report = ingest(files[:1], populate_config, embedding)
+    assert report.skipped == 1
+    assert [dir.name for dir in save_dir.iterdir()] == ["a"]
+
+
+def test_chunks_of_a_deleted_file_are_removed_from_the_shared_store(tmp_path, files, embedding):
+    populate_config = config(tmp_path, "shared")
+    ingest(files, populate_config, embedding)
+    save_dir = tmp_path.joinpath("store")
+    assert sorted(Manifest(save_dir).topics()) == ["a", "b"]
+
+    ingest(files[:1], populate_config, embedding)
+    assert Manifest(save_dir).topics() == ["a"]
+    store = VectorStore("faiss", embedding, str(save_dir))
+    store.load()
+    topics = {store.vectorstore.docstore.search(doc_id).metadata["topic"] for doc_id in store.vectorstore.index_to_docstore_id.values()}
+    assert topics == {"a"}
+
+
+def test_stale_stores_are_kept_without_incremental_mode(tmp_path, files, embedding):
+    ingest(files, config(tmp_path, incremental=False), embedding)
+    ingest(files[:1], config(tmp_path, incremental=False), embedding)
+    assert sorted(dir.name for dir in tmp_path.joinpath("store").iterdir()) == ["a", "b"]
+
+
+def test_only_the_directories_with_a_manifest_are_removed(tmp_path, files, embedding):
+    populate_config = config(tmp_path)
+    ingest(files, populate_config, embedding)
+    save_dir = tmp_path.joinpath("store")
+    save_dir.joinpath("notes").mkdir()
+
+    assert sorted(remove_stale_stores(files[:1], populate_config)) == ["b"]
+    assert sorted(dir.name for dir in save_dir.iterdir()) == ["a", "notes"]
+    assert sorted(remove_stale_stores([], populate_config)) == ["a"]
+    assert [dir.name for dir in save_dir.iterdir()] == ["notes"]
+
+
+def stored_chunks(save_dir, embedding):
+    store = VectorStore("faiss", embedding, str(save_dir))
+    store.load()
+    chunks = {}
+    for position, doc_id in store.vectorstore.index_to_docstore_id.items():
+        doc = store.vectorstore.docstore.search(doc_id)
+        chunks[doc_id] = (doc.page_content, doc.metadata, store.vectorstore.index.reconstruct(int(position)).tolist())
+    return chunks
+
+
+@pytest.mark.parametrize("store_layout", ["per_file", "shared"])
+def test_parallel_ingestion_matches_the_serial_one(tmp_path, files, embedding, store_layout):
+    serial_config = config(tmp_path.joinpath("serial"), store_layout)
+    parallel_config = config(tmp_path.joinpath("parallel"), store_layout)
+    parallel_config["ingestion"].update({"parallel": True, "parse_workers": 2, "embed_workers": 2})
+    assert not ingest(files, serial_config, embedding).failures
+    assert not ingest(files, parallel_config, embedding).failures
+
+    serial_dir, parallel_dir = tmp_path.joinpath("serial", "store"), tmp_path.joinpath("parallel", "store")
+    if store_layout == "shared":
+        assert stored_chunks(serial_dir, embedding) == stored_chunks(parallel_dir, embedding)
+        return
+    assert sorted(dir.name for dir in serial_dir.iterdir()) == sorted(dir.name for dir in parallel_dir.iterdir())
+    for dir in serial_dir.iterdir():
+        assert stored_chunks(dir, embedding) == stored_chunks(parallel_dir.joinpath(dir.name), embedding)
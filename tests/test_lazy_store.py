@@ -0,0 +1,41 @@
+from tools.lazy_store import LazyVectorStore, StorePool
+import logging
+import pytest
+
+
+class Store:
+    """
+    A loaded store stand-in
+    """
+    def search_with_vectors(self, query, k, query_embedding=None, filter=None):
+        return [query]
+
+
+@pytest.fixture
+def pool():
+    return StorePool(memory_budget_mb=1.5)
+
+
+def test_least_recently_used_store_is_evicted(tmp_path, pool):
+    a = LazyVectorStore("a", tmp_path, Store, None, pool)
+    tmp_path.joinpath("index.faiss").write_bytes(b"0" * 1024 * 1024)
+    b = LazyVectorStore("b", tmp_path, Store, None, pool)
+    assert not a.is_loaded
+    assert a.search_with_vectors("query", 1) == ["query"]
+    b.get()
+    assert not a.is_loaded and b.is_loaded
+    assert pool.stats()["evictions"] == 1
+
+
+def test_prefetch_failures_are_logged(tmp_path, pool, caplog):
+    def fail():
+        raise FileNotFoundError("index.faiss")
+    store = LazyVectorStore("broken", tmp_path, fail, None, pool)
+
+    with caplog.at_level(logging.WARNING, logger="tools.lazy_store"):
+        pool.prefetch([store]).join()
+    assert "prefetch of the vector store broken failed" in caplog.text
+    assert "FileNotFoundError" in caplog.text
+    # the tool call using the store raises the error
+    with pytest.raises(FileNotFoundError):
+        store.search_with_vectors("query", 1)
@@ -0,0 +1,62 @@
+from indexing.manifest import Manifest, index_signature
+import pytest
+
+CONFIG = {
+    "chunking_strategy": "window",
+    "chunking_options": {"chunk_size": 1000, "chunk_overlap": 200},
+    "embedding": {"embedding_provider": "fake", "embedding_model": "fake"},
+    "vector_store_type": "faiss",
+    "faiss_index": {"type": "flat", "evaluate": {"enabled": True}}
+}
+
+
+@pytest.fixture
+def signature():
+    return index_signature(CONFIG)
+
+
+def test_signature_ignores_the_evaluation_settings(signature):
+    config = {**CONFIG, "faiss_index": {"type": "flat", "evaluate": {"enabled": False}}}
+    assert index_signature(config) == signature
+    assert index_signature({**CONFIG, "faiss_index": {"type": "hnsw"}}) != signature
+
+
+def test_resume_point_of_an_interrupted_file(tmp_path, signature):
+    manifest = Manifest(tmp_path)
+    manifest.record("a.pdf", "hash-a", "pdf/a.pdf", ["1", "2", "3"], signature, complete=False, topic="a")
+    manifest.save()
+
+    manifest = Manifest(tmp_path)
+    assert manifest.resume_point("a.pdf", "hash-a", signature) == 3
+    assert not manifest.is_unchanged("a.pdf", "hash-a", signature)
+
+
+def test_no_resume_point(tmp_path, signature):
+    manifest = Manifest(tmp_path)
+    manifest.record("a.pdf", "hash-a", "pdf/a.pdf", ["1", "2"], signature, complete=False, topic="a")
+    manifest.record("b.pdf", "hash-b", "pdf/b.pdf", ["3"], signature, complete=True, topic="b")
+
+    # the file changed since the checkpoint
+    assert manifest.resume_point("a.pdf", "hash-a2", signature) == 0
+    # the configuration changed since the checkpoint
+    assert manifest.resume_point("a.pdf", "hash-a", index_signature({**CONFIG, "chunking_strategy": "sentence"})) == 0
+    # a complete file is not resumed (it is either unchanged or indexed again)
+    assert manifest.resume_point("b.pdf", "hash-b", signature) == 0
+    assert manifest.resume_point("c.pdf", "hash-c", signature) == 0
+
+
+def test_unchanged_files_and_topics(tmp_path, signature):
+    manifest = Manifest(tmp_path)
+    manifest.record("a.pdf", "hash-a", "pdf/a.pdf", ["1"], signature, complete=False, topic="a")
+    manifest.record("b.pdf", "hash-b", "pdf/b.pdf", ["2"], signature, topic="b")
+    manifest.save()
+
+    manifest = Manifest(tmp_path)
+    assert manifest.exists()
+    assert manifest.is_unchanged("b.pdf", "hash-b", signature)
+    assert not manifest.is_unchanged("b.pdf", "hash-b2", signature)
+    # the topics of the interrupted files are not searchable yet
+    assert manifest.topics() == ["b"]
+
+    manifest.delete()
+    assert not Manifest(tmp_path).exists()
@@ -0,0 +1,100 @@
+from nodes.reranking import Reranking
+from utils.state import Chunk
+from benchmarks.fakes import register_fake_providers
+import numpy as np
+import asyncio
+import time
+import pytest
+
+PROMPTS = {"reranking": "Grade the chunk. Question: {question} Chunk: {chunk}"}
+
+
+def chunk(content: str) -> Chunk:
+    return Chunk(id=None, content=content, source=None, page=None, score=None, fused_score=None, vector=None, rank=0)
+
+
+def semantic_reranking(llm_options=None, timeout: float = 30) -> Reranking:
+    register_fake_providers(PROMPTS, llm_options or {}, 8)
+    options = {"semantic": {"llm_provider": "fake", "llm_model": "fake", "llm_host": "", "temperature": 0, "timeout": timeout, "max_concurrency": 2, "default_score": 0}}
+    return Reranking(["semantic"], [1.0], options, PROMPTS)
+
+
+class FailingLLM:
+    """
+    An LLM whose calls raise the given error
+    """
+    def __init__(self, error: Exception):
+        self.error = error
+
+    def invoke(self, prompt):
+        raise self.error
+
+    async def ainvoke(self, prompt):
+        raise self.error
+
+
+@pytest.mark.parametrize("grade, score", [
+    ("0.7", 0.7), (" 0.25\n", 0.25), ("1", 1.0),
+    ("good", 0), ("", 0), (["0.7"], 0),
+    ("nan", 0), ("inf", 0), ("-inf", 0)
+])
+def test_parse_grade(model_registries, grade, score):
+    assert semantic_reranking()._parse_grade(grade) == score
+
+
+def test_grades(model_registries):
+    reranking = semantic_reranking({"responses": {"reranking": "0.6"}})
+    chunks = [chunk("a"), chunk("b"), chunk("c")]
+    assert reranking._calculate_semantic_score("what is a?", chunks) == [0.6, 0.6, 0.6]
+    assert asyncio.run(reranking._acalculate_semantic_score("what is a?", chunks)) == [0.6, 0.6, 0.6]
+
+
+def test_timed_out_grades_get_the_default_score(model_registries):
+    reranking = semantic_reranking({"responses": {"reranking": "0.6"}, "latency_s": 0.5}, timeout=0.05)
+    chunks = [chunk("a"), chunk("b"), chunk("c")]
+
+    start = time.perf_counter()
+    assert reranking._calculate_semantic_score("what is a?", chunks) == [0, 0, 0]
+    # two rounds of max_concurrency grades, the batch does not wait for the slow calls
+    assert time.perf_counter() - start < 0.4
+    assert asyncio.run(reranking._acalculate_semantic_score("what is a?", chunks)) == [0, 0, 0]
+
+
+def test_the_executor_is_reused(model_registries):
+    reranking = semantic_reranking({"responses": {"reranking": "0.6"}})
+    executor = reranking._executor
+    reranking._calculate_semantic_score("what is a?", [chunk("a")])
+    reranking._calculate_semantic_score("what is b?", [chunk("b")])
+    assert reranking._executor is executor
+    assert len(executor._threads) <= 2
+
+
+def test_provider_errors_get_the_default_score(model_registries):
+    reranking = semantic_reranking()
+    reranking._llm = FailingLLM(ConnectionError("connection refused"))
+    assert reranking._calculate_semantic_score("what is a?", [chunk("a")]) == [0]
+    assert asyncio.run(reranking._acalculate_semantic_score("what is a?", [chunk("a")])) == [0]
+
+
+def test_programming_errors_are_raised(model_registries):
+    reranking = semantic_reranking()
+    reranking._llm = FailingLLM(KeyError("question"))
+    with pytest.raises(KeyError):
+        reranking._calculate_semantic_score("what is a?", [chunk("a")])
+    with pytest.raises(KeyError):
+        asyncio.run(reranking._acalculate_semantic_score("what is a?", [chunk("a")]))
+
+
+@pytest.mark.parametrize("metric", ["l2", "cosine", "ip"])
+def test_similarity_is_between_0_and_1(model_registries, metric):
+    register_fake_providers(PROMPTS, {}, 3)
+    options = {"distance": {"embedding_provider": "fake", "embedding_model": "fake", "embedding_host": "", "metric": metric}}
+    reranking = Reranking(["distance"], [1.0], options, PROMPTS)
+    question = np.array([1.0, 0.0, 0.0])
+    chunks = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [-1.0, 0.0, 0.0], [10.0, 10.0, 0.0], [-10.0, 0.0, 0.0]])
+    scores = reranking._similarity(question, chunks)
+    assert np.all((scores >= 0) & (scores <= 1))
+    # the same vector is the best match, the opposite one the worst
+    assert scores[0] == scores.max() and scores[2] <= scores[1]
+    if metric != "l2":
+        assert scores[:3] == pytest.approx([1.0, 0.5, 0.0])
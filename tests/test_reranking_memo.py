@@ -0,0 +1,73 @@
+from nodes.reranking import Reranking
+from utils.state import AgentState, Chunk
+from benchmarks.fakes import register_fake_providers
+import pytest
+
+EMBEDDING_SIZE = 8
+
+
+def chunk(content: str, chunk_id: str = None) -> Chunk:
+    vector = [float(len(content))] * EMBEDDING_SIZE
+    return Chunk(id=chunk_id, content=content, source=None, page=None, score=None, fused_score=None, vector=vector, rank=0)
+
+
+@pytest.fixture
+def reranking(model_registries):
+    register_fake_providers({}, {}, EMBEDDING_SIZE)
+    options = {"distance": {"embedding_provider": "fake", "embedding_model": "fake", "embedding_host": "", "metric": "l2"}}
+    return Reranking(["distance"], [1.0], options, {})
+
+
+def state_with(chunks, question: str = "what is a?", memo=None) -> AgentState:
+    state = AgentState.create(question=question)
+    state["chunks"] = chunks
+    state["score_memo"] = memo or {}
+    return state
+
+
+def test_new_chunks_without_memo(reranking):
+    state = state_with([chunk("a", "1"), chunk("b", "2"), chunk("a", "1")])
+    keys, new_keys, new_chunks = reranking._new_chunks(state)
+    # the chunk returned twice is kept and scored once
+    assert [c["content"] for c in state["chunks"]] == ["a", "b"]
+    assert len(keys) == 2
+    assert new_keys == keys
+    assert [c["content"] for c in new_chunks] == ["a", "b"]
+
+
+def test_new_chunks_skip_the_memoized_ones(reranking):
+    first = state_with([chunk("a", "1"), chunk("b", "2")])
+    keys, _, _ = reranking._new_chunks(first)
+    memo = {keys[0]: 0.5}
+
+    keys, new_keys, new_chunks = reranking._new_chunks(state_with([chunk("a", "1"), chunk("c", "3")], memo=memo))
+    assert new_keys == keys[1:]
+    assert [c["content"] for c in new_chunks] == ["c"]
+
+    # the memo is keyed by the question, the same chunk is scored again for another question
+    _, new_keys, _ = reranking._new_chunks(state_with([chunk("a", "1")], question="what is b?", memo=memo))
+    assert len(new_keys) == 1
+
+
+def test_chunks_without_id_are_keyed_by_content(reranking):
+    keys, new_keys, _ = reranking._new_chunks(state_with([chunk("Some Text."), chunk("some text")]))
+    assert len(keys) == 1
+    assert len(new_keys) == 1
+
+
+def test_duplicates_take_a_single_score(reranking):
+    state = reranking.rerank(state_with([chunk("a", "1"), chunk("bb", "2"), chunk("a", "1")]))
+    assert [c["id"] for c in state["chunks"]] == ["1", "2"]
+    assert len(state["reranking_score"]) == 2
+
+
+def test_rerank_reuses_the_memoized_scores(reranking):
+    state = reranking.rerank(state_with([chunk("a", "1"), chunk("bb", "2")]))
+    first_scores = state["reranking_score"]
+    assert len(state["score_memo"]) == 2
+
+    state["chunks"] = [chunk("bb", "2"), chunk("ccc", "3")]
+    state = reranking.rerank(state)
+    assert len(state["score_memo"]) == 3
+    assert state["reranking_score"][0] == first_scores[1]
+    assert "1 chunks scored, 1 already scored" in state["messages"][-1].content
@@ -0,0 +1,49 @@
+from tools.retrieval import _reciprocal_rank_fusion, _score_fusion, _to_artifact
+from langchain_core.documents import Document
+import pytest
+
+
+def result(doc_id: str, distance: float) -> tuple:
+    return Document(id=doc_id, page_content=f"text of {doc_id}"), distance, [float(distance)]
+
+
+def test_rrf_scores_and_order():
+    results_per_store = [
+        [result("a", 0.1), result("b", 0.2), result("c", 0.3)],
+        [result("b", 0.5), result("d", 0.6)]
+    ]
+    fused = _reciprocal_rank_fusion(results_per_store, rrf_k=60)
+
+    assert [doc.id for doc, _, _, _ in fused] == ["b", "a", "d", "c"]
+    scores = {doc.id: score for doc, _, _, score in fused}
+    assert scores["b"] == pytest.approx(1 / 62 + 1 / 61)
+    assert scores["a"] == pytest.approx(1 / 61)
+    assert scores["d"] == pytest.approx(1 / 62)
+    assert scores["c"] == pytest.approx(1 / 63)
+
+
+def test_rrf_keeps_the_lowest_distance():
+    fused = _reciprocal_rank_fusion([[result("a", 0.4)], [result("a", 0.2)]], rrf_k=60)
+    assert len(fused) == 1
+    _, distance, _, _ = fused[0]
+    assert distance == 0.2
+
+
+def test_rrf_of_no_results():
+    assert _reciprocal_rank_fusion([[], []], rrf_k=60) == []
+
+
+def test_score_fusion_normalizes_each_store():
+    results_per_store = [
+        [result("a", 1.0), result("b", 3.0)],
+        [result("c", 10.0), result("d", 20.0), result("e", 30.0)]
+    ]
+    scores = {doc.id: score for doc, _, _, score in _score_fusion(results_per_store)}
+    assert scores == pytest.approx({"a": 1.0, "b": 0.0, "c": 1.0, "d": 0.5, "e": 0.0})
+
+
+def test_artifact_keeps_distance_and_fused_score_apart():
+    fused = _reciprocal_rank_fusion([[result("a", 0.1)]], rrf_k=60)
+    _, artifact = _to_artifact([(doc, distance, vector) for doc, distance, vector, _ in fused], [score for _, _, _, score in fused])
+    assert artifact[0]["score"] == 0.1
+    assert artifact[0]["fused_score"] == pytest.approx(1 / 61)
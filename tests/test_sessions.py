@@ -0,0 +1,106 @@
+from utils.sessions import SessionStore, RequestLimiter
+import asyncio
+import pytest
+
+
+class Clock:
+    """
+    A settable replacement of time.monotonic
+    """
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("utils.sessions.time.monotonic", clock)
+    return clock
+
+
+def test_sessions_are_reused_by_id(clock):
+    store = SessionStore(list, max_sessions=10, ttl_s=60)
+    session = store.get()
+    assert store.get(session.session_id) is session
+    assert store.get("other") is not session
+    assert len(store) == 2
+    assert store.delete(session.session_id)
+    assert not store.delete(session.session_id)
+    assert store.get(session.session_id) is not session
+
+
+def test_unused_sessions_expire(clock):
+    store = SessionStore(list, max_sessions=10, ttl_s=60)
+    store.get("a")
+    clock.now += 30
+    store.get("b")
+    clock.now += 31
+    store.get("c")
+    assert len(store) == 2
+    assert store.get("b").chat_history is not None
+    assert [session_id for session_id in store._sessions] == ["c", "b"]
+
+
+def test_least_recently_used_sessions_are_evicted(clock):
+    store = SessionStore(list, max_sessions=2, ttl_s=60)
+    a = store.get("a")
+    store.get("b")
+    store.get("a")
+    store.get("c")
+    assert list(store._sessions) == ["a", "c"]
+    assert store.get("a") is a
+
+
+def test_busy_sessions_are_never_evicted(clock):
+    # e.g. a session whose query waits for a slot of the RequestLimiter
+    store = SessionStore(list, max_sessions=1, ttl_s=60)
+    a = store.get("a")
+    a.busy = True
+    clock.now += 120
+    store.get("b")
+    store.get("c")
+    assert list(store._sessions) == ["a", "c"]
+    assert store.get("a") is a
+
+
+def test_limiter_bounds_the_concurrent_queries():
+    async def run():
+        limiter = RequestLimiter(max_concurrency=2, max_queue=4, queue_timeout_s=1)
+        first, second = await limiter.acquire(), await limiter.acquire()
+        third = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.stats() == {"active": 2, "queued": 1}
+        first()
+        # releasing twice frees a single slot
+        first()
+        release = await third
+        assert limiter.stats() == {"active": 2, "queued": 0}
+        second()
+        release()
+        assert limiter.stats() == {"active": 0, "queued": 0}
+    asyncio.run(run())
+
+
+def test_limiter_rejects_when_the_queue_is_full():
+    async def run():
+        limiter = RequestLimiter(max_concurrency=1, max_queue=1, queue_timeout_s=1)
+        release = await limiter.acquire()
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert await limiter.acquire() is None
+        release()
+        (await queued)()
+    asyncio.run(run())
+
+
+def test_limiter_rejects_after_the_queue_timeout():
+    async def run():
+        limiter = RequestLimiter(max_concurrency=1, max_queue=1, queue_timeout_s=0.01)
+        release = await limiter.acquire()
+        assert await limiter.acquire() is None
+        assert limiter.stats() == {"active": 1, "queued": 0}
+        release()
+    asyncio.run(run())
@@ -0,0 +1,67 @@
+from nodes.update_context import UpdateContext
+from utils.state import AgentState, Chunk
+from utils.tokens import count_tokens, truncate_tokens
+import pytest
+
+
+def chunk(content: str, rank: int = 0) -> Chunk:
+    return Chunk(id=None, content=content, source=None, page=None, score=None, fused_score=None, vector=None, rank=rank)
+
+
+def state_with(chunks, scores=None) -> AgentState:
+    state = AgentState.create(question="what is a?")
+    state["chunks"] = chunks
+    state["reranking_score"] = scores
+    return state
+
+
+def test_chunks_are_packed_by_decreasing_score():
+    chunks = [chunk("alpha one"), chunk("beta two"), chunk("gamma three")]
+    state = UpdateContext().update_context(state_with(chunks, [0.1, 0.9, 0.5]))
+    assert state["context"] == "beta two\n\ngamma three\n\nalpha one"
+
+
+def test_chunks_are_packed_by_rank_without_scores():
+    # the results of two tools, concatenated
+    chunks = [chunk("first of a", 0), chunk("second of a", 1), chunk("first of b", 0), chunk("second of b", 1)]
+    state = UpdateContext().update_context(state_with(chunks))
+    assert state["context"].split("\n\n") == ["first of a", "first of b", "second of a", "second of b"]
+
+
+def test_budget_cutoff():
+    # 3 tokens each (estimated from the characters), the separator costs 1 token
+    chunks = [chunk("a" * 12), chunk("b" * 12), chunk("c" * 4)]
+    state = UpdateContext(max_tokens=6).update_context(state_with(chunks, [0.9, 0.8, 0.7]))
+    # the second chunk does not fit, the third (smaller) one still does
+    assert state["context"] == f"{'a' * 12}\n\n{'c' * 4}"
+    assert state["context_tokens_saved"] == 3
+    assert "1 over the token budget" in state["messages"][-1].content
+
+    # the budget includes the context of the previous steps
+    state["chunks"] = [chunk("d" * 4)]
+    state = UpdateContext(max_tokens=6).update_context(state)
+    assert "d" not in state["context"]
+
+
+def test_exact_and_near_duplicates_are_dropped():
+    text = "the player collects two hundred dollars when passing go on the board"
+    chunks = [chunk(text), chunk(text.upper()), chunk(text + " again"), chunk("the bank pays the dividends")]
+    state = UpdateContext(near_duplicate_threshold=0.8).update_context(state_with(chunks, [0.9, 0.8, 0.7, 0.6]))
+    assert state["context"] == f"{text}\n\nthe bank pays the dividends"
+    assert "2 duplicates" in state["messages"][-1].content
+
+    # the same chunk retrieved by a later step
+    state["chunks"] = [chunk(text)]
+    state = UpdateContext().update_context(state)
+    assert state["context"].count(text) == 1
+
+
+def test_only_exact_duplicates_with_threshold_one():
+    text = "the player collects two hundred dollars when passing go on the board"
+    state = UpdateContext(near_duplicate_threshold=1).update_context(state_with([chunk(text), chunk(text + " again")], [0.9, 0.8]))
+    assert len(state["context"].split("\n\n")) == 2
+
+
+def test_unavailable_tokenizer_falls_back_to_the_estimate():
+    assert count_tokens("a" * 10, "no_such_encoding") == count_tokens("a" * 10) == 3
+    assert truncate_tokens("one two three four", 2, tokenizer="no_such_encoding") == "one two"
@@ -0,0 +1,114 @@
+from indexing.vectorstore import VectorStore, VectorStoreView
+from indexing.docstore import DOCSTORE_FILE_NAME, SQLiteDocstore
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.documents import Document
+import pytest
+
+EMBEDDING_SIZE = 16
+
+
+@pytest.fixture
+def embedding():
+    return DeterministicFakeEmbedding(size=EMBEDDING_SIZE)
+
+
+def documents(n: int, source: str = "a.pdf"):
+    return [Document(page_content=f"chunk {i} of {source}", metadata={"source": source}) for i in range(n)]
+
+
+@pytest.mark.parametrize("index_type", ["ivf_flat", "ivf_pq"])
+def test_tiny_corpus_is_saved_and_searchable(tmp_path, embedding, index_type):
+    save_dir = tmp_path.joinpath("a")
+    store = VectorStore("faiss", embedding, str(save_dir), {"type": index_type, "pq_m": 4})
+    store.add_documents(documents(1), ids=["0"])
+    store.save()
+
+    store = VectorStore("faiss", embedding, str(save_dir), {"type": index_type, "pq_m": 4})
+    assert store.exists()
+    store.load()
+    results = store.search_with_vectors("chunk 0 of a.pdf", k=1)
+    assert [doc.id for doc, _, _ in results] == ["0"]
+
+
+def test_pq_bits_are_scaled_down_on_small_corpora(tmp_path, embedding):
+    store = VectorStore("faiss", embedding, str(tmp_path.joinpath("a")), {"type": "ivf_pq", "pq_m": 4, "pq_nbits": 8})
+    store.add_documents(documents(100), ids=[str(i) for i in range(100)])
+    store.save()
+    assert store.vectorstore.index.ntotal == 100
+    assert len(store.search_with_vectors("chunk 1 of a.pdf", k=5)) == 5
+
+
+def test_failed_save_leaves_no_directory(tmp_path, embedding, monkeypatch):
+    save_dir = tmp_path.joinpath("a")
+    store = VectorStore("faiss", embedding, str(save_dir), {"type": "flat"})
+    store.add_documents(documents(3), ids=["0", "1", "2"])
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(store.vectorstore, "save_local", fail)
+    with pytest.raises(RuntimeError):
+        store.save()
+    assert not save_dir.exists()
+    assert not VectorStore.is_saved("faiss", save_dir)
+
+
+@pytest.mark.parametrize("index_config", [{"type": "ivf_flat", "nlist": 2}, {"type": "hnsw"}])
+def test_delete_keeps_the_other_vectors(tmp_path, embedding, index_config):
+    store = VectorStore("faiss", embedding, str(tmp_path.joinpath("a")), index_config)
+    store.add_documents(documents(50, "a.pdf") + documents(50, "b.pdf"), ids=[str(i) for i in range(100)])
+    store.save()
+
+    assert store.delete_by_source("a.pdf") == 50
+    assert store.vectorstore.index.ntotal == 50
+    assert set(store.vectorstore.index_to_docstore_id.values()) == {str(i) for i in range(50, 100)}
+    store.set_search_params({"nprobe": 2})
+    for i in [50, 75, 99]:
+        # the remaining vectors are unchanged, each chunk is still its own nearest neighbour
+        doc, distance, _ = store.search_with_vectors(f"chunk {i - 50} of b.pdf", k=1)[0]
+        assert doc.id == str(i)
+        assert distance == pytest.approx(0.0, abs=1e-4)
+
+
+@pytest.mark.parametrize("load_mode", ["memory", "mmap"])
+def test_filtered_search_of_a_small_topic(tmp_path, embedding, load_mode):
+    # Shared layout: the topics are filtered views over a single IVF store, searched with the default nprobe
+    chunks = [Document(page_content=f"chunk {i} of a.pdf", metadata={"source": "a.pdf", "topic": "a"}) for i in range(300)]
+    chunks += [Document(page_content=f"chunk {i} of b.pdf", metadata={"source": "b.pdf", "topic": "b"}) for i in range(3)]
+    store = VectorStore("faiss", embedding, str(tmp_path), {"type": "ivf_flat", "nlist": 8})
+    store.add_documents(chunks, ids=[str(i) for i in range(len(chunks))])
+    store.save()
+    store = VectorStore("faiss", embedding, str(tmp_path), {"type": "ivf_flat", "nlist": 8})
+    store.load(load_mode)
+    assert store.vectorstore.index.nprobe == 1
+
+    results = VectorStoreView(store, {"topic": "b"}).search_with_vectors("chunk 0 of a.pdf", k=5)
+    assert sorted(doc.id for doc, _, _ in results) == ["300", "301", "302"]
+    results = VectorStoreView(store, {"topic": "a"}).search_with_vectors("chunk 7 of a.pdf", k=5)
+    assert len(results) == 5
+    assert all(doc.metadata["topic"] == "a" for doc, _, _ in results)
+    assert VectorStoreView(store, {"topic": "c"}).search_with_vectors("chunk 0 of a.pdf", k=5) == []
+
+
+def test_the_sqlite_docstore_is_written_only_for_the_mmap_load(tmp_path, embedding):
+    store = VectorStore("faiss", embedding, str(tmp_path))
+    store.add_documents(documents(3), ids=["0", "1", "2"])
+    store.save()
+    assert not tmp_path.joinpath(DOCSTORE_FILE_NAME).exists()
+
+    memory_store = VectorStore("faiss", embedding, str(tmp_path))
+    memory_store.load("memory")
+    assert not tmp_path.joinpath(DOCSTORE_FILE_NAME).exists()
+
+    mmap_store = VectorStore("faiss", embedding, str(tmp_path))
+    mmap_store.load("mmap")
+    assert isinstance(mmap_store.vectorstore.docstore, SQLiteDocstore)
+    expected = [(doc.id, doc.page_content) for doc, _, _ in memory_store.search_with_vectors("chunk 1 of a.pdf", k=3)]
+    assert [(doc.id, doc.page_content) for doc, _, _ in mmap_store.search_with_vectors("chunk 1 of a.pdf", k=3)] == expected
+
+    # a new version of the store makes the docstore out of date, it is written again by the next mmap load
+    store.add_documents(documents(1, "b.pdf"), ids=["3"])
+    store.save()
+    assert not tmp_path.joinpath(DOCSTORE_FILE_NAME).exists()
+    mmap_store = VectorStore("faiss", embedding, str(tmp_path))
+    mmap_store.load("mmap")
+    assert mmap_store.search_with_vectors("chunk 0 of b.pdf", k=1)[0][0].id == "3"
@@ -0,0 +1,149 @@
+from indexing.vectorstore import VectorStore
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Dict, Any, Tuple, Union, Callable
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def _store_size_mb(path: Path) -> float:
+    """
+    Parameters:
+        path (Path): the directory of a persisted vector store
+
+    Returns:
+        float: the size of the files of the vector store in MB, an estimate of its memory usage once loaded
+    """
+    return sum(file.stat().st_size for file in path.iterdir() if file.is_file()) / (1024 * 1024)
+
+
+class StorePool:
+    """
+    Keeps track of the loaded lazy vector stores, and evicts the least recently used ones
+    when their total size exceeds the memory budget
+    """
+    def __init__(self, memory_budget_mb: Union[float, None] = None):
+        """
+        Attributes:
+            memory_budget_mb (Union[float, None]): the maximum total size of the loaded stores (None -> no limit),
+            the most recently used store is never evicted, even if it exceeds the budget alone
+        """
+        self._memory_budget_mb = memory_budget_mb
+        self._lock = threading.Lock()
+        # LazyVectorStore -> size in MB, from the least to the most recently used
+        self._loaded: OrderedDict = OrderedDict()
+        self.loads = 0
+        self.evictions = 0
+
+    def touch(self, store: "LazyVectorStore") -> None:
+        with self._lock:
+            if store in self._loaded:
+                self._loaded.move_to_end(store)
+
+    def register(self, store: "LazyVectorStore", size_mb: float) -> None:
+        with self._lock:
+            self.loads += 1
+            self._loaded[store] = size_mb
+            self._loaded.move_to_end(store)
+            if self._memory_budget_mb is None:
+                return
+            while len(self._loaded) > 1 and sum(self._loaded.values()) > self._memory_budget_mb:
+                evicted, _ = self._loaded.popitem(last=False)
+                # The searches already running on the evicted store keep their own reference to it
+                evicted.unload()
+                self.evictions += 1
+
+    def is_full(self) -> bool:
+        with self._lock:
+            return self._memory_budget_mb is not None and sum(self._loaded.values()) >= self._memory_budget_mb
+
+    def prefetch(self, stores: List["LazyVectorStore"]) -> threading.Thread:
+        """
+        Load the stores in a background thread, until the memory budget is reached
+
+        Parameters:
+            stores (List[LazyVectorStore]): the stores to load, in order of priority
+
+        Returns:
+            threading.Thread: the (daemon) thread loading the stores
+        """
+        def run():
+            for store in stores:
+                if self.is_full():
+                    return
+                try:
+                    store.get()
+                except Exception:
+                    # The error is raised again when the store is used by a tool
+                    logger.warning("prefetch of the vector store %s failed", store.name, exc_info=True)
+
+        thread = threading.Thread(target=run, name="vector-store-prefetch", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: the loaded stores, their total size and the load/eviction counters
+        """
+        with self._lock:
+            return {
+                "loaded": [store.name for store in self._loaded],
+                "size_mb": sum(self._loaded.values()),
+                "loads": self.loads,
+                "evictions": self.evictions
+            }
+
+
+class LazyVectorStore:
+    """
+    A persisted vector store that is loaded on its first search (and again after an eviction),
+    it can be used wherever a loaded VectorStore is searched (retriever tools, VectorStoreView)
+    """
+    def __init__(self, name: str, path: Path, loader: Callable[[], VectorStore], embedding_model: Embeddings, pool: StorePool):
+        """
+        Attributes:
+            name (str): the name of the store (its topic)
+            path (Path): the directory of the persisted store
+            loader (Callable[[], VectorStore]): the function creating and loading the vector store
+            embedding_model (Embeddings): the embedding model of the store, available without loading it
+            pool (StorePool): the pool enforcing the memory budget
+        """
+        self.name = name
+        self.path = path
+        self.embedding_model = embedding_model
+        self._loader = loader
+        self._pool = pool
+        self._store: Union[VectorStore, None] = None
+        # Serializes the loading, so concurrent first calls load the store only once
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._store is not None
+
+    def get(self) -> VectorStore:
+        """
+        Returns:
+            VectorStore: the loaded vector store, it is loaded if needed
+        """
+        store = self._store
+        if store is not None:
+            self._pool.touch(self)
+            return store
+        with self._lock:
+            # Another thread may have loaded the store while waiting for the lock
+            if self._store is None:
+                self._store = self._loader()
+                self._pool.register(self, _store_size_mb(self.path))
+            return self._store
+
+    def unload(self) -> None:
+        self._store = None
+
+    def search_with_vectors(self, query: str, k: int, query_embedding: List[float] = None, filter: Dict[str, Any] = None) -> List[Tuple[Document, float, Union[List[float], None]]]:
+        return self.get().search_with_vectors(query, k, query_embedding, filter)
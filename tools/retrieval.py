@@ -1,14 +1,183 @@
-from indexing.vectorstore import VectorStore
-from typing import List, Dict
-from langchain.tools.retriever import create_retriever_tool
+from indexing.vectorstore import VectorStore, VectorStoreView
+from indexing.manifest import Manifest
+from tools.lazy_store import LazyVectorStore, StorePool
+from typing import List, Dict, Any, Tuple, Union
 from langchain.tools import Tool
+from langchain_core.tools import StructuredTool, BaseTool
+from langchain_core.tools.retriever import RetrieverInput
+from langchain_core.documents import Document
 from pathlib import Path
+from pydantic import BaseModel, Field
+from concurrent.futures import ThreadPoolExecutor
 from utils.embedding import EmbeddingModel
 from langchain_community.tools import DuckDuckGoSearchRun
 from langchain_mcp_adapters.client import MultiServerMCPClient
+import asyncio
 
+class FanoutRetrieverInput(BaseModel):
+    """
+    Input of the fan-out retriever tool
+    """
+    query: str = Field(description="query to look up in the topic stores")
+    topics: Union[List[str], None] = Field(default=None, description="the topics to search, leave empty to search all the topics")
+
+def _to_artifact(results: List[Tuple[Document, float, Union[List[float], None]]], fused_scores: Union[List[float], None] = None) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Convert search results to the (content, artifact) pair returned by the retriever tools
+
+    Parameters:
+        results (List[Tuple[Document, float, Union[List[float], None]]]): for each retrieved document, its distance (lower is better) and stored vector
+        fused_scores (Union[List[float], None]): the fused score of each document (higher is better), only for the fan-out retriever
+
+    Returns:
+        Tuple[str, List[Dict[str, Any]]]: the chunks text (shown to the LLM) and the structured artifact (the vectors are removed from it by extract_chunks)
+    """
+    content = "\n\n".join(doc.page_content for doc, _, _ in results)
+    artifact = [
+        {
+            "id": doc.id,
+            "content": doc.page_content,
+            "source": doc.metadata.get("source"),
+            "page": doc.metadata.get("page"),
+            "score": score,
+            "fused_score": fused_scores[i] if fused_scores is not None else None,
+            "vector": vector
+        }
+        for i, (doc, score, vector) in enumerate(results)
+    ]
+    return content, artifact
+
+def _reciprocal_rank_fusion(results_per_store: List[List[Tuple[Document, float, Union[List[float], None]]]], rrf_k: int) -> List[Tuple[Document, float, Union[List[float], None], float]]:
+    """
+    Merge the results of many stores using the reciprocal rank fusion: score = sum(1 / (rrf_k + rank))
+
+    Parameters:
+        results_per_store (List[List[Tuple[Document, float, Union[List[float], None]]]]): the ranked results of each store
+        rrf_k (int): the constant that smooths the contribution of the top ranks
+
+    Returns:
+        List[Tuple[Document, float, Union[List[float], None], float]]: the merged results (document, lowest distance, vector, fused score)
+            sorted by fused score (higher is better)
+    """
+    fused = {}
+    for results in results_per_store:
+        for rank, (doc, distance, vector) in enumerate(results, start=1):
+            key = doc.id or doc.page_content
+            _, best_distance, _, score = fused.get(key, (doc, distance, vector, 0.0))
+            fused[key] = (doc, min(best_distance, distance), vector, score + 1 / (rrf_k + rank))
+    return sorted(fused.values(), key=lambda result: result[3], reverse=True)
+
+def _score_fusion(results_per_store: List[List[Tuple[Document, float, Union[List[float], None]]]]) -> List[Tuple[Document, float, Union[List[float], None], float]]:
+    """
+    Merge the results of many stores normalizing the distances of each store to a [0, 1] similarity (min-max)
+
+    Parameters:
+        results_per_store (List[List[Tuple[Document, float, Union[List[float], None]]]]): the results of each store, with their distances
+
+    Returns:
+        List[Tuple[Document, float, Union[List[float], None], float]]: the merged results (document, distance, vector, normalized score)
+            sorted by normalized score (higher is better)
+    """
+    fused = {}
+    for results in results_per_store:
+        if not results:
+            continue
+        distances = [distance for _, distance, _ in results]
+        min_distance, max_distance = min(distances), max(distances)
+        for doc, distance, vector in results:
+            score = 1.0 if max_distance == min_distance else (max_distance - distance) / (max_distance - min_distance)
+            key = doc.id or doc.page_content
+            if key not in fused or fused[key][3] < score:
+                fused[key] = (doc, distance, vector, score)
+    return sorted(fused.values(), key=lambda result: result[3], reverse=True)
+
+def create_vector_store_tool(vector_store: Union[VectorStore, VectorStoreView, LazyVectorStore], k: int, name: str, description: str) -> BaseTool:
+    """
+    Create a retriever tool that, besides the chunks text, returns a structured artifact with
+    the chunk id, text, source file, page, distance and stored vector of each retrieved chunk
+
+    Parameters:
+        vector_store (Union[VectorStore, VectorStoreView, LazyVectorStore]): the vector store, or the topic view of the shared store, to search
+        k (int): a non negative integer reppresenting the number of chunks the tool must retrieve
+        name (str): the tool name
+        description (str): the tool description, used by the LLM to choose the tool
+
+    Returns:
+        BaseTool: a tool whose ToolMessage contains the chunks as content and their metadata as artifact
+    """
+    def retrieve(query: str) -> Tuple[str, List[Dict[str, Any]]]:
+        return _to_artifact(vector_store.search_with_vectors(query, k))
+
+    async def aretrieve(query: str) -> Tuple[str, List[Dict[str, Any]]]:
+        # The search is blocking (embedding + index scan), so it runs in a worker thread
+        return await asyncio.to_thread(retrieve, query)
+
+    return StructuredTool.from_function(
+        func=retrieve,
+        coroutine=aretrieve,
+        name=name,
+        description=description,
+        args_schema=RetrieverInput,
+        response_format="content_and_artifact"
+    )
+
+def create_fanout_retriever_tool(vector_stores: Dict[str, Union[VectorStore, VectorStoreView, LazyVectorStore]], k: int, options: Dict[str, Any]) -> BaseTool:
+    """
+    Create a single retriever tool that searches many topic stores concurrently (in a thread pool),
+    and merges their results in one step
+
+    Parameters:
+        vector_stores (Dict[str, Union[VectorStore, VectorStoreView, LazyVectorStore]]): the vector store, or view of the shared store, of each topic
+        k (int): a non negative integer reppresenting the number of chunks the tool must retrieve
+        options (Dict[str, Any]): the fan-out options (fusion, rrf_k, max_workers, top_n)
+
+    Returns:
+        BaseTool: a tool whose ToolMessage contains the merged chunks as content and their metadata as artifact
+            (with the distance of each chunk as "score" and the fusion score as "fused_score")
+
+    Raises:
+        Exception: if there are no vector stores
+        NotImplementedError: if the fusion method is not supported
+    """
+    if not vector_stores:
+        raise Exception("fan-out retriever vector stores not Found")
+    # rrf -> reciprocal rank fusion, score -> min-max normalized scores
+    fusion = options.get("fusion", "rrf")
+    if fusion not in ["rrf", "score"]:
+        raise NotImplementedError(f"fusion method {fusion} not supported")
+    rrf_k = options.get("rrf_k", 60)
+    # maximum number of topics searched when the LLM routes the query to specific topics
+    top_n = options.get("top_n", None)
+    max_workers = options.get("max_workers", min(8, len(vector_stores)))
+    # All the stores share the same embedding model, so the query is embedded only once
+    embedding_model = next(iter(vector_stores.values())).embedding_model
+
+    def retrieve(query: str, topics: Union[List[str], None] = None) -> Tuple[str, List[Dict[str, Any]]]:
+        selected = [topic for topic in (topics or []) if topic in vector_stores][:top_n] or list(vector_stores)
+        query_embedding = embedding_model.embed_query(query)
+        # The pool lives only for the call, so no worker thread outlives the tool
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(selected))) as executor:
+            results_per_store = list(executor.map(lambda topic: vector_stores[topic].search_with_vectors(query, k, query_embedding), selected))
+        if fusion == "rrf":
+            results = _reciprocal_rank_fusion(results_per_store, rrf_k)[:k]
+        else:
+            results = _score_fusion(results_per_store)[:k]
+        return _to_artifact([(doc, distance, vector) for doc, distance, vector, _ in results], [score for _, _, _, score in results])
+
+    async def aretrieve(query: str, topics: Union[List[str], None] = None) -> Tuple[str, List[Dict[str, Any]]]:
+        return await asyncio.to_thread(retrieve, query, topics)
+
+    return StructuredTool.from_function(
+        func=retrieve,
+        coroutine=aretrieve,
+        name="topics_retriever",
+        description=f"this tool is used to retrieve informations about one or more of these topics {list(vector_stores)}, all the topics are searched when no topic is provided",
+        args_schema=FanoutRetrieverInput,
+        response_format="content_and_artifact"
+    )
 
-async def get_tools(vector_store_type: str, vector_store_dir: str, k: int, config: Dict[str, str]) -> List[Tool]:
+
+async def get_tools(vector_store_type: str, vector_store_dir: str, k: int, config: Dict[str, str], retrieval_mode: str = "per_topic", retrieval_options: Dict[str, Dict[str, Any]] = None, search_params: Dict[str, Any] = None, load_mode: str = "memory", lazy_options: Dict[str, Any] = None, mcp_options: Dict[str, Any] = None, web_search: bool = True) -> List[Tool]:
     """
     Generate a list of tools available to the AI Agent
 
@@ -17,40 +186,89 @@ async def get_tools(vector_store_type: str, vector_store_dir: str, k: int, confi
         vector_store_dir (str): The path in which the vector store is located
         k (int): a non negative integer reppresenting the number of chunks a tool must retrieve
         config (Dict[str, str]): the embedding model configuration file
+        retrieval_mode (str): "per_topic" creates a retriever tool for each topic, "fanout" creates a single tool searching all the topics concurrently
+        retrieval_options (Dict[str, Dict[str, Any]]): a dictionary that for each retrieval mode, contains the respective parameters
+        search_params (Dict[str, Any]): the search time parameters of the approximate FAISS indexes (nprobe, efSearch)
+        load_mode (str): "memory" loads the vector stores in memory, "mmap" memory maps them (see VectorStore.load)
+        lazy_options (Dict[str, Any]): the lazy loading options (enabled, prefetch, memory_budget_mb), with lazy loading
+            the vector stores are loaded on the first call of their tools and the least recently used ones are evicted when over budget
+        mcp_options (Dict[str, Any]): the MCP servers ("servers", in the MultiServerMCPClient format) and the servers whose tools are used ("tool_servers", all the servers if missing)
+        web_search (bool): add the DuckDuckGo web search tool
 
     Returns:
         List[Tool]: A list of tools for the agent
+
+    Raises:
+        NotImplementedError: if the retrieval mode is not supported
     """
+    if retrieval_mode not in ["per_topic", "fanout"]:
+        raise NotImplementedError(f"retrieval mode {retrieval_mode} not supported")
+    retrieval_options = retrieval_options or {}
+
+    tools = []
+    mcp_options = mcp_options or {}
+    servers = mcp_options.get("servers", {})
+    if servers:
+        # Create MCP clients, one for each MCP server
+        client = MultiServerMCPClient(servers)
 
-    # Create MCP clients, one for each MCP server
-    client = MultiServerMCPClient({
-        "conversion_mcp_http": {
-            "transport": "streamable_http", # HTTP-based remote server
-            "url": "http://localhost:8080/mcp" # the mcp python package create the route /mcp automatically
-        },
-        "conversion_mcp_stdio": {
-            "transport": "stdio", # Local subprocess communication
-            "command": "python",
-            "args": ["C:/Users/stefano/Desktop/MCP_Demo/mcp_server_stdio.py"] # Absolute path to your .py file containing the mcp server definition
-        },
-    })
-
-    # Returns a list of available tools.
-    # Only works in asynchronous code -> I had to change some implementation to make it work (se app.py, utils/processing.py)
-    # client has also methods to fetch Resources and Prompts
-    tools = await client.get_tools(server_name="conversion_mcp_stdio") # Optional name of the server to get tools from. If not specified all tools from all servers will be returned
-
-    # A web search tool
-    tools.append(DuckDuckGoSearchRun())
+        # Returns a list of available tools.
+        # Only works in asynchronous code -> I had to change some implementation to make it work (se app.py, utils/processing.py)
+        # client has also methods to fetch Resources and Prompts
+        for server_name in mcp_options.get("tool_servers", list(servers)):
+            tools.extend(await client.get_tools(server_name=server_name))
+
+    if web_search:
+        # A web search tool
+        tools.append(DuckDuckGoSearchRun())
     embedding_model = EmbeddingModel(config=config).get()
     store_dir = Path(vector_store_dir)
+    lazy_options = lazy_options or {}
+    pool = StorePool(lazy_options.get("memory_budget_mb", None))
+    lazy_stores = []
+
+    def open_store(name: str, path: Path) -> Union[VectorStore, LazyVectorStore]:
+        def load() -> VectorStore:
+            vector_store = VectorStore(vector_store_type, embedding_model, path.absolute())
+            vector_store.load(load_mode)
+            vector_store.set_search_params(search_params)
+            return vector_store
+        if lazy_options.get("enabled", False):
+            # Only the tool name and description are registered, the store is loaded on the first call
+            lazy_stores.append(LazyVectorStore(name, path, load, embedding_model, pool))
+            return lazy_stores[-1]
+        return load()
+
+    vector_stores = {}
+    manifest = Manifest(store_dir)
+    if manifest.exists():
+        # Shared layout: a single store, each topic is a filtered view over it
+        shared_store = open_store(store_dir.name, store_dir)
+        for topic in manifest.topics():
+            vector_stores[topic] = VectorStoreView(shared_store, {"topic": topic})
+    else:
+        for dir in store_dir.iterdir():
+            # Only the saved stores (e.g. not the directory left behind by a failed ingestion)
+            if not dir.is_dir() or not VectorStore.is_saved(vector_store_type, dir):
+                continue
+            vector_stores[dir.name] = open_store(dir.name, dir)
+
+    if lazy_stores and lazy_options.get("prefetch", False):
+        # Load the stores in background, so the first calls of the tools do not wait for the loading
+        pool.prefetch(lazy_stores)
+
+    if retrieval_mode == "fanout":
+        # A single tool searching all the topics in one step (no tool without vector stores)
+        if vector_stores:
+            tools.append(create_fanout_retriever_tool(vector_stores, k, retrieval_options.get("fanout", {})))
+        return tools
+
     # For each vectorstore/topic create a retriever tool
-    for dir in store_dir.iterdir():
-        vector_store = VectorStore(vector_store_type, embedding_model, dir.absolute())
-        vector_store.load()
-        tools.append(create_retriever_tool(
-            vector_store.as_retriever(k),
-            f"{dir.name}_retriever",
-            f"this tool is used to retrieve informations about the topic {dir.name}"
+    for topic, vector_store in vector_stores.items():
+        tools.append(create_vector_store_tool(
+            vector_store,
+            k,
+            f"{topic}_retriever",
+            f"this tool is used to retrieve informations about the topic {topic}"
         ))
     return tools
\ No newline at end of file
@@ -8,7 +8,10 @@ from nodes.query_transformation import QueryTransform
 from utils.processing import get_topics
 from tools.retrieval import get_tools
 from utils.llm import LLMModel
-from nodes.update_context import update_context
+from utils.embedding import EmbeddingModel
+from utils.cache import build_node_caches
+from utils.metrics import MetricsCollector
+from nodes.update_context import UpdateContext
 from nodes.answer import GenerateAnswer
 from nodes.output_validation import AnswerValidation
 from nodes.reranking import Reranking
@@ -16,15 +19,17 @@ from nodes.selection import ChunckSelection
 from nodes.retrieve_or_respond import Retrieve_Respond
 from nodes.extract_chunks import extract_chunks
 from nodes.history import HistorySummarizer
+from nodes.validate_transform import ValidateAndTransform
 from typing import Dict, Any, Union
 
-async def build_agent(app_config: Dict[str, Any], prompts: Dict[str, Union[str, Dict[str, str]]]) -> CompiledStateGraph[AgentState]:
+async def build_agent(app_config: Dict[str, Any], prompts: Dict[str, Union[str, Dict[str, str]]], metrics: Union[MetricsCollector, None] = None) -> CompiledStateGraph[AgentState]:
     """
     Build the Agentic RAG system, based on the configuration file and prompts file
 
     Parameters:
         app_config (Dict[str, Any]): the configuration file containing the building parameters
         prompts: (Dict[str, Union[str, Dict[str, str]]]): the file containing the prompts used by the AI agent
+        metrics (Union[MetricsCollector, None]): an optional collector measuring every node and tool call of the agent
     
     Returns:
         CompiledStateGraph[AgentState]: An compiled graph (a.k.a Agent) using the **AgentState** state
@@ -34,36 +39,68 @@ async def build_agent(app_config: Dict[str, Any], prompts: Dict[str, Union[str,
     check_output_validity_flag = app_config.get("check_output_validity", True)
     check_input_validity_flag = app_config.get("check_input_validity", True)
     advanced_rag_flag = app_config.get("advanced_rag", True)
+    # Run the input validation and the query transformation concurrently (only with advanced_rag and check_input_validity)
+    parallel_validation_flag = app_config.get("parallel_validation", False)
 
     # Fetch the RAG topics
     topics = await get_topics(app_config["db_dir_path"])
     # Fetch the Agent's tools
-    tools = await get_tools(app_config["vector_db"], app_config["db_dir_path"], app_config["k"], app_config["embedding"])
+    tools = await get_tools(
+        app_config["vector_db"],
+        app_config["db_dir_path"],
+        app_config["k"],
+        app_config["embedding"],
+        app_config.get("retrieval_mode", "per_topic"),
+        app_config.get("retrieval_options", {}),
+        app_config.get("search_params", {}),
+        app_config.get("store_load_mode", "memory"),
+        app_config.get("lazy_loading", {}),
+        app_config.get("mcp", {}),
+        app_config.get("web_search", True)
+    )
 
     # Instantiate 
-    llm = LLMModel(app_config["llm"]).get()
+    llm_model = LLMModel(app_config["llm"])
+
+    # Response caches, one for each node that enables it (keyed by the node prompt name)
+    cache_config = app_config.get("llm_cache", {})
+    uses_semantic_cache = "semantic" in cache_config.get("nodes", {}).values()
+    caches = build_node_caches(cache_config, EmbeddingModel(app_config["embedding"]).get() if uses_semantic_cache else None, prompts)
 
     # Use AgentState class as graph's state
     graph = StateGraph(AgentState)
+
+    def add_node(name, action):
+        # Every node is measured when the metrics are enabled
+        graph.add_node(name, metrics.wrap_node(name, action) if metrics is not None else action)
+
+    # The LLM nodes are registered with their asynchronous version (ainvoke),
+    # so a single event loop can serve many conversations without blocking on the LLM calls
     
     # Simple RAG Nodes
-    graph.add_node("history_integration", HistorySummarizer(llm, prompts["history"]).summarize)
-    graph.add_node("retrieve_or_respond", Retrieve_Respond(llm, prompts["retrieve_respond"]).choose)
-    graph.add_node("tool_routing", ToolRouting(llm, prompts["tool_calling"], tools).route)
-    graph.add_node("tool_execution", ToolNode(tools))
-    graph.add_node("extract_chunks", extract_chunks)
-    graph.add_node("update_context", update_context)
-    graph.add_node("generate_answer", GenerateAnswer(llm, prompts["output"]).generate_answer)
+    add_node("history_integration", HistorySummarizer(llm_model.get(caches.get("history")), prompts["history"], app_config.get("chat_history", {}).get("skip_self_contained", False)).asummarize)
+    add_node("retrieve_or_respond", Retrieve_Respond(llm_model.get(caches.get("retrieve_respond")), prompts["retrieve_respond"]).achoose)
+    add_node("tool_routing", ToolRouting(llm_model.get(caches.get("tool_calling")), prompts["tool_calling"], tools).aroute)
+    add_node("tool_execution", ToolNode(tools))
+    add_node("extract_chunks", extract_chunks)
+    context_options = app_config.get("context", {})
+    add_node("update_context", UpdateContext(context_options.get("max_tokens", None), context_options.get("near_duplicate_threshold", 0.8), context_options.get("tokenizer", None)).update_context)
+    add_node("generate_answer", GenerateAnswer(llm_model.get(caches.get("output")), prompts["output"]).agenerate_answer)
 
     # Advanced RAG Nodes
     if advanced_rag_flag:
-        if check_input_validity_flag:
-            graph.add_node("validate_input", QueryValidation(llm, prompts["input_check"], topics).validate)
-        graph.add_node("query_transform", QueryTransform(app_config["query_transform"], app_config["query_transform_options"], llm, prompts["query_transformation"]).transform)
-        graph.add_node("reranking", Reranking(app_config["reranking_strategies"], app_config["reranking_weights"], app_config["reranking_strategies_options"], prompts).rerank)
-        graph.add_node("selection", ChunckSelection(app_config["selection_strategies"], app_config["selection_options"]).select)
+        query_validation = QueryValidation(llm_model.get(caches.get("input_check")), prompts["input_check"], topics)
+        query_transform = QueryTransform(app_config["query_transform"], app_config["query_transform_options"], llm_model.get(caches.get("query_transformation")), prompts["query_transformation"])
+        if check_input_validity_flag and parallel_validation_flag:
+            add_node("validate_and_transform", ValidateAndTransform(query_validation, query_transform).avalidate_and_transform)
+        else:
+            if check_input_validity_flag:
+                add_node("validate_input", query_validation.avalidate)
+            add_node("query_transform", query_transform.atransform)
+        add_node("reranking", Reranking(app_config["reranking_strategies"], app_config["reranking_weights"], app_config["reranking_strategies_options"], prompts, caches.get("reranking")).arerank)
+        add_node("selection", ChunckSelection(app_config["selection_strategies"], app_config["selection_options"]).select)
         if check_output_validity_flag:
-            graph.add_node("validate_answer", AnswerValidation(llm, prompts["output_check"]).validate)
+            add_node("validate_answer", AnswerValidation(llm_model.get(caches.get("output_check")), prompts["output_check"]).avalidate)
 
     # Always Present Edges
     graph.add_edge(START, "history_integration")
@@ -81,19 +118,30 @@ async def build_agent(app_config: Dict[str, Any], prompts: Dict[str, Union[str,
 
     # Advanced RAG Edge
     if advanced_rag_flag:
-        if check_input_validity_flag:
-            graph.add_edge("history_integration", "validate_input")
+        if check_input_validity_flag and parallel_validation_flag:
+            graph.add_edge("history_integration", "validate_and_transform")
             graph.add_conditional_edges(
-                "validate_input",
+                "validate_and_transform",
                 is_related,
                 {
-                    "yes": "query_transform",
+                    "yes": "retrieve_or_respond",
                     "no": END
                 }
             )
         else:
-            graph.add_edge("history_integration", "query_transform")
-        graph.add_edge("query_transform", "retrieve_or_respond")
+            if check_input_validity_flag:
+                graph.add_edge("history_integration", "validate_input")
+                graph.add_conditional_edges(
+                    "validate_input",
+                    is_related,
+                    {
+                        "yes": "query_transform",
+                        "no": END
+                    }
+                )
+            else:
+                graph.add_edge("history_integration", "query_transform")
+            graph.add_edge("query_transform", "retrieve_or_respond")
         graph.add_edge("extract_chunks", "reranking")
         graph.add_edge("reranking", "selection")
         graph.add_edge("selection", "update_context")
@@ -109,4 +157,9 @@ async def build_agent(app_config: Dict[str, Any], prompts: Dict[str, Union[str,
         graph.add_edge("extract_chunks", "update_context")
 
     # return the compiled graph (a.k.a. the AI agent)
-    return graph.compile()
\ No newline at end of file
+    agent = graph.compile()
+    if metrics is not None:
+        # The handler counts the LLM calls/tokens of the nodes and measures the tool calls
+        # (on a compiled graph, with_config returns a copy of the compiled graph with the callbacks in its config)
+        agent = agent.with_config(callbacks=[metrics.callback_handler])
+    return agent
\ No newline at end of file
@@ -0,0 +1,364 @@
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.embeddings import Embeddings
+from langchain_core.load import dumps, loads
+from langchain_core._api import LangChainBetaWarning
+from utils.metrics import record_cache_hit
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, List, Union
+import numpy as np
+import threading
+import warnings
+import hashlib
+import sqlite3
+import re
+import json
+import time
+
+
+def _prompt_text(prompt: str) -> str:
+    """
+    Extract the text of the messages from a serialized chat prompt
+
+    Parameters:
+        prompt (str): the prompt as serialized by the chat model (a json list of messages)
+
+    Returns:
+        str: the concatenated content of the messages, or the prompt itself if it is not a serialized message list
+    """
+    try:
+        messages = json.loads(prompt)
+        return "\n".join(str(message["kwargs"]["content"]) for message in messages)
+    except (ValueError, KeyError, TypeError):
+        return prompt
+
+
+class MemoryCacheBackend:
+    """
+    An in memory key-value store with LRU and TTL eviction
+    """
+    def __init__(self, max_entries: int = 1000, ttl: Union[float, None] = None):
+        """
+        Attributes:
+            max_entries (int): the maximum number of entries, the least recently used entry is evicted when exceeded
+            ttl (Union[float, None]): the number of seconds after which an entry expires (None -> never)
+        """
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Union[RETURN_VAL_TYPE, None]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created, value = entry
+            if self._ttl is not None and time.time() - created > self._ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: RETURN_VAL_TYPE) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCacheBackend:
+    """
+    An on disk (SQLite) key-value store with LRU and TTL eviction, it can be shared between processes
+    """
+    def __init__(self, path: str, max_entries: int = 10000, ttl: Union[float, None] = None):
+        """
+        Attributes:
+            path (str): the path of the SQLite database file
+            max_entries (int): the maximum number of entries, the least recently used entries are evicted when exceeded
+            ttl (Union[float, None]): the number of seconds after which an entry expires (None -> never)
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        # The connection is shared by the event loop and the worker threads, the lock serializes its usage
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+        self._connection.commit()
+
+    def get(self, key: str) -> Union[RETURN_VAL_TYPE, None]:
+        with self._lock:
+            row = self._connection.execute("SELECT value, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            now = time.time()
+            if self._ttl is not None and now - created > self._ttl:
+                self._connection.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._connection.commit()
+                return None
+            self._connection.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+        with warnings.catch_warnings():
+            # loads is flagged as beta, but it is the serializer used by the LangChain caches too
+            warnings.simplefilter("ignore", LangChainBetaWarning)
+            return loads(value)
+
+    def set(self, key: str, value: RETURN_VAL_TYPE) -> None:
+        serialized = dumps(value)
+        now = time.time()
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO llm_cache (key, value, created, accessed) VALUES (?, ?, ?, ?)", (key, serialized, now, now))
+            # Evict the least recently used entries
+            self._connection.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self._max_entries,)
+            )
+            self._connection.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM llm_cache")
+            self._connection.commit()
+
+
+def _template_pattern(template: str) -> re.Pattern:
+    """
+    Parameters:
+        template (str): a prompt template (f-string variables, e.g. "Question:{question}")
+
+    Returns:
+        re.Pattern: a pattern matching the prompts rendered from the template, with a named group for each variable
+    """
+    parts = re.split(r"\{(\w+)\}", template)
+    pattern, seen = "", set()
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            pattern += re.escape(part)
+        elif part in seen:
+            pattern += f"(?P={part})"
+        else:
+            seen.add(part)
+            pattern += f"(?P<{part}>.*?)"
+    return re.compile(pattern, re.DOTALL)
+
+
+class SemanticCacheTier:
+    """
+    An in memory cache that returns the response of the most similar prompt (cosine similarity of the embeddings).
+    Only the variable part of the prompt is embedded (e.g. the question): the fixed instructions of a prompt are the same
+    for every call and would make unrelated prompts look similar
+    """
+    def __init__(self, embedding_model: Embeddings, threshold: float = 0.97, max_entries: int = 1000, templates: Union[List[str], None] = None, variables: Union[List[str], None] = None):
+        """
+        Attributes:
+            embedding_model (Embeddings): the model used to embed the prompts
+            threshold (float): the minimum cosine similarity to consider two prompts equivalent
+            max_entries (int): the maximum number of entries for each LLM, the oldest entries are evicted when exceeded
+            templates (Union[List[str], None]): the prompt templates of the node, used to extract the variables from the prompts (None -> the whole prompt is embedded)
+            variables (Union[List[str], None]): the variables that are embedded (e.g. ["question"]), the other variables must match exactly
+        """
+        self._embedding_model = embedding_model
+        self._threshold = threshold
+        self._max_entries = max_entries
+        self._patterns = [_template_pattern(template) for template in templates] if templates else None
+        self._variables = variables or ["question"]
+        # llm_string -> OrderedDict(key -> (normalized embedding, value))
+        self._entries: Dict[str, OrderedDict] = {}
+        # exact key -> embedding computed by a lookup that missed, reused by the update following the LLM call
+        self._pending: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _split(self, prompt: str) -> Union[tuple, None]:
+        """
+        Parameters:
+            prompt (str): the serialized prompt
+
+        Returns:
+            Union[tuple, None]: the text to embed and the text that must match exactly (the fixed part and the other variables),
+            None if the prompt does not come from the node templates (the semantic tier is skipped)
+        """
+        text = _prompt_text(prompt)
+        if self._patterns is None:
+            return text, ""
+        for pattern in self._patterns:
+            match = pattern.fullmatch(text)
+            if match is None:
+                continue
+            values = match.groupdict()
+            embedded = "\n".join(values[name] for name in self._variables if name in values)
+            if not embedded.strip():
+                return None
+            exact = "\n".join([pattern.pattern] + [value for name, value in values.items() if name not in self._variables])
+            return embedded, exact
+        return None
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.array(self._embedding_model.embed_query(text), dtype=np.float32)
+        return vector / max(np.linalg.norm(vector), np.finfo(np.float32).eps)
+
+    def lookup(self, key: str, prompt: str, llm_string: str) -> Union[RETURN_VAL_TYPE, None]:
+        split = self._split(prompt)
+        if split is None:
+            return None
+        embedded, exact = split
+        vector = self._embed(embedded)
+        with self._lock:
+            self._pending[key] = vector
+            while len(self._pending) > self._max_entries:
+                self._pending.popitem(last=False)
+            entries = [(entry_vector, value) for entry_vector, entry_exact, value in self._entries.get(llm_string, {}).values() if entry_exact == exact]
+        if not entries:
+            return None
+        similarities = np.stack([entry_vector for entry_vector, _ in entries]) @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] < self._threshold:
+            return None
+        with self._lock:
+            self._pending.pop(key, None)
+        return entries[best][1]
+
+    def update(self, key: str, prompt: str, llm_string: str, value: RETURN_VAL_TYPE) -> None:
+        split = self._split(prompt)
+        if split is None:
+            return
+        embedded, exact = split
+        with self._lock:
+            vector = self._pending.pop(key, None)
+        if vector is None:
+            vector = self._embed(embedded)
+        with self._lock:
+            entries = self._entries.setdefault(llm_string, OrderedDict())
+            entries[key] = (vector, exact, value)
+            while len(entries) > self._max_entries:
+                entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._pending.clear()
+
+
+class LLMCache(BaseCache):
+    """
+    The LLM response cache, it is attached to a chat model (see LLMModel.get) and it is checked before every LLM call.
+    The exact tier is keyed by the hash of the LLM parameters (provider, model, temperature, bound tools, etc.) and of the prompt,
+    the optional semantic tier is checked only when the exact tier misses
+    """
+    def __init__(self, backend: Union[MemoryCacheBackend, SQLiteCacheBackend], semantic: Union[SemanticCacheTier, None] = None):
+        """
+        Attributes:
+            backend (Union[MemoryCacheBackend, SQLiteCacheBackend]): the exact match key-value store
+            semantic (Union[SemanticCacheTier, None]): the optional embedding similarity tier
+        """
+        self._backend = backend
+        self._semantic = semantic
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Union[RETURN_VAL_TYPE, None]:
+        value = self._backend.get(self._key(prompt, llm_string))
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            record_cache_hit()
+            return value
+
+        if self._semantic is not None:
+            value = self._semantic.lookup(self._key(prompt, llm_string), prompt, llm_string)
+            if value is not None:
+                with self._lock:
+                    self.semantic_hits += 1
+                record_cache_hit()
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = self._key(prompt, llm_string)
+        self._backend.set(key, return_val)
+        if self._semantic is not None:
+            self._semantic.update(key, prompt, llm_string, return_val)
+
+    def clear(self, **kwargs: Any) -> None:
+        self._backend.clear()
+        if self._semantic is not None:
+            self._semantic.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns:
+            Dict[str, int]: the hit/miss counters of this cache
+        """
+        with self._lock:
+            return {"hits": self.hits, "semantic_hits": self.semantic_hits, "misses": self.misses}
+
+
+def build_node_caches(config: Dict[str, Any], embedding_model: Union[Embeddings, None] = None, prompts: Union[Dict[str, Union[str, Dict[str, str]]], None] = None) -> Dict[str, LLMCache]:
+    """
+    Create an LLM cache for each node that enables it.
+    All the caches share the same backend, but each node has its own hit/miss counters (and its own semantic tier)
+
+    Parameters:
+        config (Dict[str, Any]): the llm_cache configuration
+        embedding_model (Union[Embeddings, None]): the embedding model, required only by the nodes using the semantic tier
+        prompts (Union[Dict[str, Union[str, Dict[str, str]]], None]): the prompts of the nodes, the semantic tier embeds only their variables
+
+    Returns:
+        Dict[str, LLMCache]: the cache of each node (keyed by the node prompt name, e.g. "history", "reranking")
+
+    Raises:
+        NotImplementedError: if the cache backend or the node cache mode is not supported
+    """
+    if not config.get("enabled", False):
+        return {}
+
+    backend_type = config.get("backend", "memory")
+    if backend_type == "memory":
+        backend = MemoryCacheBackend(config.get("max_entries", 1000), config.get("ttl", None))
+    elif backend_type == "sqlite":
+        backend = SQLiteCacheBackend(config.get("path", "./cache/llm_cache.sqlite"), config.get("max_entries", 10000), config.get("ttl", None))
+    else:
+        raise NotImplementedError(f"LLM cache backend {backend_type} not supported")
+
+    semantic_options = config.get("semantic", {})
+
+    caches = {}
+    # node -> False (no cache), "exact" (exact tier only), "semantic" (exact and semantic tiers)
+    for node, mode in config.get("nodes", {}).items():
+        if not mode:
+            continue
+        if mode == "exact":
+            caches[node] = LLMCache(backend)
+        elif mode == "semantic":
+            if embedding_model is None:
+                raise Exception("embedding model is required when using the semantic cache")
+            template = (prompts or {}).get(node)
+            templates = list(template.values()) if isinstance(template, dict) else [template] if template else None
+            semantic = SemanticCacheTier(
+                embedding_model,
+                semantic_options.get("threshold", 0.97),
+                semantic_options.get("max_entries", 1000),
+                templates,
+                semantic_options.get("variables", ["question"])
+            )
+            caches[node] = LLMCache(backend, semantic)
+        else:
+            raise NotImplementedError(f"LLM cache mode {mode} not supported")
+    return caches
@@ -1,8 +1,36 @@
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
-from langchain_openai.embeddings import OpenAIEmbeddings
-from langchain_ollama import OllamaEmbeddings
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_core.embeddings import Embeddings
+from utils.registry import ModelRegistry
+from typing import Dict, Any, List, Callable
+
+# The Embedding models are shared by all the components of the process
+_REGISTRY = ModelRegistry("embedding", ["embedding_provider", "embedding_model", "embedding_host"])
+
+# The provider integrations are imported only when their provider is used,
+# HuggingFace in particular pulls in torch and transformers
+
+def _huggingface(config: Dict[str, str]) -> Embeddings:
+    from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=config["embedding_model"])
+
+def _openai(config: Dict[str, str]) -> Embeddings:
+    from langchain_openai.embeddings import OpenAIEmbeddings
+    return OpenAIEmbeddings(model=config["embedding_model"])
+
+def _ollama(config: Dict[str, str]) -> Embeddings:
+    from langchain_ollama import OllamaEmbeddings
+    return OllamaEmbeddings(model=config["embedding_model"])
+
+def _google(config: Dict[str, str]) -> Embeddings:
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    return GoogleGenerativeAIEmbeddings(model=config["embedding_model"])
+
+# embedding_provider -> function creating the Embedding model from its configuration
+_PROVIDERS: Dict[str, Callable[[Dict[str, str]], Embeddings]] = {
+    "huggingface": _huggingface,
+    "openai": _openai,
+    "ollama": _ollama,
+    "google": _google
+}
 
 class EmbeddingModel:
     """
@@ -11,7 +39,8 @@ class EmbeddingModel:
 
     def __init__(self, config: dict[str, str]):
         """
-        Instantiate the right Embedding model based on the configuration file
+        Instantiate the right Embedding model based on the configuration file.
+        The model is created only once for each provider/model/host, the following instances share it
 
         Parameters:
             config (Dict[str, str]): the configuration file for the Embedding Model
@@ -19,16 +48,33 @@ class EmbeddingModel:
             NotImplementedError: when the configuration file contains a not supported Embedding provider
 
         """
-        if config["embedding_provider"] == "huggingface":
-            self.embedding_model = HuggingFaceEmbeddings(model_name=config["embedding_model"])
-        elif config["embedding_provider"] == "openai":
-            self.embedding_model = OpenAIEmbeddings(model=config["embedding_model"])
-        elif config["embedding_provider"] == "ollama":
-            self.embedding_model = OllamaEmbeddings(model=config["embedding_model"])
-        elif config["embedding_provider"] == "google":
-            self.embedding_model = GoogleGenerativeAIEmbeddings(model=config["embedding_model"])
-        else:
+        self.embedding_model = _REGISTRY.get_or_create(config, lambda: self._create(config))
+
+    @staticmethod
+    def _create(config: dict[str, str]) -> Embeddings:
+        factory = _PROVIDERS.get(config["embedding_provider"])
+        if factory is None:
             raise NotImplementedError(f"Embedding provider {config["embedding_provider"]} not supported")
+        return factory(config)
+
+    @staticmethod
+    def register_provider(name: str, factory: Callable[[Dict[str, str]], Embeddings]) -> None:
+        """
+        Add (or replace) an Embedding provider, the factory should import its integration only when called
+
+        Parameters:
+            name (str): the value of embedding_provider selecting the provider
+            factory (Callable[[Dict[str, str]], Embeddings]): creates the Embedding model from its configuration
+        """
+        _PROVIDERS[name] = factory
+
+    @staticmethod
+    def stats() -> List[Dict[str, Any]]:
+        """
+        Returns:
+            List[Dict[str, Any]]: the load time and the number of requests of each loaded Embedding model
+        """
+        return _REGISTRY.stats()
 
     def get(self) -> Embeddings:
         """
@@ -0,0 +1,163 @@
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain.prompts import PromptTemplate
+from langchain_core.prompt_values import PromptValue
+from utils.llm import LLMModel
+from utils.tokens import count_tokens, truncate_tokens
+from typing import Dict, Any, List, Tuple, Union
+import re
+
+# Words referring to something said before in the conversation (pronouns, demonstratives, ...)
+_ANAPHORA = {
+    "it", "its", "it's", "they", "them", "their", "theirs", "he", "him", "his", "she", "her", "hers",
+    "this", "that", "these", "those", "there", "former", "latter", "above", "previous", "aforementioned",
+    "same", "such", "also", "too", "else", "again", "more", "other", "another"
+}
+# Follow-up questions often start with a conjunction ("and the stocks?", "what about ...")
+_FOLLOW_UP_STARTS = ("and ", "but ", "so ", "then ", "or ", "what about", "how about", "why not", "what else")
+# Questions shorter than this are usually follow-ups ("why?", "how much?")
+_MIN_SELF_CONTAINED_WORDS = 4
+
+
+def needs_history(question: str) -> bool:
+    """
+    A cheap heuristic checking if a question may refer to the previous turns of the conversation
+
+    Parameters:
+        question (str): the user's question
+
+    Returns:
+        bool: False if the question looks self-contained (no anaphora), so it does not need to be rewritten with the chat history
+    """
+    text = question.strip().lower()
+    words = re.findall(r"[a-z']+", text)
+    if len(words) < _MIN_SELF_CONTAINED_WORDS:
+        return True
+    if text.startswith(_FOLLOW_UP_STARTS):
+        return True
+    return any(word in _ANAPHORA for word in words)
+
+
+class ChatHistory:
+    """
+    The chat history of a conversation, kept under a token budget: the last turns are kept verbatim,
+    the older turns are folded into a rolling summary. The summary is updated incrementally,
+    only the turns leaving the window are sent to the LLM (with the previous summary)
+    """
+    def __init__(self, llm: BaseChatModel, prompt: str, max_tokens: int = 1000, keep_turns: int = 3, summary_max_tokens: int = 300):
+        """
+        Attributes:
+            llm (BaseChatModel): the LLM updating the summary
+            prompt (str): the prompt used to update the summary
+            max_tokens (int): the maximum number of (estimated) tokens of the history
+            keep_turns (int): the maximum number of turns kept verbatim
+            summary_max_tokens (int): the maximum number of (estimated) tokens of the summary
+        """
+        self._llm = llm
+        self._prompt = prompt
+        self._max_tokens = max_tokens
+        self._keep_turns = keep_turns
+        self._summary_max_tokens = summary_max_tokens
+        self._summary = ""
+        # (question, answer) of the turns kept verbatim, the oldest first
+        self._turns: List[Tuple[str, str]] = []
+
+    @staticmethod
+    def _format_turns(turns: List[Tuple[str, str]]) -> str:
+        return "\n".join(f"User: {question}\nAssistant: {answer}" for question, answer in turns)
+
+    def _summary_text(self) -> str:
+        return f"Summary of the previous turns: {self._summary}" if self._summary else ""
+
+    def history(self) -> str:
+        """
+        Returns:
+            str: the chat history given to the agent (the summary, then the last turns), within the token budget
+        """
+        text = "\n".join(part for part in [self._summary_text(), self._format_turns(self._turns)] if part)
+        # a single long turn can exceed the budget, the most recent text is kept
+        return truncate_tokens(text, self._max_tokens, keep_end=True)
+
+    def add_turn(self, question: str, answer: str) -> None:
+        """
+        Add a turn of the conversation, call compact/acompact to fold the older turns into the summary
+
+        Parameters:
+            question (str): the user's question
+            answer (str): the agent's answer
+        """
+        self._turns.append((question, answer))
+
+    def _evicted_turns(self) -> List[Tuple[str, str]]:
+        """
+        Returns:
+            List[Tuple[str, str]]: the oldest turns that must leave the window (the last turn is always kept)
+        """
+        evicted = 0
+        while len(self._turns) - evicted > 1 and (
+            len(self._turns) - evicted > self._keep_turns
+            or count_tokens(self._summary_text()) + count_tokens(self._format_turns(self._turns[evicted:])) > self._max_tokens
+        ):
+            evicted += 1
+        return self._turns[:evicted]
+
+    def _build_prompt(self, turns: List[Tuple[str, str]]) -> PromptValue:
+        """
+        Parameters:
+            turns (List[Tuple[str, str]]): the turns to add to the summary
+
+        Returns:
+            PromptValue: the prompt used to update the summary
+        """
+        return PromptTemplate.from_template(self._prompt).invoke({
+            "summary": self._summary or "(empty)",
+            "turns": self._format_turns(turns),
+            "max_words": int(self._summary_max_tokens * 0.75)
+        })
+
+    def _update(self, turns: List[Tuple[str, str]], summary: str) -> None:
+        """
+        Parameters:
+            turns (List[Tuple[str, str]]): the turns added to the summary
+            summary (str): the updated summary
+        """
+        self._turns = self._turns[len(turns):]
+        self._summary = truncate_tokens(summary.strip(), self._summary_max_tokens)
+
+    def compact(self) -> None:
+        """
+        Fold the turns outside the window into the summary (a single LLM call, none if the history is within its budget)
+        """
+        turns = self._evicted_turns()
+        if turns:
+            self._update(turns, self._llm.invoke(self._build_prompt(turns)).content)
+
+    async def acompact(self) -> None:
+        """
+        Asynchronous version of **compact**
+        """
+        turns = self._evicted_turns()
+        if turns:
+            self._update(turns, (await self._llm.ainvoke(self._build_prompt(turns))).content)
+
+    def clear(self) -> None:
+        self._summary = ""
+        self._turns = []
+
+
+def build_chat_history(app_config: Dict[str, Any], prompts: Dict[str, Union[str, Dict[str, str]]]) -> ChatHistory:
+    """
+    Parameters:
+        app_config (Dict[str, Any]): the application configuration, its "chat_history" section sets the budget
+        prompts (Dict[str, Union[str, Dict[str, str]]]): the prompts, "history_summary" is used to update the summary
+
+    Returns:
+        ChatHistory: an empty chat history
+    """
+    options = app_config.get("chat_history", {})
+    return ChatHistory(
+        LLMModel(app_config["llm"]).get(),
+        prompts["history_summary"],
+        options.get("max_tokens", 1000),
+        options.get("keep_turns", 3),
+        options.get("summary_max_tokens", 300)
+    )
@@ -1,8 +1,87 @@
-from langchain_openai.chat_models import ChatOpenAI
-from langchain_google_genai.chat_models import ChatGoogleGenerativeAI
-from langchain_ollama.chat_models import ChatOllama
 from langchain_core.language_models.chat_models import BaseChatModel
-from typing import Dict, Any
+from langchain_core.caches import BaseCache
+from utils.registry import ModelRegistry
+from typing import Dict, Any, List, Union, Callable
+import sys
+
+# The LLMs are shared by all the components of the process (the other configuration fields, e.g. the reranking options, are ignored)
+_REGISTRY = ModelRegistry("llm", ["llm_provider", "llm_model", "llm_host", "temperature", "stream_usage"])
+
+# The provider integrations are imported only when their provider is used,
+# so a process configured for one provider does not pay for importing the others
+
+def _lm_studio(config: Dict[str, Any]) -> BaseChatModel:
+    from langchain_openai.chat_models import ChatOpenAI
+    return ChatOpenAI(
+        name=config["llm_model"], 
+        base_url=config["llm_host"], 
+        api_key="not needed", 
+        temperature=config["temperature"],
+        # opt-in: the token usage is also reported when the answer is streamed (see the metrics),
+        # some OpenAI compatible servers reject the stream_options field it adds to the requests
+        stream_usage=config.get("stream_usage", False)
+    )
+
+def _google(config: Dict[str, Any]) -> BaseChatModel:
+    from langchain_google_genai.chat_models import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(
+        model=config["llm_model"], 
+        temperature=config["temperature"]
+    )
+
+def _openai(config: Dict[str, Any]) -> BaseChatModel:
+    from langchain_openai.chat_models import ChatOpenAI
+    return ChatOpenAI(
+        name=config["llm_model"], 
+        base_url=config["llm_host"], 
+        temperature=config["temperature"],
+        stream_usage=config.get("stream_usage", False)
+    )
+
+def _ollama(config: Dict[str, Any]) -> BaseChatModel:
+    from langchain_ollama.chat_models import ChatOllama
+    return ChatOllama(
+        model=config["llm_model"], 
+        temperature=config["temperature"]
+    )
+
+# The exceptions of the provider clients for the failures of a call (HTTP status, rate limits, connection errors),
+# as (module, class name) pairs: only the installed integrations are checked, see is_provider_error
+_PROVIDER_ERRORS = [
+    ("httpx", "HTTPError"),
+    ("openai", "APIError"),
+    ("ollama", "ResponseError"),
+    ("google.api_core.exceptions", "GoogleAPIError"),
+    ("langchain_google_genai.chat_models", "ChatGoogleGenerativeAIError")
+]
+
+def is_provider_error(error: BaseException) -> bool:
+    """
+    Parameters:
+        error (BaseException): the exception raised by an LLM call
+
+    Returns:
+        bool: True for a timeout, a network error or an error returned by the provider,
+            False for the other exceptions (e.g. programming errors, which must not be hidden)
+    """
+    # TimeoutError (also raised by asyncio.wait_for) and ConnectionError are OSError subclasses
+    if isinstance(error, OSError):
+        return True
+    for module_name, class_name in _PROVIDER_ERRORS:
+        # Only the modules already imported by a provider integration can have raised the error
+        module = sys.modules.get(module_name)
+        error_type = getattr(module, class_name, None) if module is not None else None
+        if error_type is not None and isinstance(error, error_type):
+            return True
+    return False
+
+# llm_provider -> function creating the LLM from its configuration
+_PROVIDERS: Dict[str, Callable[[Dict[str, Any]], BaseChatModel]] = {
+    "lm-studio": _lm_studio,
+    "google": _google,
+    "openai": _openai,
+    "ollama": _ollama
+}
 
 class LLMModel:
     """
@@ -11,7 +90,8 @@ class LLMModel:
     
     def __init__(self, config: Dict[str, Any]):
         """
-        Instantiate the right LLM model based on the configuration file
+        Instantiate the right LLM model based on the configuration file.
+        The LLM is created only once for each provider/model/host/temperature, the following instances share it
 
         Parameters:
             config (Dict[str, Any]): the configuration file for the LLM
@@ -19,35 +99,43 @@ class LLMModel:
             NotImplementedError: when the configuration file contains a not supported LLM provider
 
         """
-        if config["llm_provider"] == "lm-studio":
-            self._llm = ChatOpenAI(
-                name=config["llm_model"], 
-                base_url=config["llm_host"], 
-                api_key="not needed", 
-                temperature=config["temperature"]
-            )
-        elif config["llm_provider"] == "google":
-            self._llm = ChatGoogleGenerativeAI(
-                model=config["llm_model"], 
-                temperature=config["temperature"]
-            )
-        elif config["llm_provider"] == "openai":
-            self._llm = ChatOpenAI(
-                name=config["llm_model"], 
-                base_url=config["llm_host"], 
-                temperature=config["temperature"]
-            )
-        elif config["llm_provider"] == "ollama":
-            self._llm = ChatOllama(
-                model=config["llm_model"], 
-                temperature=config["temperature"]
-            )
-        else:
+        self._llm = _REGISTRY.get_or_create(config, lambda: self._create(config))
+
+    @staticmethod
+    def _create(config: Dict[str, Any]) -> BaseChatModel:
+        factory = _PROVIDERS.get(config["llm_provider"])
+        if factory is None:
             raise NotImplementedError(f"LLM provider {config["llm_provider"]} not supported")
-        
-    def get(self) -> BaseChatModel:
+        return factory(config)
+
+    @staticmethod
+    def register_provider(name: str, factory: Callable[[Dict[str, Any]], BaseChatModel]) -> None:
+        """
+        Add (or replace) an LLM provider, the factory should import its integration only when called
+
+        Parameters:
+            name (str): the value of llm_provider selecting the provider
+            factory (Callable[[Dict[str, Any]], BaseChatModel]): creates the LLM from its configuration
+        """
+        _PROVIDERS[name] = factory
+
+    @staticmethod
+    def stats() -> List[Dict[str, Any]]:
         """
+        Returns:
+            List[Dict[str, Any]]: the load time and the number of requests of each loaded LLM
+        """
+        return _REGISTRY.stats()
+
+    def get(self, cache: Union[BaseCache, None] = None) -> BaseChatModel:
+        """
+        Parameters:
+            cache (Union[BaseCache, None]): an optional response cache, checked before every LLM call
+
         Returns:
             BaseChatModel: the selected LLM
         """
-        return self._llm
\ No newline at end of file
+        if cache is None:
+            return self._llm
+        # Shallow copy: the copy shares the HTTP clients of the original LLM
+        return self._llm.model_copy(update={"cache": cache})
@@ -0,0 +1,330 @@
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import Runnable, RunnableConfig
+from collections import deque
+from contextvars import ContextVar
+import queue
+from pathlib import Path
+from typing import Dict, Any, List, Union, Callable
+from uuid import UUID
+import numpy as np
+import asyncio
+import threading
+import json
+import time
+
+# The record of the node running in the current context, the LLM calls and the cache hits are added to it
+_current_record: ContextVar[Union[Dict[str, Any], None]] = ContextVar("metrics_current_record", default=None)
+# The LLM call running in the current context, set when the call starts (the callback handler runs inline)
+_current_llm_run: ContextVar[Union[UUID, None]] = ContextVar("metrics_current_llm_run", default=None)
+# Serializes the updates of the records, the LLM calls of a node can run concurrently (e.g. reranking)
+_record_lock = threading.Lock()
+
+
+def record_cache_hit() -> None:
+    """
+    Count a response cache hit for the running node (called by the LLM caches, see utils/cache.py),
+    the tokens of a cached response are not counted
+    """
+    record = _current_record.get()
+    if record is None:
+        return
+    with _record_lock:
+        record["cache_hits"] += 1
+        run_id = _current_llm_run.get()
+        if run_id is not None:
+            record["_cached_runs"].add(run_id)
+
+
+def _token_usage(response: LLMResult) -> tuple:
+    """
+    Parameters:
+        response (LLMResult): the response of an LLM call
+
+    Returns:
+        tuple: the number of prompt and completion tokens, as reported by the provider (0 if not reported)
+    """
+    prompt_tokens, completion_tokens = 0, 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+    if not prompt_tokens and not completion_tokens and response.llm_output:
+        usage = response.llm_output.get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0) or 0
+        completion_tokens = usage.get("completion_tokens", 0) or 0
+    return prompt_tokens, completion_tokens
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Counts the LLM calls and tokens of each node, and measures the tool calls.
+    It runs inline (in the context of the caller), so it knows which node made the call
+    """
+    run_inline = True
+
+    def __init__(self, collector: "MetricsCollector"):
+        """
+        Attributes:
+            collector (MetricsCollector): the collector receiving the tool records
+        """
+        self._collector = collector
+        # run id -> record of the node that started the LLM call / record of the tool call
+        self._llm_runs: Dict[UUID, Dict[str, Any]] = {}
+        self._tool_runs: Dict[UUID, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _on_llm_start(self, run_id: UUID) -> None:
+        record = _current_record.get()
+        if record is None:
+            return
+        _current_llm_run.set(run_id)
+        with self._lock:
+            self._llm_runs[run_id] = record
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._on_llm_start(run_id)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any) -> None:
+        self._on_llm_start(run_id)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            record = self._llm_runs.pop(run_id, None)
+        if record is None:
+            return
+        with _record_lock:
+            if run_id in record["_cached_runs"]:
+                return
+            prompt_tokens, completion_tokens = _token_usage(response)
+            record["llm_calls"] += 1
+            record["prompt_tokens"] += prompt_tokens
+            record["completion_tokens"] += completion_tokens
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            record = self._llm_runs.pop(run_id, None)
+        if record is not None:
+            with _record_lock:
+                record["llm_calls"] += 1
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        with self._lock:
+            self._tool_runs[run_id] = self._collector.new_record("tool", name)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            record = self._tool_runs.pop(run_id, None)
+        if record is not None:
+            self._collector.finish(record)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            record = self._tool_runs.pop(run_id, None)
+        if record is not None:
+            self._collector.finish(record, error)
+
+
+class MetricsCollector:
+    """
+    Records the latency, the LLM calls, the tokens, the chunks and the cache hits of every node and tool call of the agent,
+    exports each record as a JSON line and keeps the latencies in memory for the p50/p95/p99 summary.
+    The records are written by a background thread, so the nodes (and the event loop) never wait for the disk
+    """
+    def __init__(self, export_path: Union[str, None] = None, max_samples: int = 10000):
+        """
+        Attributes:
+            export_path (Union[str, None]): the JSONL file the records are appended to (None -> no export)
+            max_samples (int): the number of most recent latencies kept for each node/tool
+            callback_handler (MetricsCallbackHandler): the handler to attach to the agent (see build_agent)
+        """
+        self._export_path = Path(export_path) if export_path else None
+        # the records waiting to be written (None -> stop the writer)
+        self._export_queue: Union[queue.SimpleQueue, None] = None
+        self._writer: Union[threading.Thread, None] = None
+        if self._export_path is not None:
+            self._export_path.parent.mkdir(parents=True, exist_ok=True)
+            self._export_queue = queue.SimpleQueue()
+            self._writer = threading.Thread(target=self._write_records, name="metrics-writer", daemon=True)
+            self._writer.start()
+        self._max_samples = max_samples
+        self._lock = threading.Lock()
+        # (kind, name) -> latencies and totals
+        self._latencies: Dict[tuple, deque] = {}
+        self._totals: Dict[tuple, Dict[str, int]] = {}
+        self.callback_handler = MetricsCallbackHandler(self)
+
+    @staticmethod
+    def new_record(kind: str, name: str, chunks_in: Union[int, None] = None) -> Dict[str, Any]:
+        return {
+            "kind": kind,
+            "name": name,
+            "start": time.perf_counter(),
+            "llm_calls": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cache_hits": 0,
+            "chunks_in": chunks_in,
+            "chunks_out": None,
+            "_cached_runs": set()
+        }
+
+    def finish(self, record: Dict[str, Any], error: Union[BaseException, None] = None) -> None:
+        """
+        Complete a record, add it to the summary and export it
+
+        Parameters:
+            record (Dict[str, Any]): the record created by new_record
+            error (Union[BaseException, None]): the error raised by the node/tool, if any
+        """
+        latency = time.perf_counter() - record.pop("start")
+        record.pop("_cached_runs")
+        record = {"timestamp": time.time(), **record, "latency_s": latency, "error": type(error).__name__ if error else None}
+        key = (record["kind"], record["name"])
+        with self._lock:
+            self._latencies.setdefault(key, deque(maxlen=self._max_samples)).append(latency)
+            totals = self._totals.setdefault(key, {"count": 0, "errors": 0, "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cache_hits": 0})
+            totals["count"] += 1
+            totals["errors"] += 1 if error else 0
+            for field in ["llm_calls", "prompt_tokens", "completion_tokens", "cache_hits"]:
+                totals[field] += record[field]
+        if self._export_queue is not None:
+            self._export_queue.put(record)
+
+    def _write_records(self) -> None:
+        """
+        The body of the writer thread: appends the queued records to the export file, in batches
+        """
+        with open(self._export_path, "a") as f:
+            stop = False
+            while not stop:
+                records = [self._export_queue.get()]
+                # the records queued in the meantime are written with a single flush
+                while not self._export_queue.empty():
+                    records.append(self._export_queue.get())
+                stop = None in records
+                f.writelines(json.dumps(record) + "\n" for record in records if record is not None)
+                f.flush()
+
+    def close(self) -> None:
+        """
+        Write the queued records and stop the writer thread, the records finished afterwards are not exported
+        """
+        if self._writer is not None:
+            self._export_queue.put(None)
+            self._writer.join()
+            self._writer, self._export_queue = None, None
+
+    def _begin_node(self, name: str, state: Dict[str, Any]) -> tuple:
+        chunks = state.get("chunks") if isinstance(state, dict) else None
+        record = self.new_record("node", name, len(chunks) if chunks is not None else None)
+        return record, _current_record.set(record)
+
+    def _end_node(self, record: Dict[str, Any], token: Any, result: Any, error: Union[BaseException, None] = None) -> None:
+        _current_record.reset(token)
+        # A node returns only the state fields it updates, the chunks are unchanged if it does not return them
+        if isinstance(result, dict) and result.get("chunks") is not None:
+            record["chunks_out"] = len(result["chunks"])
+        elif isinstance(result, dict) and "chunks" in result and record["chunks_in"] is not None:
+            # the chunks were consumed (e.g. added to the context by update_context)
+            record["chunks_out"] = 0
+        elif error is None:
+            record["chunks_out"] = record["chunks_in"]
+        self.finish(record, error)
+
+    def wrap_node(self, name: str, action: Union[Callable, Runnable]) -> Callable:
+        """
+        Parameters:
+            name (str): the name of the node
+            action (Union[Callable, Runnable]): the node (a function, a coroutine function or a runnable like ToolNode)
+
+        Returns:
+            Callable: the node measured by this collector, with the same synchronous/asynchronous behaviour
+        """
+        if isinstance(action, Runnable):
+            async def run_runnable(state: Dict[str, Any], config: RunnableConfig):
+                record, token = self._begin_node(name, state)
+                try:
+                    result = await action.ainvoke(state, config)
+                except BaseException as e:
+                    self._end_node(record, token, None, e)
+                    raise
+                self._end_node(record, token, result)
+                return result
+            return run_runnable
+
+        if asyncio.iscoroutinefunction(action):
+            async def run_async(state: Dict[str, Any]):
+                record, token = self._begin_node(name, state)
+                try:
+                    result = await action(state)
+                except BaseException as e:
+                    self._end_node(record, token, None, e)
+                    raise
+                self._end_node(record, token, result)
+                return result
+            return run_async
+
+        def run_sync(state: Dict[str, Any]):
+            record, token = self._begin_node(name, state)
+            try:
+                result = action(state)
+            except BaseException as e:
+                self._end_node(record, token, None, e)
+                raise
+            self._end_node(record, token, result)
+            return result
+        return run_sync
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns:
+            Dict[str, Dict[str, Any]]: for each node/tool ("node:<name>", "tool:<name>"), its call count, latency percentiles (p50/p95/p99, mean)
+            over the most recent calls, and its LLM calls, tokens and cache hits over all the calls
+        """
+        with self._lock:
+            items = [(key, list(self._latencies[key]), dict(self._totals[key])) for key in self._latencies]
+        summary = {}
+        for (kind, name), latencies, totals in items:
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            summary[f"{kind}:{name}"] = {
+                **totals,
+                "p50_s": float(p50),
+                "p95_s": float(p95),
+                "p99_s": float(p99),
+                "mean_s": float(np.mean(latencies))
+            }
+        return summary
+
+    def clear(self) -> None:
+        with self._lock:
+            self._latencies.clear()
+            self._totals.clear()
+
+    def print_summary(self) -> None:
+        summary = self.summary()
+        if not summary:
+            return
+        print(f"\n{'-'*36} Metrics {'-'*35}")
+        print(f"{'name':<32}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'llm':>6}{'tokens in/out':>16}{'cache':>7}")
+        # The slowest nodes/tools first
+        for name, metrics in sorted(summary.items(), key=lambda item: item[1]["p95_s"], reverse=True):
+            tokens = f"{metrics['prompt_tokens']}/{metrics['completion_tokens']}"
+            print(f"{name:<32}{metrics['count']:>7}{metrics['p50_s']:>8.2f}s{metrics['p95_s']:>8.2f}s{metrics['p99_s']:>8.2f}s{metrics['llm_calls']:>6}{tokens:>16}{metrics['cache_hits']:>7}")
+        print(f"{'-'*80}")
+
+
+def build_metrics(config: Dict[str, Any]) -> Union[MetricsCollector, None]:
+    """
+    Parameters:
+        config (Dict[str, Any]): the metrics configuration
+
+    Returns:
+        Union[MetricsCollector, None]: the metrics collector, None when the metrics are disabled
+    """
+    if not config.get("enabled", False):
+        return None
+    return MetricsCollector(config.get("export_path", None), config.get("max_samples", 10000))
@@ -4,14 +4,17 @@ import io
 from pathlib import Path
 from langchain_core.messages import HumanMessage
 from utils.state import AgentState
+from indexing.manifest import Manifest
+from indexing.vectorstore import VectorStore
 from langchain_core.runnables.graph import MermaidDrawMethod
 import time
-from typing import List
+from typing import List, Dict, Any, Tuple, AsyncIterator
 
 async def get_topics(folder_path: str) -> List[str]:
     """
     Returns the vector stores topics.
-    This is a simple implementation that uses the folder names as topics
+    This is a simple implementation that uses the folder names as topics,
+    or the topics recorded in the manifest of the shared store
 
     Parameters:
         folder_path (str): the path to the folder containing the vector stores
@@ -25,8 +28,15 @@ async def get_topics(folder_path: str) -> List[str]:
         raise FileNotFoundError(f"{store_dir} is not a existing directory")
     
     topics=["measurement_unit_conversion"]
+    manifest = Manifest(store_dir)
+    if manifest.exists():
+        topics.extend(manifest.topics())
+        return topics
+
     for dir in store_dir.iterdir():
-        topics.append(dir.name)
+        # The same stores as get_tools (e.g. not the directory left behind by a failed ingestion)
+        if dir.is_dir() and (VectorStore.is_saved("faiss", dir) or VectorStore.is_saved("chroma", dir)):
+            topics.append(dir.name)
 
     return topics
 
@@ -42,46 +52,95 @@ async def save_to_png(agent: CompiledStateGraph, file_name: str) -> None:
     img = Image.open(io.BytesIO(img_data))
     img.save(file_name)
 
-async def stream_response(agent: CompiledStateGraph[AgentState], user_query: str, chat_history: str,  verbosity: int = 0) -> str:
+# The node generating the answer, its tokens are streamed (see stream_steps)
+ANSWER_NODE = "generate_answer"
+
+async def stream_steps(agent: CompiledStateGraph[AgentState], user_query: str, chat_history: str, stream_tokens: bool = False) -> AsyncIterator[Tuple[str, str, Any, float]]:
     """
-    Print on the console, the steps/nodes invoked by the agent to answer the user's query
+    Run the agent on the user's query, yielding the steps/nodes as soon as they are executed
+    and, if stream_tokens is True, the tokens of the answer as soon as they are generated
 
     Parameters:
         agent (CompiledStateGraph[AgentState]): the agent/compiled graph
         user_query (str): the user's query/question that the agent try to answer
         chat_history (str): the current chat history between the user and the agent
-        verbosity (int): a non negative integer used to control the granuality of the informations showed on the console. [0 -> Only the steps, 1 -> Steps and Messages, 2 -> Steps, Messages, and State]
-    
+        stream_tokens (bool): stream the tokens generated by the answer node
+
     Returns:
-        str: The final answer generated by the agent
+        AsyncIterator[Tuple[str, str, Any, float]]: the events as (kind, node, data, elapsed) where
+        kind is "step" (data is the agent's state after the node execution, elapsed the node duration in seconds) or
+        "token" (data is the text of the token, elapsed the time since the query in seconds)
     """
-    last_msg = None
-    prefix = "\n" if verbosity > 0 else ""
-    start = time.time()
+    query_start = time.time()
+    start = query_start
+    # "messages" makes the LLMs called by the nodes stream their tokens (when their provider supports it),
+    # the complete message is still returned to the node, so the output validation sees the full answer
+    stream_mode = ["updates", "messages"] if stream_tokens else ["updates"]
 
     # Using .astream() [and async for loop] because the tools loaded from custom MCP server (type: StructuredTool) can only be used asynchronously.
     # At the time of writing The synchronous methods are not implemented yet
-    async for event in agent.astream(AgentState.create(messages=[HumanMessage(user_query)], question=user_query, history=chat_history)):
+    async for mode, event in agent.astream(AgentState.create(messages=[HumanMessage(user_query)], question=user_query, history=chat_history), stream_mode=stream_mode):
+        if mode == "messages":
+            chunk, metadata = event
+            if metadata.get("langgraph_node") == ANSWER_NODE and chunk.content:
+                yield "token", ANSWER_NODE, chunk.content, time.time() - query_start
+            continue
         # An event is generated every time a node is executed 
         # An event is the agent's state after each node execution
         end = time.time()
         for key, value in event.items():
-            print(f"{prefix}STEP: {key} ({(end - start):.2f}s)", flush=True)
-            last_msg =  value["messages"][-1]
-            if verbosity > 0:
-                last_msg.pretty_print()
-                if verbosity > 1:
-                    if last_msg.type != "tool":
-                        print(f"\n{'-'*36} STATE {'-'*37}")
-                        print(f"Question: {value["question"]}")
-                        print(f"Original Question: {value["original_question"]}")
-                        context = (value["context"][:100]) if value["context"] else ""
-                        print(f"Context: {context}")
-                        print(f"Reranking score: {value["reranking_score"]}")
-                        chunks = (str(value["chunks"])[:100]) if value["chunks"] else value["chunks"]
-                        print(f"Chunks: {chunks}")
-                        print(f"Chat History:\n{chat_history}")
-                        print(f"{'-'*80}")
+            yield "step", key, value, end - start
         start = end
 
+async def stream_response(agent: CompiledStateGraph[AgentState], user_query: str, chat_history: str,  verbosity: int = 0, stream_tokens: bool = False) -> str:
+    """
+    Print on the console, the steps/nodes invoked by the agent to answer the user's query
+
+    Parameters:
+        agent (CompiledStateGraph[AgentState]): the agent/compiled graph
+        user_query (str): the user's query/question that the agent try to answer
+        chat_history (str): the current chat history between the user and the agent
+        verbosity (int): a non negative integer used to control the granuality of the informations showed on the console. [0 -> Only the steps, 1 -> Steps and Messages, 2 -> Steps, Messages, and State]
+        stream_tokens (bool): print the answer while it is generated
+    
+    Returns:
+        str: The final answer generated by the agent
+    """
+    last_msg = None
+    prefix = "\n" if verbosity > 0 else ""
+    streamed = ""
+
+    async for kind, key, value, elapsed in stream_steps(agent, user_query, chat_history, stream_tokens):
+        if kind == "token":
+            if not streamed:
+                first_token = f" (first token after {elapsed:.2f}s)" if verbosity > 0 else ""
+                print(f"\n{'-'*36} Answer {'-'*36}{first_token}")
+            print(value, end="", flush=True)
+            streamed += value
+            continue
+        if streamed and key == ANSWER_NODE:
+            print()
+        print(f"{prefix}STEP: {key} ({elapsed:.2f}s)", flush=True)
+        last_msg =  value["messages"][-1]
+        # The streamed answer is not printed again (e.g. after the output validation, when the answer is valid)
+        if verbosity > 0 and not (streamed and last_msg.content == streamed):
+            last_msg.pretty_print()
+            if verbosity > 1:
+                if last_msg.type != "tool":
+                    print(f"\n{'-'*36} STATE {'-'*37}")
+                    print(f"Question: {value["question"]}")
+                    print(f"Original Question: {value["original_question"]}")
+                    context = (value["context"][:100]) if value["context"] else ""
+                    print(f"Context: {context}")
+                    print(f"Context tokens saved: {value["context_tokens_saved"]}")
+                    print(f"Reranking score: {value["reranking_score"]}")
+                    chunks = (str(value["chunks"])[:100]) if value["chunks"] else value["chunks"]
+                    print(f"Chunks: {chunks}")
+                    print(f"Chat History:\n{chat_history}")
+                    print(f"{'-'*80}")
+
+    # The answer is printed if it was not streamed, or if it was replaced (e.g. by the output validation)
+    if stream_tokens and last_msg.content != streamed:
+        print(f"\n{'-'*36} Answer {'-'*36}\n{last_msg.content}")
+
     return last_msg.content
\ No newline at end of file
@@ -0,0 +1,78 @@
+from typing import Dict, Any, List, Callable, TypeVar
+import threading
+import time
+
+T = TypeVar("T")
+
+
+class ModelRegistry:
+    """
+    A process-wide registry of model instances (LLMs, embedding models), keyed by the configuration fields
+    that identify a model, so every component configured with the same model shares one instance
+    (one copy of the weights, one HTTP connection pool)
+    """
+    def __init__(self, kind: str, key_fields: List[str]):
+        """
+        Attributes:
+            kind (str): the kind of models in the registry (e.g. llm, embedding), used by the metrics
+            key_fields (List[str]): the configuration fields identifying a model, the other fields are ignored
+        """
+        self._kind = kind
+        self._key_fields = key_fields
+        self._instances: Dict[tuple, Any] = {}
+        self._metrics: Dict[tuple, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        # One lock for each key, so loading a model does not block the loading of the others
+        self._key_locks: Dict[tuple, threading.Lock] = {}
+
+    def _key(self, config: Dict[str, Any]) -> tuple:
+        return tuple(str(config.get(field, "")) for field in self._key_fields)
+
+    def get_or_create(self, config: Dict[str, Any], factory: Callable[[], T]) -> T:
+        """
+        Parameters:
+            config (Dict[str, Any]): the model configuration
+            factory (Callable[[], T]): creates the model, called only the first time the configuration is seen
+
+        Returns:
+            T: the shared model instance
+        """
+        key = self._key(config)
+        with self._lock:
+            if key in self._instances:
+                self._metrics[key]["requests"] += 1
+                return self._instances[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Another thread may have created the model while waiting for the lock
+            with self._lock:
+                if key in self._instances:
+                    self._metrics[key]["requests"] += 1
+                    return self._instances[key]
+            start = time.perf_counter()
+            instance = factory()
+            load_time = time.perf_counter() - start
+            with self._lock:
+                self._instances[key] = instance
+                self._metrics[key] = {
+                    "kind": self._kind,
+                    **dict(zip(self._key_fields, key)),
+                    "load_time_s": load_time,
+                    "requests": 1
+                }
+            return instance
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """
+        Returns:
+            List[Dict[str, Any]]: for each model, its identifying fields, its load time and the number of times it was requested
+        """
+        with self._lock:
+            return [dict(metrics) for metrics in self._metrics.values()]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._instances.clear()
+            self._metrics.clear()
+            self._key_locks.clear()
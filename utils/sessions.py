@@ -0,0 +1,132 @@
+from utils.history import ChatHistory
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Union
+from uuid import uuid4
+import asyncio
+import time
+
+
+class Session:
+    """
+    A conversation between a user and the agent
+    """
+    def __init__(self, session_id: str, chat_history: ChatHistory):
+        """
+        Attributes:
+            session_id (str): the id of the session
+            chat_history (ChatHistory): the history of the conversation
+            busy (bool): True while a query of the session waits for a slot or is answered by the agent
+            last_used (float): the time of the last query of the session
+        """
+        self.session_id = session_id
+        self.chat_history = chat_history
+        self.busy = False
+        self.last_used = time.monotonic()
+
+
+class SessionStore:
+    """
+    Keeps the sessions in memory, the sessions unused for more than ttl_s seconds are dropped and
+    when there are more than max_sessions sessions, the least recently used ones are dropped
+    """
+    def __init__(self, history_factory: Callable[[], ChatHistory], max_sessions: int = 1000, ttl_s: float = 3600):
+        """
+        Attributes:
+            history_factory (Callable[[], ChatHistory]): creates the chat history of a new session
+            max_sessions (int): the maximum number of sessions kept in memory
+            ttl_s (float): the number of seconds after which an unused session is dropped
+        """
+        self._history_factory = history_factory
+        self._max_sessions = max_sessions
+        self._ttl_s = ttl_s
+        # session id -> session, from the least to the most recently used
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+
+    def _evict(self, keep: str) -> None:
+        now = time.monotonic()
+        for session_id, session in list(self._sessions.items()):
+            if not session.busy and now - session.last_used > self._ttl_s:
+                del self._sessions[session_id]
+        # The busy sessions are never dropped, their answer is added to their history,
+        # nor the session just requested (when all the others are busy)
+        idle = [session_id for session_id, session in self._sessions.items() if not session.busy and session_id != keep]
+        for session_id in idle[:max(0, len(self._sessions) - self._max_sessions)]:
+            del self._sessions[session_id]
+
+    def get(self, session_id: Union[str, None] = None) -> Session:
+        """
+        Parameters:
+            session_id (Union[str, None]): the id of the session, a new session is created if missing or unknown
+
+        Returns:
+            Session: the session
+        """
+        session_id = session_id or uuid4().hex
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = Session(session_id, self._history_factory())
+            self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        session.last_used = time.monotonic()
+        self._evict(session_id)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        """
+        Returns:
+            bool: True if the session existed
+        """
+        return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class RequestLimiter:
+    """
+    Limits the number of queries answered concurrently by the agent.
+    The queries over the limit wait in a queue (first come, first served), when the queue is full or a query
+    waits more than queue_timeout_s seconds, the query is rejected so that the clients can retry later
+    """
+    def __init__(self, max_concurrency: int = 8, max_queue: int = 32, queue_timeout_s: float = 30):
+        """
+        Attributes:
+            max_concurrency (int): the maximum number of queries answered concurrently
+            max_queue (int): the maximum number of queries waiting for a slot
+            queue_timeout_s (float): the maximum number of seconds a query waits for a slot
+        """
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._max_queue = max_queue
+        self._queue_timeout_s = queue_timeout_s
+        self._active = 0
+        self._waiting = 0
+
+    async def acquire(self) -> Union[Callable[[], None], None]:
+        """
+        Wait for a slot
+
+        Returns:
+            Union[Callable[[], None], None]: the function releasing the slot (it can be called more than once), None if the query is rejected
+        """
+        if self._semaphore.locked() and self._waiting >= self._max_queue:
+            return None
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self._queue_timeout_s)
+        except TimeoutError:
+            return None
+        finally:
+            self._waiting -= 1
+        self._active += 1
+
+        released = False
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self._active -= 1
+                self._semaphore.release()
+        return release
+
+    def stats(self) -> Dict[str, Any]:
+        return {"active": self._active, "queued": self._waiting}
@@ -1,6 +1,52 @@
-from typing import List, TypedDict, Annotated, Union
+from typing import List, Dict, TypedDict, Annotated, Union
 from langchain_core.messages import AnyMessage
 from langgraph.graph.message import add_messages
+import hashlib
+import re
+
+class Chunk(TypedDict):
+    """
+    A retrieved chunk, built from the artifact returned by the retriever tools
+
+    Attributes:
+        id (Union[str, None]): the id of the chunk inside the vector store (None when the chunk does not come from a vector store)
+        content (str): the chunk text
+        source (Union[str, None]): the file (or tool) the chunk comes from
+        page (Union[int, None]): the page of the source file containing the chunk
+        score (Union[float, None]): the distance returned by the vector store (lower is better)
+        fused_score (Union[float, None]): the score of the fan-out fusion (higher is better), None for the other tools
+        vector (Union[List[float], None]): the vector stored in the index, dropped once the chunks are reranked
+        rank (int): the position of the chunk in the results of its tool (0 -> best match of the tool)
+    """
+    id: Union[str, None]
+    content: str
+    source: Union[str, None]
+    page: Union[int, None]
+    score: Union[float, None]
+    fused_score: Union[float, None]
+    vector: Union[List[float], None]
+    rank: int
+
+def content_hash(text: str) -> str:
+    """
+    Parameters:
+        text (str): a text (e.g. the content of a chunk)
+
+    Returns:
+        str: a hash of the text, ignoring the case, the punctuation and the whitespaces
+    """
+    normalized = " ".join(re.findall(r"\w+", text.lower()))
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+def chunk_key(chunk: Chunk) -> str:
+    """
+    Parameters:
+        chunk (Chunk): a retrieved chunk
+
+    Returns:
+        str: the id of the chunk inside its vector store, or the hash of its content (e.g. web search, MCP tools)
+    """
+    return f"id:{chunk['id']}" if chunk["id"] is not None else f"hash:{content_hash(chunk['content'])}"
 
 class AgentState(TypedDict):
     """
@@ -10,19 +56,25 @@ class AgentState(TypedDict):
         messages (Annotated[List[AnyMessage], add_messages]): list of messages generated by nodes
         question (str): the current question used for the retrieval phase
         context (str): the context obtained from the retrieved chunks
-        chunks (Union[List[str], None]): a list containing the retrieved chunks
+        chunks (Union[List[Chunk], None]): a list containing the retrieved chunks
         original_question (str): the user's query integrated with the chat history context
-        reranking_score (Union[List[float], None]): a list with the same len of chunks, each position represent the reranking score for the respective chunk
+        reranking_score (Union[List[float], None]): a list with the same len of chunks, each position represent the reranking score for the respective chunk (kept until the chunks are added to the context)
         history (str): the current chat history, used to generate a contextualized user's query
+        context_hashes (List[str]): the hashes of the chunks already in the context, used to drop the duplicates
+        context_tokens_saved (int): the (estimated) tokens of the chunks not added to the context (duplicates or over the token budget)
+        score_memo (Dict[str, float]): the reranking score of the chunks already reranked for the question (see Reranking), so that they are not scored again
 
     """
     messages: Annotated[List[AnyMessage], add_messages]
     question: str
     context: str
-    chunks: Union[List[str], None]
+    chunks: Union[List[Chunk], None]
     original_question: str
     reranking_score: Union[List[float], None]
     history: str
+    context_hashes: List[str]
+    context_tokens_saved: int
+    score_memo: Dict[str, float]
 
     @classmethod
     def create(cls, messages=[], question="", history=""):
@@ -44,5 +96,8 @@ class AgentState(TypedDict):
             chunks=None,
             original_question=question,
             reranking_score=None,
-            history=history
+            history=history,
+            context_hashes=[],
+            context_tokens_saved=0,
+            score_memo={}
         )
\ No newline at end of file
@@ -0,0 +1,74 @@
+from functools import lru_cache
+from typing import Union
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+# Without a tokenizer (or when it can not be loaded, e.g. tiktoken downloads its encodings on the first use)
+# the budgets are enforced with an estimate: about 4 characters per token for english text
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def _encoding(tokenizer: str):
+    """
+    Parameters:
+        tokenizer (str): the name of a tiktoken encoding (e.g. cl100k_base, o200k_base)
+
+    Returns:
+        the tiktoken encoding, None if it can not be loaded
+    """
+    try:
+        # Imported here, the estimate does not need it
+        import tiktoken
+        return tiktoken.get_encoding(tokenizer)
+    except Exception as e:
+        logger.warning("tokenizer %s not available (%s: %s), the tokens are estimated from the characters", tokenizer, type(e).__name__, e)
+        return None
+
+
+def count_tokens(text: str, tokenizer: Union[str, None] = None) -> int:
+    """
+    Parameters:
+        text (str): a text
+        tokenizer (Union[str, None]): the tiktoken encoding used to count the tokens (None -> estimate from the characters)
+
+    Returns:
+        int: the number of tokens of the text
+    """
+    encoding = _encoding(tokenizer) if tokenizer else None
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_tokens(text: str, max_tokens: int, keep_end: bool = False, tokenizer: Union[str, None] = None) -> str:
+    """
+    Parameters:
+        text (str): a text
+        max_tokens (int): the maximum number of tokens
+        keep_end (bool): keep the end of the text instead of its beginning
+        tokenizer (Union[str, None]): the tiktoken encoding used to count the tokens (None -> estimate from the characters)
+
+    Returns:
+        str: the text cut to the token budget, on a word boundary when possible
+    """
+    max_tokens = max(0, max_tokens)
+    encoding = _encoding(tokenizer) if tokenizer else None
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[len(tokens) - max_tokens:] if keep_end else tokens[:max_tokens]).strip()
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    if keep_end:
+        cut = text[len(text) - max_chars:]
+        # drop the partial first word
+        space = cut.find(" ")
+        return cut[space + 1:] if 0 <= space < len(cut) - 1 else cut
+    cut = text[:max_chars]
+    space = cut.rfind(" ")
+    return cut[:space] if space > 0 else cut